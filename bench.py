@@ -0,0 +1,183 @@
+import os, io, sys, json, time, random, shutil, builtins, platform, argparse, tempfile, subprocess, contextlib
+import books, members, lendings, open_loans, record_index, records, report, search_index, gendata
+from scan import iter_records
+
+# ============================================
+# Benchmark ของคำสั่งหลักทั้งหมด (ไม่ต้องพิมพ์ input เอง) บันทึกผลเป็น JSON
+# ============================================
+# ใช้: python bench.py --data DIR [--out bench.json] [--compare เก่า.json]
+#   หรือ python bench.py --books 100000 --members 10000 --lendings 1000000 (สร้างข้อมูลด้วย gendata ก่อน)
+# คัดลอกข้อมูลไปโฟลเดอร์ชั่วคราวก่อนเสมอ (ไฟล์ต้นฉบับไม่ถูกแก้)
+# คำสั่งที่ใช้ input() จะได้คำตอบจากรายการที่เตรียมไว้ ส่วนข้อความที่ print ถูกทิ้ง
+# ผลของแต่ละคำสั่ง: จำนวนรอบ, min/median/mean/p99 (ms), ops/sec และจำนวนรอบที่สำเร็จ (พิมพ์ ✅)
+# --compare แสดงเวลา median เทียบกับผลเดิม และทำเครื่องหมายคำสั่งที่ช้าลงเกิน REGRESSION_THRESHOLD
+DATA_FILES = (books.BOOKS_FILE, members.MEMBERS_FILE, lendings.LENDINGS_FILE)
+REGRESSION_THRESHOLD = 0.25  # คำสั่งที่ใช้เวลาต่ำกว่า 1 ms (มี fsync) แกว่งระหว่างรอบได้ราว 20%
+
+class _Output(io.TextIOBase):
+    """ทิ้งข้อความที่ print (view ของไฟล์ใหญ่พิมพ์หลายล้านบรรทัด) แต่จำว่ามี ✅ หรือไม่"""
+    success = False
+
+    def write(self, text):
+        if '✅' in text:
+            self.success = True
+        return len(text)
+
+@contextlib.contextmanager
+def scripted(answers):
+    """แทน input() ด้วยคำตอบจาก answers ทีละตัว และทิ้งข้อความที่ print"""
+    answers = iter(answers)
+    original = builtins.input
+    builtins.input = lambda prompt='': next(answers)
+    output = _Output()
+    try:
+        with contextlib.redirect_stdout(output):
+            yield output
+    finally:
+        builtins.input = original
+
+def _summary(times, successes):
+    times = sorted(times)
+    total = sum(times)
+    return {
+        'iterations': len(times),
+        'successes': successes,
+        'min_ms': times[0] * 1000,
+        'median_ms': times[len(times) // 2] * 1000,
+        'mean_ms': total / len(times) * 1000,
+        'p99_ms': times[min(len(times) - 1, int(len(times) * 0.99))] * 1000,
+        'ops_per_sec': len(times) / total if total else 0.0,
+    }
+
+def run(fn, answer_sets):
+    """เรียก fn หนึ่งครั้งต่อชุดคำตอบ จับเวลาแต่ละครั้ง"""
+    times, successes = [], 0
+    for answers in answer_sets:
+        with scripted(answers) as output:
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        successes += output.success
+    return _summary(times, successes)
+
+def _active(filename, record_format, check=None):
+    return [r[1] for r in iter_records(filename, record_format, (books.STATUS_ACTIVE,)) if not check or check(r)]
+
+def run_all(repeat=200, scan_repeat=3, seed=1):
+    """รันทุก benchmark ในโฟลเดอร์ปัจจุบัน คืน dict ชื่อ -> ผล"""
+    rng = random.Random(seed)
+    # โหลด/สร้างดัชนีทั้งหมดก่อนจับเวลา รอบแรกของแต่ละคำสั่งจะได้ไม่รวมเวลาสร้างดัชนี
+    record_index.load_index(books.BOOKS_FILE, records.record_size(books.BOOKS_FILE))
+    record_index.load_index(members.MEMBERS_FILE, records.record_size(members.MEMBERS_FILE))
+    record_index.load_index(lendings.LENDINGS_FILE, lendings.LENDING_RECORD_SIZE)
+    search_index.load_search_index()
+    book_ids = _active(books.BOOKS_FILE, records.row_format(books.BOOKS_FILE), lambda r: r[5] > 0)
+    loans = open_loans.load_open_loans()['by_member']
+    # สมาชิกที่ยังยืมได้ (ยืมค้างน้อยกว่ากำหนด) จะได้วัดการยืมที่สำเร็จจริง
+    member_ids = _active(members.MEMBERS_FILE, records.row_format(members.MEMBERS_FILE),
+                         lambda r: len(loans.get(r[1], ())) < lendings.MAX_LOANS_PER_MEMBER - 1)
+    if not book_ids or not member_ids:
+        raise SystemExit("❌ ต้องมีหนังสือที่ยังมีสต็อกและสมาชิกที่ยังยืมได้")
+    results = {}
+    results['add_book'] = run(books.add_book, [
+        ('9780000000000', f'หนังสือทดสอบ benchmark {i}', 'ผู้ทดสอบ', '3') for i in range(repeat)])
+    results['update_book'] = run(books.update_book, [
+        (str(rng.choice(book_ids)), '', '', '', str(rng.randint(1, 10))) for _ in range(repeat)])
+    borrowers = [rng.choice(member_ids) for _ in range(repeat)]
+    first_lending = lendings.get_last_id(lendings.LENDINGS_FILE, lendings.LENDING_RECORD_SIZE) + 1
+    results['borrow_book'] = run(lendings.borrow_book, [
+        (str(rng.choice(book_ids)), str(member_id)) for member_id in borrowers])
+    last_lending = lendings.get_last_id(lendings.LENDINGS_FILE, lendings.LENDING_RECORD_SIZE)
+    results['return_book'] = run(lendings.return_book, [
+        (str(lending_id),) for lending_id in range(first_lending, last_lending + 1)] or [('0',)])
+    # view_*: ไม่กรอง เรียงตาม ID แล้วหยุดหลังหน้าแรก (สิ่งที่ผู้ใช้เห็นก่อนกด Enter)
+    results['view_all_books'] = run(books.view_all_books, [('', '', 'q')] * scan_repeat)
+    results['view_all_members'] = run(members.view_all_members, [('', '', 'q')] * scan_repeat)
+    results['view_lendings'] = run(lendings.view_lendings, [('', '', 'q')] * scan_repeat)
+    for engine in ('python', 'numpy', 'incremental', 'parallel'):
+        try:
+            results[f'generate_report[{engine}]'] = run(lambda: report.generate_report(engine), [()] * scan_repeat)
+        except ImportError:  # engine numpy ต้องติดตั้ง numpy
+            pass
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old, new):
+    """พิมพ์ median เทียบกับผลเดิม คืนจำนวนคำสั่งที่ช้าลงเกิน REGRESSION_THRESHOLD"""
+    regressions = 0
+    print(f"\nเทียบกับ {old.get('commit')} ({old.get('timestamp')}):")
+    for name, result in new['results'].items():
+        before = old['results'].get(name)
+        if not before:
+            continue
+        change = result['median_ms'] / before['median_ms'] - 1 if before['median_ms'] else 0.0
+        mark = '❌' if change > REGRESSION_THRESHOLD else '✅'
+        regressions += change > REGRESSION_THRESHOLD
+        print(f"{mark} {name:<30}{before['median_ms']:>10.3f} -> {result['median_ms']:>10.3f} ms ({change:+.1%})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark คำสั่งหลักของ PyLibMan แล้วบันทึกผลเป็น JSON")
+    parser.add_argument('--data', help="โฟลเดอร์ข้อมูลต้นฉบับ (ค่าเริ่มต้น: สร้างใหม่ด้วย gendata)")
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--members', type=int, default=10000)
+    parser.add_argument('--lendings', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=200, help="จำนวนรอบของคำสั่งที่ทำทีละ record")
+    parser.add_argument('--scan-repeat', type=int, default=3, help="จำนวนรอบของคำสั่งที่อ่านทั้งไฟล์")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default='bench.json')
+    parser.add_argument('--compare', help="ไฟล์ผลเดิม (JSON) ที่จะเทียบ")
+    parser.add_argument('--keep', action='store_true', help="ไม่ลบโฟลเดอร์ชั่วคราวหลังจบ")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out)
+    old = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            old = json.load(f)
+
+    work = tempfile.mkdtemp(prefix='pylibman-bench-')
+    if args.data:
+        for filename in DATA_FILES:
+            source = os.path.join(args.data, filename)
+            if os.path.exists(source):
+                shutil.copyfile(source, os.path.join(work, filename))
+    else:
+        gendata.generate(work, args.books, args.members, args.lendings, seed=args.seed)
+    cwd = os.getcwd()
+    os.chdir(work)
+    try:
+        dataset = {filename: os.path.getsize(filename) if os.path.exists(filename) else 0 for filename in DATA_FILES}
+        results = run_all(args.repeat, args.scan_repeat, args.seed)
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"ข้อมูลหลังทดสอบอยู่ที่ {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+    new = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'dataset_bytes': dataset,
+        'results': results,
+    }
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(new, f, ensure_ascii=False, indent=2)
+    print(f"{'คำสั่ง':<30}{'รอบ':>6}{'สำเร็จ':>8}{'median ms':>12}{'p99 ms':>12}{'ops/sec':>12}")
+    for name, r in results.items():
+        print(f"{name:<30}{r['iterations']:>6}{r['successes']:>8}{r['median_ms']:>12.3f}{r['p99_ms']:>12.3f}{r['ops_per_sec']:>12,.1f}")
+    print(f"✅ บันทึกผลที่ {out}")
+    if old is not None and compare(old, new):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,111 +1,158 @@
-import struct, os
-
-BOOKS_FILE = 'books.dat'
-BOOK_FORMAT = '< c i 16s 128s 64s h'
-# < = little-endian (วิธีเรียงไบต์แบบมาตรฐานของ Intel/AMD)
-# c = char (1 byte) สำหรับเก็บสถานะ A หรือ D
-# i = integer (4 bytes) สำหรับเก็บ ID
-# 16s = string (16 bytes) สำหรับเก็บ ISBN
-# 128s = string (128 bytes) สำหรับเก็บชื่อหนังสือ
-# 64s = string (64 bytes) สำหรับเก็บชื่อผู้แต่ง
-# h = short integer (2 bytes) สำหรับเก็บจำนวนเล่ม
-BOOK_RECORD_SIZE = struct.calcsize(BOOK_FORMAT)
-
-STATUS_ACTIVE = b'A'
-STATUS_DELETED = b'D'
-
-# ส่วนที่ 2: ฟังก์ชันช่วย (Helper Functions)
-def pack_string(s, length): return s.encode('utf-8')[:length].ljust(length, b'\x00')
-def unpack_string(b): return b.strip(b'\x00').decode('utf-8')
-
-def get_last_id(filename, record_size):
-    if not os.path.exists(filename) or os.path.getsize(filename) == 0: return 0
-    with open(filename, 'rb') as f:
-        f.seek(-record_size, os.SEEK_END)
-        record = f.read(record_size)
-        return struct.unpack('<i', record[1:5])[0]
-
-
-def add_book():
-    last_id = get_last_id(BOOKS_FILE, BOOK_RECORD_SIZE)
-    book_id = last_id + 1
-    # --- ขั้นตอนที่ 1: สร้าง ID ใหม่ ---
-    print(f"\n--- เพิ่มหนังสือ (ID: {book_id}) ---")
-    # --- ขั้นตอนที่ 2: รับข้อมูลจากผู้ใช้ ---
-    isbn = input("รหัสหนังสือ: ")
-    title = input("ชื่อหนังสือ: ")
-    author = input("ผู้แต่ง: ")
-    quantity = int(input("จำนวนเล่ม: "))
-    # --- ขั้นตอนที่ 3: Pack ข้อมูลเป็นไบนารี ---
-    record = struct.pack(BOOK_FORMAT, STATUS_ACTIVE, book_id,
-                         pack_string(isbn,16), pack_string(title,128),
-                         pack_string(author,64), quantity)
-    with open(BOOKS_FILE,'ab') as f: f.write(record)
-    print(f"✅ เพิ่มหนังสือ '{title}' เรียบร้อยแล้ว")
-
-def view_all_books():
-    if not os.path.exists(BOOKS_FILE):
-        print("ยังไม่มีข้อมูลหนังสือ"); return
-    print("\n--- 📚 รายการหนังสือ ---")
-    with open(BOOKS_FILE,'rb') as f:
-        while True:
-            record = f.read(BOOK_RECORD_SIZE)
-            if not record: break
-            status, book_id, isbn, title, author, qty = struct.unpack(BOOK_FORMAT, record)
-            if status == STATUS_ACTIVE:
-                print(f"ID:{book_id}, Title:{unpack_string(title)}, Author:{unpack_string(author)}, Qty:{qty}")
-
-def update_book():
-    book_id = int(input("ID หนังสือที่ต้องการแก้ไข: "))
-    with open(BOOKS_FILE,'r+b') as f:
-        while True:
-            pos = f.tell()
-            record = f.read(BOOK_RECORD_SIZE)
-            if not record: break
-            r_status,r_id,old_isbn,old_title,old_author,old_qty = struct.unpack(BOOK_FORMAT,record)
-            if r_status==STATUS_ACTIVE and r_id==book_id:
-                print("แก้ไข (เว้นว่าง = ไม่เปลี่ยน)")
-                isbn = input(f"รหัสหนังสือ ({unpack_string(old_isbn)}): ") or unpack_string(old_isbn)
-                title = input(f"ชื่อ ({unpack_string(old_title)}): ") or unpack_string(old_title)
-                author= input(f"ผู้แต่ง ({unpack_string(old_author)}): ") or unpack_string(old_author)
-                qty_s= input(f"จำนวน ({old_qty}): ")
-                qty = int(qty_s) if qty_s else old_qty
-                new_record = struct.pack(BOOK_FORMAT, STATUS_ACTIVE, book_id,
-                                         pack_string(isbn,16), pack_string(title,128),
-                                         pack_string(author,64), qty)
-                f.seek(pos); f.write(new_record)
-                print("✅ อัปเดตแล้ว"); return
-    print("ไม่พบหนังสือ")
-
-def delete_book():
-    book_id = int(input("ID หนังสือที่ต้องการลบ: "))
-    with open(BOOKS_FILE,'r+b') as f:
-        while True:
-            pos = f.tell() # บันทึกตำแหน่ง
-            record = f.read(BOOK_RECORD_SIZE)
-            if not record: break
-            # Unpack ข้อมูลทั้งหมด (เพราะต้องเขียนกลับไปทั้งหมด)
-            r_status,r_id,isbn,title,author,qty = struct.unpack(BOOK_FORMAT,record)
-            if r_status==STATUS_ACTIVE and r_id==book_id:
-                confirm=input(f"ลบ '{unpack_string(title)}'? (y/n): ")
-                if confirm.lower()=='y':
-                    deleted_record = struct.pack(BOOK_FORMAT, STATUS_DELETED,r_id,isbn,title,author,qty)
-                    f.seek(pos); f.write(deleted_record)
-                    print("✅ ลบแล้ว"); return
-                else: return
-    print("ไม่พบหนังสือ")
-
-def books_menu():
-    while True:
-        print("\n--- 📖 เมนูหนังสือ ---")
-        print("1. เพิ่มหนังสือ")
-        print("2. แสดงทั้งหมด")
-        print("3. แก้ไข")
-        print("4. ลบ")
-        print("0. กลับ")
-        ch=input("เลือก: ")
-        if ch=='1': add_book()
-        elif ch=='2': view_all_books()
-        elif ch=='3': update_book()
-        elif ch=='4': delete_book()
-        elif ch=='0': break
+import struct, os
+from functools import partial
+import locks, metrics, record_index, records, search_index, wal
+from records import get_last_id
+
+BOOKS_FILE = 'books.dat'
+BOOK_FORMAT = '< c i 16s 128s 64s h'
+# < = little-endian (วิธีเรียงไบต์แบบมาตรฐานของ Intel/AMD)
+# c = char (1 byte) สำหรับเก็บสถานะ A หรือ D
+# i = integer (4 bytes) สำหรับเก็บ ID
+# 16s = string (16 bytes) สำหรับเก็บ ISBN
+# 128s = string (128 bytes) สำหรับเก็บชื่อหนังสือ
+# 64s = string (64 bytes) สำหรับเก็บชื่อผู้แต่ง
+# h = short integer (2 bytes) สำหรับเก็บจำนวนเล่ม
+# ข้างบนคือรูปแบบ 1 ไฟล์ที่แปลงเป็นรูปแบบ 2 (migrate.py) เก็บ string เป็น ref ไปยัง heap และผู้แต่งเป็นรหัส dictionary
+# ขนาด record จริงของไฟล์ปัจจุบันจึงต้องใช้ records.record_size(BOOKS_FILE)
+# (รูปแบบ 2 ต้องสั่งแปลงเอง: ไฟล์เล็กลงแต่การอ่านทั้งตารางพร้อม decode ชื่อหนังสือช้ากว่ารูปแบบ 1 เล็กน้อย)
+BOOK_RECORD_SIZE = struct.calcsize(BOOK_FORMAT)
+AUTHOR_FIELD = 4
+
+STATUS_ACTIVE = b'A'
+STATUS_DELETED = b'D'
+
+# ส่วนที่ 2: ฟังก์ชันช่วย pack_string / unpack_string / get_last_id อยู่ใน records.py (ใช้ร่วมกันทุกไฟล์)
+records.register(BOOKS_FILE, BOOK_FORMAT, dictionary=(AUTHOR_FIELD,))
+
+
+def create_book(isbn, title, author, quantity):
+    """เพิ่มหนังสือโดยไม่ต้องรับ input (ใช้ได้ทั้งเมนูและโหมดคำสั่ง) คืน book_id ใหม่"""
+    # --- สร้าง ID ใหม่ + ต่อท้ายไฟล์ภายใต้ commit lock (โปรแกรมอื่นจะไม่ได้ ID ซ้ำ) ---
+    with metrics.operation('add_book'), locks.commit_lock():
+        size = records.record_size(BOOKS_FILE)
+        book_id = get_last_id(BOOKS_FILE, size) + 1
+        # --- Pack ข้อมูลเป็นไบนารี (รูปแบบ 2: ข้อความถูกต่อท้าย heap เป็น op ในธุรกรรมเดียวกัน) ---
+        ops = []
+        record = records.encode(BOOKS_FILE, (STATUS_ACTIVE, book_id, isbn, title, author, quantity), ops)
+        pos = wal.file_size(BOOKS_FILE)
+        ops.append((BOOKS_FILE, pos, record))
+        wal.commit(ops,
+                   after=[partial(record_index.note_append, BOOKS_FILE, size, book_id, pos),
+                          partial(search_index.note_append, pos, record)])
+    return book_id
+
+def add_book():
+    # --- รับข้อมูลจากผู้ใช้ ---
+    print("\n--- เพิ่มหนังสือ ---")
+    isbn = input("รหัสหนังสือ: ")
+    title = input("ชื่อหนังสือ: ")
+    author = input("ผู้แต่ง: ")
+    quantity = int(input("จำนวนเล่ม: "))
+    book_id = create_book(isbn, title, author, quantity)
+    print(f"✅ เพิ่มหนังสือ '{title}' (ID: {book_id}) เรียบร้อยแล้ว")
+
+def print_book(book):
+    status, book_id, isbn, title, author, qty = book
+    print(f"ID:{book_id}, Title:{title}, Author:{author}, Qty:{qty}")
+
+def view_all_books(where=None, order_by=None, desc=False):
+    """
+    แสดงหนังสือทีละหน้าตามเงื่อนไขของ query.select (where None = ถามเงื่อนไขและการเรียงจากผู้ใช้)
+    ไม่ได้กรอง status = แสดงเฉพาะเล่มที่ยังไม่ถูกลบ
+    """
+    import query  # query.py import books.py เอง (import ที่ต้นไฟล์จะวนกัน)
+    if not os.path.exists(BOOKS_FILE):
+        print("ยังไม่มีข้อมูลหนังสือ"); return
+    if where is None:
+        try:
+            where, order_by, desc = query.ask('books')
+        except ValueError as e:
+            print(f"❌ {e}"); return
+    print("\n--- 📚 รายการหนังสือ ---")
+    query.page_through('books', print_book, query.visible('books', where), order_by, desc,
+                       operation='view_all_books')
+
+def update_book():
+    book_id = int(input("ID หนังสือที่ต้องการแก้ไข: "))
+    if not os.path.exists(BOOKS_FILE):
+        print("ไม่พบหนังสือ"); return
+    with metrics.operation('read_book'):
+        pos, book = records.read(BOOKS_FILE, book_id)
+    if not book or book[0] != STATUS_ACTIVE:
+        print("ไม่พบหนังสือ"); return
+    r_status,r_id,old_isbn,old_title,old_author,old_qty = book
+    print("แก้ไข (เว้นว่าง = ไม่เปลี่ยน)")
+    isbn = input(f"รหัสหนังสือ ({old_isbn}): ")
+    title = input(f"ชื่อ ({old_title}): ")
+    author= input(f"ผู้แต่ง ({old_author}): ")
+    qty_s= input(f"จำนวน ({old_qty}): ")
+    # ระหว่างรอผู้ใช้พิมพ์ โปรแกรมอื่นอาจยืม/คืน/แก้ไขเล่มนี้ไปแล้ว จึงล็อก record แล้วอ่านใหม่ก่อนเขียน
+    # commit lock ครอบตั้งแต่สร้าง record ใหม่ (ข้อความใหม่ของรูปแบบ 2 ต่อท้าย heap ตามขนาดไฟล์ตอนนั้น)
+    with metrics.operation('update_book'), locks.record_lock(BOOKS_FILE, book_id), locks.commit_lock():
+        pos, record, _ = records.read_raw(BOOKS_FILE, book_id)
+        if not record or record[:1] != STATUS_ACTIVE:
+            print("ไม่พบหนังสือ"); return
+        # เปลี่ยนเฉพาะฟิลด์ที่กรอก ฟิลด์อื่นคงเดิมทุก byte
+        changes = {i: value for i, value in ((2, isbn), (3, title), (4, author)) if value}
+        if qty_s:
+            changes[5] = int(qty_s)
+        ops = []
+        new_record = records.modify(BOOKS_FILE, record, changes, ops)
+        ops.append((BOOKS_FILE, pos, new_record))
+        wal.commit(ops, after=[partial(search_index.note_update, record, new_record)])
+    print("✅ อัปเดตแล้ว")
+
+def delete_book():
+    book_id = int(input("ID หนังสือที่ต้องการลบ: "))
+    if not os.path.exists(BOOKS_FILE):
+        print("ไม่พบหนังสือ"); return
+    # ดัชนีบอกตำแหน่ง record ทันที (seek + read ครั้งเดียว)
+    with metrics.operation('read_book'):
+        pos, book = records.read(BOOKS_FILE, book_id)
+    if not book or book[0] != STATUS_ACTIVE:
+        print("ไม่พบหนังสือ"); return
+    confirm=input(f"ลบ '{book[3]}'? (y/n): ")
+    if confirm.lower()!='y': return
+    with metrics.operation('delete_book'), locks.record_lock(BOOKS_FILE, book_id):
+        pos, record, _ = records.read_raw(BOOKS_FILE, book_id)
+        if not record or record[:1] != STATUS_ACTIVE:
+            print("ไม่พบหนังสือ"); return
+        # เขียนกลับทั้ง record โดยเปลี่ยนแค่สถานะ
+        deleted_record = records.modify(BOOKS_FILE, record, {0: STATUS_DELETED})
+        wal.commit([(BOOKS_FILE, pos, deleted_record)],
+                   after=[partial(search_index.note_update, record, deleted_record)])
+    print("✅ ลบแล้ว")
+
+def find_books(query):
+    """ลองหาเป็น ISBN ก่อน ถ้าไม่เจอค่อยค้นจากชื่อหนังสือและผู้แต่ง (คืน record ที่ decode แล้ว)"""
+    with metrics.operation('search_books'):
+        return search_index.find_by_isbn(query) or search_index.search(query)
+
+def print_found_books(query, results):
+    if not results:
+        print("ไม่พบหนังสือ"); return
+    print(f"\n--- 🔍 ผลการค้นหา '{query}' ---")
+    for status, book_id, isbn, title, author, qty in results:
+        print(f"ID:{book_id}, ISBN:{isbn}, Title:{title}, Author:{author}, Qty:{qty}")
+
+def search_books():
+    query = input("ค้นหา (ISBN / ชื่อหนังสือ / ผู้แต่ง): ").strip()
+    if not query: return
+    print_found_books(query, find_books(query))
+
+def books_menu():
+    while True:
+        print("\n--- 📖 เมนูหนังสือ ---")
+        print("1. เพิ่มหนังสือ")
+        print("2. แสดงทั้งหมด")
+        print("3. แก้ไข")
+        print("4. ลบ")
+        print("5. ค้นหา")
+        print("0. กลับ")
+        ch=input("เลือก: ")
+        if ch=='1': add_book()
+        elif ch=='2': view_all_books()
+        elif ch=='3': update_book()
+        elif ch=='4': delete_book()
+        elif ch=='5': search_books()
+        elif ch=='0': break
@@ -0,0 +1,217 @@
+import os, sys, csv, json, time, argparse
+from functools import partial
+import record_index, records, locks, segments, wal
+from records import get_last_id
+from books import BOOKS_FILE, STATUS_ACTIVE
+from members import MEMBERS_FILE
+
+# ============================================
+# นำเข้า/ส่งออกข้อมูลหนังสือและสมาชิกจำนวนมาก (CSV หรือ JSON Lines)
+# ============================================
+# นำเข้า: อ่านทีละแถวแบบ stream, ตรวจความยาวของแต่ละฟิลด์ตามที่ไฟล์ปัจจุบันเก็บได้ (นับเป็น byte UTF-8
+# ไม่ตัดทิ้งเหมือน pack_string: รูปแบบ 1 = ขนาดใน *_FORMAT, รูปแบบ 2 = strheap.MAX_STRING) และเขียนเป็นชุดใหญ่
+# ชุดละ BATCH_RECORDS record ต่อ 1 ธุรกรรม WAL (รูปแบบ 2: ข้อความของทั้งชุดต่อท้าย heap เป็น op เดียวในธุรกรรมเดียวกัน)
+# อ่าน ID ล่าสุดครั้งเดียวต่อชุด (ภายใต้ commit lock) แล้วนับต่อเอง แถวที่ไม่ผ่านจะถูกรายงานพร้อมเหตุผล
+# ส่งออก: อ่านผ่าน records.iter_decoded แล้วเขียนทีละแถว (ไม่โหลดทั้งไฟล์เข้าหน่วยความจำ)
+# ใช้: python bulk.py import|export books|members <ไฟล์> [--format csv|jsonl] [--rejects ไฟล์]
+#   exit code 1 ถ้ามีแถวที่ไม่ผ่านหรืออ่าน/เขียนไฟล์ไม่ได้
+
+BATCH_RECORDS = 10000
+SHORT_MAX = 32767  # ช่วงของ h (จำนวนเล่ม)
+
+# ชนิดข้อมูล -> (ไฟล์, [(คอลัมน์, True = string หรือ None = จำนวนเต็ม)]) คอลัมน์เรียงตามฟิลด์ที่ 2 เป็นต้นไปของ record
+TABLES = {
+    'books': (BOOKS_FILE, [('isbn', True), ('title', True), ('author', True), ('qty', None)]),
+    'members': (MEMBERS_FILE, [('name', True), ('phone', True)]),
+}
+
+def _limits(filename, columns):
+    """[(คอลัมน์, ความยาว byte สูงสุด หรือ None = จำนวนเต็ม)] ตามรูปแบบของไฟล์ปัจจุบัน"""
+    return [(name, None if kind is None else records.max_bytes(filename, i + 2))
+            for i, (name, kind) in enumerate(columns)]
+
+def detect_format(path):
+    """เลือกรูปแบบไฟล์จากนามสกุล (.csv หรือ .jsonl/.ndjson)"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    raise ValueError(f"ไม่รู้จักรูปแบบไฟล์ {path} (ใช้ .csv หรือ .jsonl)")
+
+def _read_rows(stream, fmt):
+    """คืน (เลขบรรทัด, dict) ทีละแถว หรือ (เลขบรรทัด, ข้อความผิดพลาด) ถ้าอ่านแถวนั้นไม่ได้"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, f"JSON ไม่ถูกต้อง: {e}"
+                continue
+            yield line_no, row if isinstance(row, dict) else "แต่ละบรรทัดต้องเป็น JSON object"
+
+def validate_row(row, columns):
+    """ตรวจแถวตามความกว้างฟิลด์ (columns จาก _limits) คืน (ค่าของแต่ละคอลัมน์, None) หรือ (None, เหตุผลที่ไม่ผ่าน)"""
+    values = []
+    for name, width in columns:
+        value = row.get(name)
+        if value is None or (isinstance(value, str) and not value.strip() and width is None):
+            return None, f"ไม่มีคอลัมน์ {name}"
+        if width is None:
+            # JSON ให้ float/bool มาได้ int() จะตัดเศษ (3.7 -> 3) หรือแปลง true เป็น 1 เงียบ ๆ
+            if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+                return None, f"{name} ต้องเป็นจำนวนเต็ม: {value!r}"
+            try:
+                number = int(value)
+            except (TypeError, ValueError):
+                return None, f"{name} ต้องเป็นจำนวนเต็ม: {value!r}"
+            if not 0 <= number <= SHORT_MAX:
+                return None, f"{name} ต้องอยู่ระหว่าง 0-{SHORT_MAX}: {number}"
+            values.append(number)
+        else:
+            value = str(value)
+            size = len(value.encode('utf-8'))
+            if size > width:
+                return None, f"{name} ยาว {size} bytes เกิน {width} bytes"
+            values.append(value)
+    return values, None
+
+def import_stream(table, stream, fmt, rejects=None):
+    """
+    นำเข้าข้อมูลจาก stream (ไฟล์ข้อความที่เปิดแล้ว) เข้าตาราง 'books' หรือ 'members'
+    rejects: list ที่จะเติม (เลขบรรทัด, เหตุผล, แถว) ของแถวที่ไม่ผ่าน
+    คืน dict สถิติ {'imported', 'rejected', 'seconds', 'rows_per_sec', 'first_id', 'last_id'}
+    """
+    filename, columns = TABLES[table]
+    columns = _limits(filename, columns)
+    rejects = rejects if rejects is not None else []
+    start = time.perf_counter()
+    rejected = 0
+    span = {}  # 'first', 'last', 'count': ID แรก, ID สุดท้าย และจำนวนที่นำเข้าแล้ว
+    batch = []
+
+    def write_batch():
+        # แจก ID และต่อท้ายไฟล์ภายใต้ commit lock เดียวกัน โปรแกรมอื่นที่เพิ่มข้อมูลพร้อมกันจะไม่ได้ ID ซ้ำ
+        with locks.commit_lock():
+            record_size = records.record_size(filename)
+            first = get_last_id(filename, record_size) + 1
+            batch_ids = list(range(first, first + len(batch)))
+            ops = []
+            data = b''.join(records.encode_many(filename, [(STATUS_ACTIVE, record_id, *values)
+                                                           for record_id, values in zip(batch_ids, batch)], ops))
+            pos = wal.file_size(filename)
+            ops.append((filename, pos, data))
+            wal.commit(ops, after=[partial(record_index.note_append_many, filename, record_size, batch_ids, pos)])
+        span.setdefault('first', batch_ids[0])
+        span['last'] = batch_ids[-1]
+        span['count'] = span.get('count', 0) + len(batch_ids)
+        batch.clear()
+
+    for line_no, row in _read_rows(stream, fmt):
+        values, error = (None, row) if isinstance(row, str) else validate_row(row, columns)
+        if error:
+            rejected += 1
+            rejects.append((line_no, error, row if isinstance(row, dict) else None))
+            continue
+        batch.append(values)
+        if len(batch) >= BATCH_RECORDS:
+            write_batch()
+    if batch:
+        write_batch()
+    seconds = time.perf_counter() - start
+    imported = span.get('count', 0)
+    return {
+        'imported': imported,
+        'rejected': rejected,
+        'seconds': seconds,
+        'rows_per_sec': (imported + rejected) / seconds if seconds else 0.0,
+        'first_id': span.get('first'),
+        'last_id': span.get('last'),
+    }
+
+def import_file(table, path, fmt=None, rejects_path=None):
+    """นำเข้าจากไฟล์ แสดงสรุปจำนวนแถวต่อวินาที และเขียนแถวที่ไม่ผ่านลง rejects_path (ถ้ากำหนด)"""
+    fmt = fmt or detect_format(path)
+    rejects = []
+    with open(path, 'r', encoding='utf-8-sig', newline='') as stream:
+        stats = import_stream(table, stream, fmt, rejects)
+    print(f"✅ นำเข้า {table} {stats['imported']:,} แถว "
+          f"({stats['rows_per_sec']:,.0f} แถว/วินาที, {stats['seconds']:.2f} วินาที)")
+    if stats['imported']:
+        print(f"   ID {stats['first_id']} - {stats['last_id']}")
+    if rejects:
+        print(f"❌ ไม่ผ่าน {len(rejects):,} แถว")
+        for line_no, error, _ in rejects[:20]:
+            print(f"   บรรทัด {line_no}: {error}")
+        if len(rejects) > 20:
+            print(f"   ... และอีก {len(rejects) - 20:,} แถว")
+        if rejects_path:
+            with open(rejects_path, 'w', encoding='utf-8') as f:
+                for line_no, error, row in rejects:
+                    f.write(json.dumps({'line': line_no, 'error': error, 'row': row}, ensure_ascii=False) + "\n")
+            print(f"   รายละเอียดอยู่ใน {rejects_path}")
+    return stats
+
+def iter_export_rows(table):
+    """คืน dict ของ record ที่ยังไม่ถูกลบทีละแถว (มี id นำหน้า)"""
+    filename, columns = TABLES[table]
+    for record in records.iter_decoded(filename, (STATUS_ACTIVE,)):
+        row = {'id': record[1]}
+        for (name, _), value in zip(columns, record[2:]):
+            row[name] = value
+        yield row
+
+def export_stream(table, stream, fmt):
+    """ส่งออกตารางลง stream แบบทีละแถว คืนจำนวนแถว"""
+    columns = ['id'] + [name for name, _ in TABLES[table][1]]
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=columns)
+        writer.writeheader()
+        for row in iter_export_rows(table):
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in iter_export_rows(table):
+            stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+def export_file(table, path, fmt=None):
+    fmt = fmt or detect_format(path)
+    start = time.perf_counter()
+    with open(path, 'w', encoding='utf-8', newline='') as stream:
+        count = export_stream(table, stream, fmt)
+    seconds = time.perf_counter() - start
+    rate = count / seconds if seconds else 0.0
+    print(f"✅ ส่งออก {table} {count:,} แถวไปที่ {path} ({rate:,.0f} แถว/วินาที)")
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="นำเข้า/ส่งออกหนังสือและสมาชิกจำนวนมาก")
+    parser.add_argument('action', choices=['import', 'export'])
+    parser.add_argument('table', choices=sorted(TABLES))
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="ค่าเริ่มต้นเลือกจากนามสกุลไฟล์")
+    parser.add_argument('--rejects', help="ไฟล์สำหรับเก็บแถวที่ไม่ผ่าน (JSON Lines)")
+    args = parser.parse_args(argv)
+    wal.recover()
+    segments.recover()  # archive ครั้งก่อนที่ตัด lendings.dat ไม่เสร็จ
+    try:
+        if args.action == 'import':
+            stats = import_file(args.table, args.path, args.format, args.rejects)
+            return 1 if stats['rejected'] else 0
+        export_file(args.table, args.path, args.format)
+    except (ValueError, OSError) as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
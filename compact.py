@@ -0,0 +1,139 @@
+import struct, os, sys, time, argparse
+import locks, record_index, records, segments, wal
+from scan import iter_records, iter_chunks
+from books import BOOKS_FILE, STATUS_ACTIVE, STATUS_DELETED
+from members import MEMBERS_FILE
+
+# ============================================
+# Compaction: เขียนไฟล์ .dat ใหม่โดยตัด record ที่ถูกลบ (tombstone, สถานะ 'D') ออก
+# ============================================
+# - ID ของ record ที่เหลือไม่เปลี่ยน lendings.dat ที่อ้างถึง book_id/member_id จึงยังถูกต้อง
+# - ID สูงสุดเดิมบันทึกลง .seq ก่อน เพื่อไม่ให้ get_last_id แจก ID ของ record ที่ถูกตัดออกซ้ำ
+# - ทำงานขณะระบบเปิดอยู่ได้: ล้าง WAL ก่อน (ธุรกรรมใน WAL อ้างถึง offset ของไฟล์เดิม)
+#   เขียนไฟล์ใหม่เป็นไฟล์ชั่วคราวแล้ว os.replace แบบ atomic ผู้อ่านที่เปิดไฟล์เดิมอยู่ยังอ่านต่อได้
+#   ระหว่างนั้นถือ compaction lock + commit lock (ดู locks.py) ดัชนีทุกตัวจะสร้างใหม่เองเพราะ inode เปลี่ยน
+# - ไฟล์รูปแบบ 2 (strheap.py) เก็บ header ไว้ตามเดิม ข้อความของ record ที่ตัดออกยังค้างอยู่ใน heap
+#   จนกว่าจะแปลงไฟล์ใหม่ด้วย migrate.py (heap มีแต่ต่อท้าย การย้ายข้อความจะทำให้ ref ของผู้อ่านอื่นผิด)
+# ใช้: python compact.py [--table books|members] [--dry-run]  (--dry-run แสดงจำนวน tombstone และพื้นที่ที่จะได้คืน
+# โดยไม่แก้ไฟล์) การตัด tombstone ย้อนกลับไม่ได้ ควรลอง --dry-run ก่อน
+
+COMPACT_TABLES = {'books': BOOKS_FILE, 'members': MEMBERS_FILE}
+COMPACT_FILES = list(COMPACT_TABLES.values())
+MAX_ATTEMPTS = 3
+
+def _file_state(filename):
+    st = os.stat(filename)
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+def _time_scan(filename):
+    """เวลาที่ใช้อ่านทั้งไฟล์เหมือน view_all_* (วินาที ไม่รวมการ decode string)"""
+    start = time.perf_counter()
+    for _ in iter_records(filename, records.row_format(filename), (STATUS_ACTIVE,)):
+        pass
+    return time.perf_counter() - start
+
+def count_tombstones(filename):
+    """(จำนวน record, จำนวน tombstone, ขนาด record) โดยไม่แก้ไฟล์ หรือ None ถ้าไม่มีไฟล์"""
+    if not os.path.exists(filename):
+        return None
+    with locks.scan_lock(filename):
+        record_size = records.record_size(filename)
+        total = deleted = 0
+        for _, chunk in iter_chunks(filename, record_size, records.data_start(filename)):
+            statuses = chunk[::record_size]  # byte แรกของทุก record = สถานะ
+            total += len(statuses)
+            deleted += statuses.count(STATUS_DELETED)
+    return total, deleted, record_size
+
+def compact_file(filename):
+    """
+    ตัด tombstone ออกจากไฟล์ แล้วคืนสถิติ
+    {'records_before', 'records_after', 'bytes_before', 'bytes_after', 'scan_before', 'scan_after'}
+    หรือ None ถ้าไม่มีไฟล์
+    """
+    if not os.path.exists(filename):
+        return None
+    scan_before = _time_scan(filename)
+    # ระหว่างย้ายตำแหน่ง record ต้องไม่มีโปรแกรมอื่นล็อก record/อ่านทั้งไฟล์นี้ และไม่มีการเขียนผ่าน WAL
+    with locks.compaction_lock(filename), locks.commit_lock():
+        # ธุรกรรมที่ค้างใน WAL อ้างถึง offset เดิม ต้องเขียนลงไฟล์ให้หมดก่อนย้ายตำแหน่ง record
+        wal.flush()
+        wal.checkpoint()
+        record_size = records.record_size(filename)  # รูปแบบของไฟล์ไม่เปลี่ยนระหว่างถือ compaction lock
+        for attempt in range(MAX_ATTEMPTS):
+            before = _file_state(filename)
+            with open(filename, 'rb') as f:
+                data = f.read()
+            data = data[:len(data) - len(data) % record_size]
+            kept = [data[pos:pos + record_size] for pos in range(0, len(data), record_size)
+                    if data[pos:pos + 1] != STATUS_DELETED]
+            if data:
+                last_id = struct.unpack_from('<i', data, len(data) - record_size + 1)[0]
+                if last_id > record_index.read_high_water(filename):
+                    record_index.save_high_water(filename, last_id)
+            tmp_path = filename + '.compact'
+            with open(tmp_path, 'wb') as f:
+                f.write(b''.join(kept))
+                f.flush()
+                os.fsync(f.fileno())
+            if _file_state(filename) != before:
+                os.remove(tmp_path)  # มีการเขียนระหว่างคัดลอก (ระบบที่ไม่มี fcntl) ลองใหม่
+                continue
+            os.replace(tmp_path, filename)
+            break
+        else:
+            raise RuntimeError(f"{filename} ถูกแก้ไขตลอดระหว่าง compaction ลองใหม่ภายหลัง")
+        record_index.rebuild_index(filename, record_size)
+    return {
+        'records_before': len(data) // record_size,
+        'records_after': len(kept),
+        'bytes_before': before[0],
+        'bytes_after': len(kept) * record_size,
+        'scan_before': scan_before,
+        'scan_after': _time_scan(filename),
+    }
+
+def print_dry_run(filenames=COMPACT_FILES):
+    """แสดงจำนวน tombstone และพื้นที่ที่ compaction จะได้คืน (ไม่แก้ไฟล์)"""
+    for filename in filenames:
+        counts = count_tombstones(filename)
+        if counts is None:
+            print(f"{filename}: ไม่มีไฟล์")
+            continue
+        total, deleted, record_size = counts
+        print(f"{filename}: tombstone {deleted:,} จาก {total:,} record, "
+              f"จะคืนพื้นที่ {deleted * record_size:,} bytes (ยังไม่แก้ไฟล์)")
+
+def compact_all(filenames=COMPACT_FILES):
+    """compaction ไฟล์ใน filenames (ค่าเริ่มต้น books.dat และ members.dat) แล้วแสดงพื้นที่และเวลาอ่านที่ประหยัดได้"""
+    for filename in filenames:
+        stats = compact_file(filename)
+        if stats is None:
+            print(f"{filename}: ไม่มีไฟล์")
+            continue
+        removed = stats['records_before'] - stats['records_after']
+        saved = stats['bytes_before'] - stats['bytes_after']
+        print(f"{filename}: ลบ tombstone {removed} record, "
+              f"ขนาด {stats['bytes_before']:,} -> {stats['bytes_after']:,} bytes (ประหยัด {saved:,} bytes), "
+              f"เวลาอ่านทั้งไฟล์ {stats['scan_before'] * 1000:.2f} -> {stats['scan_after'] * 1000:.2f} ms")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ตัด record ที่ถูกลบ (tombstone) ออกจาก books.dat/members.dat")
+    parser.add_argument('--table', choices=tuple(COMPACT_TABLES), help="ค่าเริ่มต้น: ทั้งสองตาราง")
+    parser.add_argument('--dry-run', action='store_true', help="แสดงจำนวน tombstone และพื้นที่ที่จะได้คืนเท่านั้น")
+    args = parser.parse_args(argv)
+    wal.recover()
+    segments.recover()  # archive ครั้งก่อนที่ตัด lendings.dat ไม่เสร็จ
+    filenames = [COMPACT_TABLES[args.table]] if args.table else COMPACT_FILES
+    if args.dry_run:
+        print_dry_run(filenames)
+        return 0
+    try:
+        compact_all(filenames)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
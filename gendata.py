@@ -0,0 +1,152 @@
+import os, sys, time, random, struct, argparse
+import record_index
+from records import pack_string
+from books import BOOKS_FILE, BOOK_FORMAT, STATUS_ACTIVE, STATUS_DELETED
+from members import MEMBERS_FILE, MEMBER_FORMAT
+from lendings import (LENDINGS_FILE, LENDING_FORMAT, LENDING_CHANGES_FILE, STATUS_BORROWED, STATUS_RETURNED,
+                      MAX_LOANS_PER_MEMBER)
+from locks import LOCK_FILE
+from open_loans import OPEN_LOANS_FILE
+from report_incremental import CHECKPOINT_FILE
+from search_index import SEARCH_SNAPSHOT_FILE, SEARCH_JOURNAL_FILE
+from segments import ARCHIVE_MANIFEST, is_archive_file
+from strheap import is_heap_file
+from wal import WAL_FILE
+
+# ============================================
+# สร้างข้อมูลทดสอบขนาดใหญ่ (books.dat / members.dat / lendings.dat) ตามรูปแบบ record จริง
+# ============================================
+# ใช้: python gendata.py DIR [--books 1000000] [--members 100000] [--lendings 10000000]
+# - ชื่อหนังสือ/ผู้แต่ง/สมาชิกเป็นภาษาไทยปนอังกฤษ ความยาวไม่เกินช่องของ record (ไม่ถูกตัดกลางตัวอักษร)
+# - หนังสือและสมาชิกถูกลบ (สถานะ D) ตามสัดส่วน --deleted
+# - การยืมเรียงตามเวลา ย้อนหลัง --days วัน ยืมได้เฉพาะหนังสือ/สมาชิกที่ยังไม่ถูกลบ
+#   รายการที่ยังไม่คืนมีสัดส่วนประมาณ --open และไม่มีสมาชิกคนใดยืมค้างเกิน MAX_LOANS_PER_MEMBER
+# ไฟล์ที่สร้างจากข้อมูลเดิม (ดัชนี, checkpoint, WAL, lendings.chg) และ segment ที่ archive ไว้ในโฟลเดอร์นั้นจะถูกลบทิ้ง
+# ข้อมูลที่สร้างเป็น record รูปแบบ 1 เสมอ (heap/dictionary ของรูปแบบ 2 เดิมถูกลบด้วย) แปลงต่อได้ด้วย migrate.py
+WRITE_CHUNK = 1 << 16  # จำนวน record ต่อการเขียน 1 ครั้ง
+OPEN_WINDOW_DAYS = 60
+
+THAI_WORDS = ['หนังสือ', 'คู่มือ', 'การเขียน', 'โปรแกรม', 'ภาษา', 'ไทย', 'ประวัติศาสตร์', 'วิทยาศาสตร์',
+              'นิยาย', 'ความรัก', 'ทะเล', 'ภูเขา', 'แมว', 'สุนัข', 'เศรษฐกิจ', 'การเมือง', 'อาหาร',
+              'สุขภาพ', 'ดนตรี', 'ศิลปะ', 'เด็ก', 'ธรรมะ', 'การ์ตูน', 'ท่องเที่ยว', 'คณิตศาสตร์']
+ENGLISH_WORDS = ['python', 'data', 'guide', 'learning', 'history', 'ocean', 'mountain', 'cats', 'dogs',
+                 'economics', 'music', 'art', 'intro', 'advanced', 'systems', 'design', 'network', 'cloud']
+FIRST_NAMES = ['สมชาย', 'สมหญิง', 'สมศักดิ์', 'วิไล', 'ประเสริฐ', 'กนกวรรณ', 'ณัฐพล', 'ศิริพร', 'John', 'Alice']
+LAST_NAMES = ['ใจดี', 'มีสุข', 'รักไทย', 'ทองดี', 'แสงทอง', 'วงศ์ใหญ่', 'Smith', 'Lee']
+
+def _text(words, width):
+    """รวมคำจนกว่าจะเต็มช่อง width bytes (ไม่ตัดกลางคำ)"""
+    out, size = [], 0
+    for word in words:
+        size += len(word.encode('utf-8')) + (1 if out else 0)
+        if size > width:
+            break
+        out.append(word)
+    return ' '.join(out)
+
+def _write_records(filename, rows):
+    """เขียน record (bytes) เป็นก้อน ๆ ละ WRITE_CHUNK record"""
+    count = 0
+    with open(filename, 'wb') as f:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= WRITE_CHUNK:
+                f.write(b''.join(chunk))
+                count += len(chunk)
+                chunk = []
+        f.write(b''.join(chunk))
+        count += len(chunk)
+    return count
+
+def gen_books(rng, count, deleted):
+    rec = struct.Struct(BOOK_FORMAT)
+    for book_id in range(1, count + 1):
+        title = _text(rng.sample(THAI_WORDS, 3) + rng.sample(ENGLISH_WORDS, 2) + [str(book_id)], 128)
+        author = _text([rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)], 64)
+        status = STATUS_DELETED if rng.random() < deleted else STATUS_ACTIVE
+        yield rec.pack(status, book_id, pack_string(f'978{book_id:010d}', 16), pack_string(title, 128),
+                       pack_string(author, 64), rng.randint(0, 10))
+
+def gen_members(rng, count, deleted):
+    rec = struct.Struct(MEMBER_FORMAT)
+    for member_id in range(1, count + 1):
+        name = _text([rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), str(member_id)], 64)
+        phone = f'0{rng.choice("689")}{rng.randrange(10 ** 8):08d}'
+        status = STATUS_DELETED if rng.random() < deleted else STATUS_ACTIVE
+        yield rec.pack(status, member_id, pack_string(name, 64), pack_string(phone, 16))
+
+def gen_lendings(rng, count, book_ids, member_ids, open_share, days):
+    rec = struct.Struct(LENDING_FORMAT)
+    now = time.time()
+    start = now - days * 86400
+    step = (now - start) / max(count, 1)
+    # รายการที่ยังไม่คืนเป็นการยืมช่วง OPEN_WINDOW_DAYS วันสุดท้าย (ก่อนนั้นถือว่าคืนแล้วทั้งหมด)
+    recent = min(1.0, OPEN_WINDOW_DAYS / days) if days else 1.0
+    p_open = min(1.0, open_share / recent)
+    open_loans = {}  # member_id -> จำนวนที่ยืมค้าง
+    for lending_id in range(1, count + 1):
+        book_id = book_ids[int(rng.random() * len(book_ids))]
+        member_id = member_ids[int(rng.random() * len(member_ids))]
+        borrow_date = start + (lending_id - 1) * step + rng.random() * step
+        if (now - borrow_date < OPEN_WINDOW_DAYS * 86400 and rng.random() < p_open
+                and open_loans.get(member_id, 0) < MAX_LOANS_PER_MEMBER):
+            open_loans[member_id] = open_loans.get(member_id, 0) + 1
+            yield rec.pack(STATUS_BORROWED, lending_id, book_id, member_id, borrow_date, 0.0)
+        else:
+            return_date = min(now, borrow_date + rng.uniform(1, 21) * 86400)
+            yield rec.pack(STATUS_RETURNED, lending_id, book_id, member_id, borrow_date, return_date)
+
+def _active_ids(filename, record_format):
+    size = struct.calcsize(record_format)
+    with open(filename, 'rb') as f:
+        data = f.read()
+    return [struct.unpack_from('<i', data, pos + 1)[0] for pos in range(0, len(data), size)
+            if data[pos:pos + 1] == STATUS_ACTIVE]
+
+def generate(directory, books=1000000, members=100000, lendings=10000000, deleted=0.05, open_share=0.02,
+             days=3650, seed=1):
+    """สร้างไฟล์ข้อมูลทั้งสามไฟล์ใน directory คืน dict จำนวน record ที่เขียน"""
+    os.makedirs(directory, exist_ok=True)
+    derived = [LENDING_CHANGES_FILE, WAL_FILE, LOCK_FILE, OPEN_LOANS_FILE, CHECKPOINT_FILE,
+               SEARCH_SNAPSHOT_FILE, SEARCH_JOURNAL_FILE]
+    for filename in (BOOKS_FILE, MEMBERS_FILE, LENDINGS_FILE):
+        derived += [record_index.index_path(filename), record_index.seq_path(filename)]
+    derived += [ARCHIVE_MANIFEST] + [name for name in os.listdir(directory) if is_archive_file(name) or is_heap_file(name)]
+    for filename in derived:
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            os.remove(path)
+    rng = random.Random(seed)
+    counts = {}
+    for filename, rows in ((BOOKS_FILE, gen_books(rng, books, deleted)),
+                           (MEMBERS_FILE, gen_members(rng, members, deleted))):
+        start = time.perf_counter()
+        counts[filename] = _write_records(os.path.join(directory, filename), rows)
+        print(f"✅ {filename}: {counts[filename]:,} record ({time.perf_counter() - start:.1f} วินาที)")
+    book_ids = _active_ids(os.path.join(directory, BOOKS_FILE), BOOK_FORMAT)
+    member_ids = _active_ids(os.path.join(directory, MEMBERS_FILE), MEMBER_FORMAT)
+    if lendings and (not book_ids or not member_ids):
+        raise SystemExit("❌ ต้องมีหนังสือและสมาชิกที่ยังไม่ถูกลบอย่างน้อยอย่างละ 1 รายการจึงจะสร้างการยืมได้")
+    start = time.perf_counter()
+    counts[LENDINGS_FILE] = _write_records(os.path.join(directory, LENDINGS_FILE),
+                                           gen_lendings(rng, lendings, book_ids, member_ids, open_share, days))
+    print(f"✅ {LENDINGS_FILE}: {counts[LENDINGS_FILE]:,} record ({time.perf_counter() - start:.1f} วินาที)")
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="สร้างข้อมูลทดสอบ books.dat / members.dat / lendings.dat")
+    parser.add_argument('dir', help="โฟลเดอร์ที่จะเขียนไฟล์ (ไฟล์ข้อมูลเดิมจะถูกเขียนทับ)")
+    parser.add_argument('--books', type=int, default=1000000)
+    parser.add_argument('--members', type=int, default=100000)
+    parser.add_argument('--lendings', type=int, default=10000000)
+    parser.add_argument('--deleted', type=float, default=0.05, help="สัดส่วนหนังสือ/สมาชิกที่ถูกลบ")
+    parser.add_argument('--open', type=float, default=0.02, dest='open_share', help="สัดส่วนการยืมที่ยังไม่คืน (โดยประมาณ)")
+    parser.add_argument('--days', type=int, default=3650, help="ช่วงเวลาย้อนหลังของประวัติการยืม (วัน)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    generate(args.dir, args.books, args.members, args.lendings, args.deleted, args.open_share, args.days, args.seed)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
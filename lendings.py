@@ -1,187 +1,254 @@
-import struct, os, time, datetime
-from books import BOOKS_FILE, BOOK_FORMAT, BOOK_RECORD_SIZE, STATUS_ACTIVE, unpack_string, pack_string
-from members import MEMBERS_FILE, MEMBER_FORMAT, MEMBER_RECORD_SIZE
-
-# ============================================
-# กำหนดค่าคอนฟิกสำหรับไฟล์การยืม-คืน
-# ============================================
-LENDINGS_FILE = 'lendings.dat'  # ชื่อไฟล์ binary สำหรับเก็บข้อมูลการยืม-คืน
-LENDING_FORMAT = '< c i i i d d'  # โครงสร้างข้อมูล: สถานะ(1 byte), lending_id(4), book_id(4), member_id(4), วันยืม(8), วันคืน(8)
-LENDING_RECORD_SIZE = struct.calcsize(LENDING_FORMAT)  # คำนวณขนาดของแต่ละ record (29 bytes)
-STATUS_BORROWED = b'A'  # สถานะ 'A' = Active (กำลังยืมอยู่)
-STATUS_RETURNED = b'R'  # สถานะ 'R' = Returned (คืนแล้ว)
-
-# ============================================
-# ฟังก์ชันช่วยเหลือ: หา ID ล่าสุดในไฟล์
-# ============================================
-def get_last_id(filename, record_size):
-    """
-    อ่าน record สุดท้ายในไฟล์เพื่อดึง ID ล่าสุด
-    ใช้สำหรับสร้าง ID ใหม่ (ID_ล่าสุด + 1)
-    """
-    # ตรวจสอบว่าไฟล์มีอยู่และไม่ว่างเปล่า
-    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
-        return 0  # ถ้าไม่มีไฟล์หรือว่างเปล่า ส่งค่า 0
-    
-    with open(filename, 'rb') as f:
-        f.seek(-record_size, os.SEEK_END)  # ไปที่ record สุดท้าย (นับจากท้ายไฟล์)
-        record = f.read(record_size)  # อ่าน record สุดท้าย
-        return struct.unpack('<i', record[1:5])[0]  # ดึงค่า ID จากตำแหน่ง byte 1-5
-
-# ============================================
-# ฟังก์ชันหลัก: ยืมหนังสือ
-# ============================================
-def borrow_book():
-    book_id = int(input("Book ID ที่จะยืม: "))
-    member_id = int(input("Member ID: "))
-    book_found = False
-    with open(BOOKS_FILE, 'rb') as bf:
-        while True:
-            r = bf.read(BOOK_RECORD_SIZE)  # อ่านทีละ record
-            if not r:  # ถ้าอ่านจนหมดไฟล์แล้ว
-                break
-            status, bid, _, title, _, qty = struct.unpack(BOOK_FORMAT, r)
-            if status == STATUS_ACTIVE and bid == book_id:
-                book_found = True
-                book_title = unpack_string(title)  # แปลง bytes เป็น string
-                book_qty = qty  # เก็บจำนวนคงเหลือ
-                break
-    if not book_found:
-        print("❌ ไม่พบหนังสือ")
-        return  # ออกจากฟังก์ชันทันที
-    member_found = False
-    with open(MEMBERS_FILE, 'rb') as mf:
-        while True:
-            r = mf.read(MEMBER_RECORD_SIZE)  # อ่านทีละ record
-            if not r:
-                break
-            status, mid, name, _ = struct.unpack(MEMBER_FORMAT, r)
-            if status == STATUS_ACTIVE and mid == member_id:
-                member_found = True
-                member_name = unpack_string(name)  # แปลง bytes เป็น string
-                break
-    if not member_found:
-        print("❌ ไม่พบสมาชิก")
-        return
-    if book_qty <= 0:
-        print("❌ หนังสือหมดสต็อก")
-        return
-    lending_id = get_last_id(LENDINGS_FILE, LENDING_RECORD_SIZE) + 1  # สร้าง ID ใหม่
-    borrow_date = time.time()  # เก็บเวลาปัจจุบันเป็น timestamp
-    return_date = 0.0  # ยังไม่ได้คืน ใส่ 0
-    record = struct.pack(LENDING_FORMAT, STATUS_BORROWED, lending_id, book_id, member_id, borrow_date, return_date)
-    with open(LENDINGS_FILE, 'ab') as f:
-        f.write(record)
-    with open(BOOKS_FILE, 'r+b') as bf:  # เปิดแบบ read+write
-        while True:
-            pos = bf.tell()  # จำตำแหน่งปัจจุบัน
-            r = bf.read(BOOK_RECORD_SIZE)
-            if not r:
-                break
-            status, bid, isbn, title, author, qty = struct.unpack(BOOK_FORMAT, r)
-            if status == STATUS_ACTIVE and bid == book_id:
-                qty -= 1  # ลดจำนวน 1
-                new_record = struct.pack(BOOK_FORMAT, status, bid, isbn, title, author, qty)
-                bf.seek(pos)  # กลับไปที่ตำแหน่งเดิม
-                bf.write(new_record)  # เขียนทับ
-                break
-    print(f"✅ ยืมหนังสือ '{book_title}' สำเร็จโดย {member_name}")
-
-# ============================================
-# ฟังก์ชันหลัก: คืนหนังสือ
-# ============================================
-def return_book():
-    """
-    ฟังก์ชันสำหรับการคืนหนังสือ
-    ขั้นตอน: ค้นหา Lending ID -> คำนวณค่าปรับ -> อัปเดตสถานะ -> เพิ่มสต็อกหนังสือ
-    """
-    lending_id = int(input("Lending ID คืน: "))
-    found = False
-    with open(LENDINGS_FILE, 'r+b') as f:
-        while True:
-            pos = f.tell()  # จำตำแหน่งปัจจุบัน
-            r = f.read(LENDING_RECORD_SIZE)
-            if not r:
-                break
-            status, lid, bid, mid, borrow_date, return_date = struct.unpack(LENDING_FORMAT, r)
-            if status == STATUS_BORROWED and lid == lending_id:
-                found = True
-                return_time = time.time()  # เวลาคืนปัจจุบัน
-                days = (return_time - borrow_date) / 86400  # แปลง seconds เป็นวัน (86400 = จำนวน seconds ใน 1 วัน)
-                fine = max(0, int(days - 7) * 5)  # คำนวณค่าปรับ (ถ้าเกิน 7 วัน)
-                new_record = struct.pack(LENDING_FORMAT, STATUS_RETURNED, lid, bid, mid, borrow_date, return_time)
-                f.seek(pos)  # กลับไปที่ตำแหน่งเดิม
-                f.write(new_record)  # เขียนทับ
-                with open(BOOKS_FILE, 'r+b') as bf:
-                    while True:
-                        pos2 = bf.tell()
-                        r2 = bf.read(BOOK_RECORD_SIZE)
-                        if not r2:
-                            break
-                        status_b, bid_b, isbn, title, author, qty = struct.unpack(BOOK_FORMAT, r2)
-                        if status_b == STATUS_ACTIVE and bid_b == bid:
-                            qty += 1  # เพิ่มจำนวน 1
-                            new_record_b = struct.pack(BOOK_FORMAT, status_b, bid_b, isbn, title, author, qty)
-                            bf.seek(pos2)  # กลับไปตำแหน่งเดิม
-                            bf.write(new_record_b)  # เขียนทับ
-                            break
-                print(f"✅ คืนสำเร็จ ค่าปรับ: {fine} บาท" if fine > 0 else "✅ คืนสำเร็จ ไม่มีค่าปรับ")
-                break
-    if not found:
-        print("❌ ไม่พบ Lending ID")
-
-# ============================================
-# ฟังก์ชันแสดงข้อมูล: ดูประวัติการยืม-คืนทั้งหมด
-# ============================================
-def view_lendings():
-    """
-    แสดงรายการประวัติการยืม-คืนหนังสือทั้งหมด
-    """
-    # ตรวจสอบว่ามีไฟล์หรือไม่
-    if not os.path.exists(LENDINGS_FILE):
-        print("ยังไม่มีข้อมูลการยืม-คืน")
-        return
-
-    print("\n--- 📖 ประวัติยืม-คืน ---")
-    with open(LENDINGS_FILE, 'rb') as f:
-        while True:
-            r = f.read(LENDING_RECORD_SIZE)
-            if not r:
-                break
-            # แตก record
-            status, lid, bid, mid, borrow_date, return_date = struct.unpack(LENDING_FORMAT, r)
-            # แสดงเฉพาะรายการที่ Active (ยืมอยู่หรือคืนแล้ว)
-            if status in [STATUS_BORROWED, STATUS_RETURNED]:
-                # แปลง timestamp เป็นวันที่
-                bdate = datetime.datetime.fromtimestamp(borrow_date).strftime("%Y-%m-%d")
-                # ถ้ายังไม่คืน (return_date = 0) ให้แสดง "ยังไม่คืน"
-                rdate = "ยังไม่คืน" if return_date == 0.0 else datetime.datetime.fromtimestamp(return_date).strftime("%Y-%m-%d")
-                # กำหนดข้อความสถานะ
-                status_text = "📕 ยืมอยู่" if status == STATUS_BORROWED else "✅ คืนแล้ว"
-                # แสดงข้อมูล
-                print(f"LID:{lid}, BookID:{bid}, MemberID:{mid}, ยืม:{bdate}, คืน:{rdate}, สถานะ:{status_text}")
-
-# ============================================
-# เมนูหลักสำหรับจัดการการยืม-คืน
-# ============================================
-def lendings_menu():
-    """
-    แสดงเมนูและรอรับคำสั่งจากผู้ใช้
-    """
-    while True:
-        print("\n--- 📚 เมนูยืม-คืน ---")
-        print("1. ยืมหนังสือ")
-        print("2. คืนหนังสือ")
-        print("3. ดูประวัติทั้งหมด")
-        print("0. กลับ")
-        ch = input("เลือก: ")
-        
-        # เรียกใช้ฟังก์ชันตามตัวเลือก
-        if ch == '1':
-            borrow_book()  # เรียกฟังก์ชันยืมหนังสือ
-        elif ch == '2':
-            return_book()  # เรียกฟังก์ชันคืนหนังสือ
-        elif ch == '3':
-            view_lendings()  # เรียกฟังก์ชันแสดงประวัติ
-        elif ch == '0':
+import struct, os, time, datetime
+from functools import partial
+import locks, metrics, open_loans, overdue, record_index, records, segments, wal
+from records import get_last_id
+from books import BOOKS_FILE, STATUS_ACTIVE
+from members import MEMBERS_FILE
+
+# ============================================
+# กำหนดค่าคอนฟิกสำหรับไฟล์การยืม-คืน
+# ============================================
+LENDINGS_FILE = 'lendings.dat'  # ชื่อไฟล์ binary สำหรับเก็บข้อมูลการยืม-คืน
+LENDING_FORMAT = '< c i i i d d'  # โครงสร้างข้อมูล: สถานะ(1 byte), lending_id(4), book_id(4), member_id(4), วันยืม(8), วันคืน(8)
+LENDING_RECORD_SIZE = struct.calcsize(LENDING_FORMAT)  # คำนวณขนาดของแต่ละ record (29 bytes)
+STATUS_BORROWED = b'A'  # สถานะ 'A' = Active (กำลังยืมอยู่)
+STATUS_RETURNED = b'R'  # สถานะ 'R' = Returned (คืนแล้ว)
+# บันทึกการเปลี่ยนสถานะของ record เดิม (A -> R ตอนคืน) ต่อท้ายไฟล์ไปเรื่อย ๆ
+# ใช้ให้รายงานแบบ incremental รู้ว่ามีการคืนหนังสือเล่มไหนบ้างตั้งแต่ checkpoint ล่าสุด
+LENDING_CHANGES_FILE = 'lendings.chg'
+LENDING_CHANGE_FORMAT = '< i c'  # lending_id(4), สถานะใหม่(1 byte)
+LENDING_CHANGE_SIZE = struct.calcsize(LENDING_CHANGE_FORMAT)
+
+MAX_LOANS_PER_MEMBER = 5  # จำนวนเล่มที่สมาชิก 1 คนยืมค้างได้พร้อมกัน
+LOAN_DAYS = 7  # ยืมได้กี่วันก่อนเริ่มคิดค่าปรับ
+FINE_PER_DAY = 5  # ค่าปรับ (บาท) ต่อวันที่เกินกำหนด
+
+records.register(LENDINGS_FILE, LENDING_FORMAT)
+
+class LendingError(Exception):
+    """ยืม/คืนไม่สำเร็จ (ข้อความใช้แสดงผู้ใช้ได้ทันที)"""
+
+def fine_for(borrow_date, return_time):
+    """ค่าปรับ (บาท) ของการยืมตั้งแต่ borrow_date ถึง return_time (overdue.py คำนวณแบบเดียวกันทีละหลายรายการ)"""
+    days = (return_time - borrow_date) / 86400  # แปลง seconds เป็นวัน (86400 = จำนวน seconds ใน 1 วัน)
+    return max(0, int(days - LOAN_DAYS) * FINE_PER_DAY)  # คำนวณค่าปรับ (ถ้าเกิน LOAN_DAYS วัน)
+
+# ============================================
+# ฟังก์ชันหลัก: ยืมหนังสือ
+# ============================================
+@metrics.timed('borrow')
+def borrow(book_id, member_id):
+    """
+    ยืมหนังสือโดยไม่ต้องรับ input (ใช้ได้ทั้งเมนูและโปรแกรมอื่น)
+    การต่อท้าย lendings.dat และการลด qty ใน books.dat เป็นธุรกรรมเดียวกันใน WAL
+    คืน (lending_id, ชื่อหนังสือ, ชื่อสมาชิก) หรือ raise LendingError
+    """
+    # ล็อก record หนังสือ (กันสองโปรแกรมยืมเล่มสุดท้ายพร้อมกัน) และสมาชิก (กันยืมเกินจำนวนที่กำหนด)
+    # ตลอดช่วง อ่าน-ตรวจ-เขียน
+    with locks.record_lock(BOOKS_FILE, book_id), locks.record_lock(MEMBERS_FILE, member_id):
+        # ใช้ดัชนี ID -> ตำแหน่ง: seek + read ครั้งเดียว ไม่ต้องไล่อ่านทั้งไฟล์
+        # records.read_raw คืน record ที่ decode แล้ว (จาก cache ถ้า bytes ไม่เปลี่ยน) พร้อม bytes ดิบ
+        book_pos, book_raw, book = records.read_raw(BOOKS_FILE, book_id)
+        if not book or book[0] != STATUS_ACTIVE:
+            raise LendingError("ไม่พบหนังสือ")
+        status, bid, isbn, title, author, qty = book
+        _, member = records.read(MEMBERS_FILE, member_id)
+        if not member or member[0] != STATUS_ACTIVE:
+            raise LendingError("ไม่พบสมาชิก")
+        member_name = member[2]
+        # นับจากดัชนี open loans ไม่ต้องไล่อ่านประวัติการยืมทั้งหมด
+        if open_loans.count_by_member(member_id) >= MAX_LOANS_PER_MEMBER:
+            raise LendingError(f"สมาชิกยืมครบ {MAX_LOANS_PER_MEMBER} เล่มแล้ว")
+        if qty <= 0:
+            raise LendingError("หนังสือหมดสต็อก")
+        # ใช้ record หนังสือที่อ่านไว้แล้วตอนตรวจสอบ ไม่ต้องอ่านซ้ำ
+        new_book = records.modify(BOOKS_FILE, book_raw, {5: qty - 1})  # ลดจำนวน 1 (ฟิลด์อื่นคงเดิมทุก byte)
+        with locks.commit_lock():  # สร้าง ID ใหม่ + ต่อท้ายไฟล์เป็นขั้นตอนเดียว (ไม่ได้ ID ซ้ำกับโปรแกรมอื่น)
+            lending_id = get_last_id(LENDINGS_FILE, LENDING_RECORD_SIZE) + 1  # สร้าง ID ใหม่
+            borrow_date = time.time()  # เก็บเวลาปัจจุบันเป็น timestamp
+            return_date = 0.0  # ยังไม่ได้คืน ใส่ 0
+            record = struct.pack(LENDING_FORMAT, STATUS_BORROWED, lending_id, book_id, member_id, borrow_date, return_date)
+            pos = wal.file_size(LENDINGS_FILE)
+            wal.commit([(LENDINGS_FILE, pos, record), (BOOKS_FILE, book_pos, new_book)],
+                       after=[partial(record_index.note_append, LENDINGS_FILE, LENDING_RECORD_SIZE, lending_id, pos),
+                              partial(open_loans.note_borrow, pos, record)])
+    return lending_id, title, member_name
+
+def borrow_book():
+    book_id = int(input("Book ID ที่จะยืม: "))
+    member_id = int(input("Member ID: "))
+    try:
+        _, book_title, member_name = borrow(book_id, member_id)
+    except LendingError as e:
+        print(f"❌ {e}")
+        return  # ออกจากฟังก์ชันทันที
+    print(f"✅ ยืมหนังสือ '{book_title}' สำเร็จโดย {member_name}")
+
+# ============================================
+# ฟังก์ชันหลัก: คืนหนังสือ
+# ============================================
+@metrics.timed('return_lending')
+def return_lending(lending_id):
+    """
+    คืนหนังสือโดยไม่ต้องรับ input
+    ขั้นตอน: ค้นหา Lending ID -> คำนวณค่าปรับ -> อัปเดตสถานะ + บันทึกการเปลี่ยนสถานะ + เพิ่มสต็อกหนังสือ
+    (ทั้งสามการเขียนเป็นธุรกรรมเดียวกันใน WAL) คืนค่าปรับ (บาท) หรือ raise LendingError
+    """
+    # ล็อก record การยืมก่อน (กันคืนซ้ำพร้อมกัน) แล้วค่อยล็อก record หนังสือที่ต้องเพิ่มสต็อก
+    with locks.record_lock(LENDINGS_FILE, lending_id):
+        pos, lending = records.read(LENDINGS_FILE, lending_id)
+        if not lending or lending[0] != STATUS_BORROWED:
+            raise LendingError("ไม่พบ Lending ID")
+        status, lid, bid, mid, borrow_date, return_date = lending
+        return_time = time.time()  # เวลาคืนปัจจุบัน
+        fine = fine_for(borrow_date, return_time)
+        with locks.record_lock(BOOKS_FILE, bid), locks.commit_lock():
+            change_pos = wal.file_size(LENDING_CHANGES_FILE)
+            ops = [
+                (LENDINGS_FILE, pos, struct.pack(LENDING_FORMAT, STATUS_RETURNED, lid, bid, mid, borrow_date, return_time)),
+                # บันทึกการเปลี่ยนสถานะ
+                (LENDING_CHANGES_FILE, change_pos, struct.pack(LENDING_CHANGE_FORMAT, lid, STATUS_RETURNED)),
+            ]
+            pos2, raw, book = records.read_raw(BOOKS_FILE, bid)
+            if book and book[0] == STATUS_ACTIVE:
+                ops.append((BOOKS_FILE, pos2, records.modify(BOOKS_FILE, raw, {5: book[5] + 1})))  # เพิ่มจำนวน 1
+            wal.commit(ops, after=[partial(open_loans.note_return, change_pos, lid)])
+    return fine
+
+def return_book():
+    """
+    ฟังก์ชันสำหรับการคืนหนังสือ (รับ Lending ID จากผู้ใช้)
+    """
+    lending_id = int(input("Lending ID คืน: "))
+    try:
+        fine = return_lending(lending_id)
+    except LendingError as e:
+        print(f"❌ {e}")
+        return
+    print(f"✅ คืนสำเร็จ ค่าปรับ: {fine} บาท" if fine > 0 else "✅ คืนสำเร็จ ไม่มีค่าปรับ")
+
+# ============================================
+# ฟังก์ชันค้นหา: หนังสือที่ยังไม่คืน (ใช้ดัชนี open loans ไม่ต้องอ่านประวัติทั้งหมด)
+# ============================================
+@metrics.timed('member_loans')
+def member_loans(member_id):
+    """หนังสือที่สมาชิกยืมอยู่ [(lending_id, book_id, member_id, วันยืม)]"""
+    return open_loans.loans_by_member(member_id)
+
+@metrics.timed('book_loans')
+def book_loans(book_id):
+    """ผู้ที่ยืมหนังสือเล่มนี้อยู่ [(lending_id, book_id, member_id, วันยืม)]"""
+    return open_loans.loans_by_book(book_id)
+
+def print_loans(loans):
+    for lid, bid, mid, borrow_date in loans:
+        bdate = datetime.datetime.fromtimestamp(borrow_date).strftime("%Y-%m-%d")
+        print(f"LID:{lid}, BookID:{bid}, MemberID:{mid}, ยืม:{bdate}")
+
+def view_member_loans():
+    member_id = int(input("Member ID: "))
+    loans = member_loans(member_id)
+    if not loans:
+        print("สมาชิกไม่มีหนังสือที่ยืมอยู่"); return
+    print(f"\n--- 📕 หนังสือที่สมาชิก {member_id} ยืมอยู่ ({len(loans)}/{MAX_LOANS_PER_MEMBER}) ---")
+    print_loans(loans)
+
+def view_book_loans():
+    book_id = int(input("Book ID: "))
+    loans = book_loans(book_id)
+    if not loans:
+        print("ไม่มีผู้ยืมหนังสือเล่มนี้อยู่"); return
+    print(f"\n--- 👤 ผู้ที่ยืมหนังสือ {book_id} อยู่ ---")
+    print_loans(loans)
+
+# ============================================
+# ฟังก์ชันแสดงข้อมูล: ดูประวัติการยืม-คืนทั้งหมด
+# ============================================
+def print_lending(record):
+    status, lid, bid, mid, borrow_date, return_date = record
+    # แปลง timestamp เป็นวันที่
+    bdate = datetime.datetime.fromtimestamp(borrow_date).strftime("%Y-%m-%d")
+    # ถ้ายังไม่คืน (return_date = 0) ให้แสดง "ยังไม่คืน"
+    rdate = "ยังไม่คืน" if return_date == 0.0 else datetime.datetime.fromtimestamp(return_date).strftime("%Y-%m-%d")
+    # กำหนดข้อความสถานะ
+    status_text = "📕 ยืมอยู่" if status == STATUS_BORROWED else "✅ คืนแล้ว"
+    # แสดงข้อมูล
+    print(f"LID:{lid}, BookID:{bid}, MemberID:{mid}, ยืม:{bdate}, คืน:{rdate}, สถานะ:{status_text}")
+
+def view_lendings(start=None, end=None, where=None, order_by=None, desc=False):
+    """
+    แสดงประวัติการยืม-คืน (รวม segment ที่ archive แล้ว) ทีละหน้าตามเงื่อนไขของ query.select
+    start/end: แสดงเฉพาะที่ยืมในช่วง [start, end) (timestamp) โดยข้าม segment ที่อยู่นอกช่วงทั้ง segment
+    ไม่ระบุทั้ง start/end และ where = ถามเงื่อนไขและการเรียงจากผู้ใช้
+    """
+    import query  # query.py import lendings.py เอง
+    # ตรวจสอบว่ามีไฟล์หรือไม่
+    if not os.path.exists(LENDINGS_FILE):
+        print("ยังไม่มีข้อมูลการยืม-คืน")
+        return
+    if where is None and start is None and end is None:
+        try:
+            where, order_by, desc = query.ask('lendings')
+        except ValueError as e:
+            print(f"❌ {e}")
+            return
+    where = list(where or ())
+    if start is not None:
+        where.append(('borrow_date', '>=', start))
+    if end is not None:
+        where.append(('borrow_date', '<', end))
+
+    print("\n--- 📖 ประวัติยืม-คืน ---")
+    # ไม่ได้กรอง status = แสดงเฉพาะ ยืมอยู่/คืนแล้ว
+    query.page_through('lendings', print_lending, query.visible('lendings', where), order_by, desc,
+                       operation='view_lendings')
+
+def view_lendings_by_month():
+    first = input("ตั้งแต่เดือน (YYYY-MM): ")
+    last = input("ถึงเดือน (YYYY-MM, เว้นว่าง = เดือนเดียวกัน): ") or first
+    try:
+        start, end = segments.parse_month(first)[0], segments.parse_month(last)[1]
+    except ValueError:
+        print("❌ รูปแบบเดือนไม่ถูกต้อง (ตัวอย่าง 2024-03)")
+        return
+    view_lendings(start, end)
+
+# ============================================
+# เมนูหลักสำหรับจัดการการยืม-คืน
+# ============================================
+def lendings_menu():
+    """
+    แสดงเมนูและรอรับคำสั่งจากผู้ใช้
+    """
+    while True:
+        print("\n--- 📚 เมนูยืม-คืน ---")
+        print("1. ยืมหนังสือ")
+        print("2. คืนหนังสือ")
+        print("3. ดูประวัติทั้งหมด")
+        print("4. ดูหนังสือที่สมาชิกยืมอยู่")
+        print("5. ดูผู้ที่ยืมหนังสือเล่มนี้อยู่")
+        print("6. ดูประวัติตามช่วงเดือน")
+        print("7. รายงานเกินกำหนดและค่าปรับ")
+        print("8. ดูรายการที่ใกล้ครบกำหนด")
+        print("0. กลับ")
+        ch = input("เลือก: ")
+        
+        # เรียกใช้ฟังก์ชันตามตัวเลือก
+        if ch == '1':
+            borrow_book()  # เรียกฟังก์ชันยืมหนังสือ
+        elif ch == '2':
+            return_book()  # เรียกฟังก์ชันคืนหนังสือ
+        elif ch == '3':
+            view_lendings()  # เรียกฟังก์ชันแสดงประวัติ
+        elif ch == '4':
+            view_member_loans()
+        elif ch == '5':
+            view_book_loans()
+        elif ch == '6':
+            view_lendings_by_month()
+        elif ch == '7':
+            overdue.generate_overdue_report()
+        elif ch == '8':
+            overdue.view_next_due()
+        elif ch == '0':
             break  # ออกจาก loop กลับไปเมนูหลัก
\ No newline at end of file
@@ -0,0 +1,122 @@
+import sys, json, time, random, asyncio, argparse
+from collections import Counter, defaultdict
+from server import DEFAULT_HOST, DEFAULT_PORT
+
+# ============================================
+# Load generator สำหรับ server.py: วัดจำนวนคำขอต่อวินาทีและ latency (p50/p99)
+# ============================================
+# ใช้: python loadgen.py [--clients 50] [--requests 20000] [--mix book=50,search=20,loans=10,borrow=10,return=10]
+# แต่ละ client เปิด connection ของตัวเองแล้วส่งคำขอทีละรายการ (รอคำตอบก่อนส่งคำขอถัดไป)
+# return จะคืนเล่มที่ client นั้นยืมไว้เอง ถ้ายังไม่มีจะยืมแทน
+# คำตอบ ok: false ที่เป็นเรื่องปกติ (เช่นหนังสือหมดสต็อก) นับแยกไว้ ไม่ถือว่าล้มเหลว
+DEFAULT_MIX = 'book=50,search=20,loans=10,borrow=10,return=10'
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        op, _, weight = part.partition('=')
+        mix[op.strip()] = float(weight or 1)
+    return mix
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+async def call(reader, writer, request):
+    writer.write(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+    await writer.drain()
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("server ปิด connection")
+    return json.loads(line)
+
+async def run_client(host, port, count, mix, info, queries, rng, latencies, outcomes):
+    reader, writer = await asyncio.open_connection(host, port)
+    ops, weights = list(mix), list(mix.values())
+    borrowed = []
+    try:
+        for _ in range(count):
+            op = rng.choices(ops, weights)[0]
+            if op == 'return' and not borrowed:
+                op = 'borrow'
+            if op == 'book':
+                request = {'op': 'book', 'book_id': rng.randint(1, info['last_book_id'])}
+            elif op == 'member':
+                request = {'op': 'member', 'member_id': rng.randint(1, info['last_member_id'])}
+            elif op == 'search':
+                request = {'op': 'search', 'query': rng.choice(queries)}
+            elif op == 'loans':
+                request = {'op': 'loans', 'member_id': rng.randint(1, info['last_member_id'])}
+            elif op == 'borrow':
+                request = {'op': 'borrow', 'book_id': rng.randint(1, info['last_book_id']),
+                           'member_id': rng.randint(1, info['last_member_id'])}
+            elif op == 'return':
+                request = {'op': 'return', 'lending_id': borrowed.pop(rng.randrange(len(borrowed)))}
+            else:
+                request = {'op': op}
+            start = time.perf_counter()
+            response = await call(reader, writer, request)
+            latencies[op].append(time.perf_counter() - start)
+            if response['ok']:
+                outcomes[op] += 1
+                if op == 'borrow':
+                    borrowed.append(response['result']['lending_id'])
+            else:
+                outcomes[f"{op}: {response['error']}"] += 1
+    finally:
+        writer.close()
+        # คืนเล่มที่ยังค้างอยู่ ข้อมูลจะได้ไม่ค่อย ๆ หมดสต็อกเมื่อรันซ้ำหลายครั้ง
+        if borrowed:
+            reader, writer = await asyncio.open_connection(host, port)
+            for lending_id in borrowed:
+                await call(reader, writer, {'op': 'return', 'lending_id': lending_id})
+            writer.close()
+
+async def run(host, port, clients, requests, mix, seed):
+    reader, writer = await asyncio.open_connection(host, port)
+    info = (await call(reader, writer, {'op': 'info'}))['result']
+    if info['last_book_id'] < 1 or info['last_member_id'] < 1:
+        raise SystemExit("❌ ต้องมีหนังสือและสมาชิกอย่างน้อยอย่างละ 1 รายการ")
+    # คำค้นจากชื่อหนังสือ/ผู้แต่งจริง (คำแรกของชื่อ) จะได้มีผลลัพธ์
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(50):
+        response = await call(reader, writer, {'op': 'book', 'book_id': rng.randint(1, info['last_book_id'])})
+        if response['ok']:
+            book = response['result']
+            queries.extend(word for word in book['title'].split()[:1] + [book['author']] if word)
+    writer.close()
+    queries = queries or ['a']
+
+    latencies, outcomes = defaultdict(list), Counter()
+    per_client = [requests // clients + (i < requests % clients) for i in range(clients)]
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(host, port, count, mix, info, queries, random.Random(seed * 1000 + i),
+                                      latencies, outcomes) for i, count in enumerate(per_client)))
+    seconds = time.perf_counter() - start
+
+    all_latencies = sorted(value for values in latencies.values() for value in values)
+    print(f"{clients} clients, {len(all_latencies):,} คำขอใน {seconds:.2f} วินาที = {len(all_latencies) / seconds:,.0f} คำขอ/วินาที")
+    print(f"{'op':<8}{'จำนวน':>9}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for op, values in sorted(latencies.items()) + [('รวม', all_latencies)]:
+        values = sorted(values)
+        print(f"{op:<8}{len(values):>9,}{percentile(values, 50) * 1000:>10.2f}"
+              f"{percentile(values, 99) * 1000:>10.2f}{values[-1] * 1000:>10.2f}")
+    for name, count in sorted(outcomes.items()):
+        print(f"   {name}: {count:,}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="วัดประสิทธิภาพ server.py (คำขอ/วินาที และ p99 latency)")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=20000, help="จำนวนคำขอรวมทุก client")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="สัดส่วนของแต่ละ op เช่น book=50,borrow=10")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    asyncio.run(run(args.host, args.port, args.clients, args.requests, parse_mix(args.mix), args.seed))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import os, errno, zlib
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows: ไม่มี fcntl ล็อกทั้งหมดจะไม่ทำอะไร (ใช้งานได้ทีละโปรแกรมเท่านั้น)
+    fcntl = None
+
+# ============================================
+# การล็อกระหว่างหลายโปรแกรม (หลายเครื่อง/หลายหน้าต่าง) ที่ใช้ไฟล์ข้อมูลชุดเดียวกัน
+# ============================================
+# ใช้ byte-range lock ของ fcntl บนไฟล์ library.lock ไฟล์เดียว (ไม่ล็อกบนไฟล์ .dat โดยตรง เพราะ
+# POSIX lock ของทั้งโปรเซสจะหลุดเมื่อปิด fd ใด ๆ ของไฟล์นั้น ซึ่งโค้ดส่วนอื่นเปิด/ปิดอยู่ตลอด)
+# - byte 0: commit lock (exclusive) ครอบการเขียน WAL + ไฟล์ข้อมูล และการแจก ID ใหม่ (get_last_id + ต่อท้าย)
+# - ไฟล์ข้อมูลแต่ละไฟล์มีช่วงของตัวเอง (_region):
+#     byte แรกของช่วง = structure lock: การอ่านทั้งไฟล์และการล็อก record ถือแบบ shared
+#                       compaction (ย้ายตำแหน่ง record) ถือแบบ exclusive
+#     byte ถัดไป + record_id = record lock (exclusive) สำหรับ อ่าน-ตรวจ-เขียนทับ record เดิม
+#   ล็อกตาม ID ไม่ใช่ตาม offset จึงไม่ผิดตัวแม้ compaction ย้ายตำแหน่ง record
+# ลำดับการล็อกเพื่อไม่ให้ deadlock: record ของ lendings -> books -> members -> commit lock เสมอ
+# การอ่านทั้งไฟล์ (view_all_*, รายงาน) ไม่ชน record lock และ commit lock จึงไม่ขวางการยืม/คืน
+#
+# ในโหมด group commit การปลดล็อกจะถูกเลื่อนไปจนถึง wal.flush() (ข้อมูลที่ยังรออยู่ใน WAL ต้องไม่ถูก
+# โปรเซสอื่นอ่านค่าเก่าไปแก้ต่อ) ระหว่างนั้นถ้าล็อกใหม่ไม่ว่าง จะ flush ก่อนแล้วค่อยรอ (ไม่รอทั้งที่ถือล็อกค้าง)
+LOCK_FILE = 'library.lock'
+COMMIT_LOCK = 0
+
+_lock_fd = None
+_held = {}  # offset -> [exclusive?, จำนวนชั้นที่ถืออยู่] (0 = ถือค้างรอปลดตอน flush)
+_defer_depth = 0
+contention_hook = None  # wal ตั้งเป็น wal.flush
+
+def _fd():
+    global _lock_fd
+    if _lock_fd is None:
+        _lock_fd = os.open(LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    return _lock_fd
+
+def _region(filename):
+    """ตำแหน่งเริ่มของช่วงล็อกของไฟล์ข้อมูล (แยกกันด้วย crc32 ของชื่อไฟล์ ช่วงละ 2^32 bytes)"""
+    return ((zlib.crc32(os.path.basename(filename).encode('utf-8')) & 0x3fffffff) + 1) << 32
+
+def _acquire(offset, exclusive):
+    held = _held.get(offset)
+    if held is not None:
+        if exclusive and not held[0]:
+            raise RuntimeError("ถือ shared lock อยู่แล้ว เปลี่ยนเป็น exclusive ไม่ได้")
+        held[1] += 1
+        return
+    mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    if contention_hook and any(count == 0 for _, count in _held.values()):
+        # ถือล็อกที่เลื่อนการปลดไว้อยู่: ลองแบบไม่รอก่อน ถ้าไม่ว่างให้ flush (ปลดล็อกค้าง) แล้วค่อยรอ
+        try:
+            fcntl.lockf(_fd(), mode | fcntl.LOCK_NB, 1, offset)
+        except OSError as e:
+            if e.errno not in (errno.EACCES, errno.EAGAIN):
+                raise
+            contention_hook()
+            fcntl.lockf(_fd(), mode, 1, offset)
+    else:
+        fcntl.lockf(_fd(), mode, 1, offset)
+    _held[offset] = [exclusive, 1]
+
+def _release(offset):
+    held = _held[offset]
+    held[1] -= 1
+    if held[1] == 0 and not _defer_depth:
+        del _held[offset]
+        fcntl.lockf(_fd(), fcntl.LOCK_UN, 1, offset)
+
+@contextmanager
+def _lock(offsets, exclusive):
+    if fcntl is None:
+        yield
+        return
+    taken = []
+    try:
+        for offset in offsets:
+            _acquire(offset, exclusive)
+            taken.append(offset)
+        yield
+    finally:
+        for offset in reversed(taken):
+            _release(offset)
+
+def commit_lock():
+    """ครอบการเขียนผ่าน WAL และการแจก ID ใหม่ (reentrant ภายในโปรเซสเดียวกัน)"""
+    return _lock([COMMIT_LOCK], True)
+
+def scan_lock(filename):
+    """ถือระหว่างอ่านทั้งไฟล์: กันเฉพาะ compaction ไม่กันการยืม/คืน/แก้ไข"""
+    return _lock([_region(filename)], False)
+
+def compaction_lock(filename):
+    """ถือระหว่าง compaction: รอจนไม่มีใครอ่านทั้งไฟล์หรือล็อก record ของไฟล์นี้อยู่"""
+    return _lock([_region(filename)], True)
+
+@contextmanager
+def record_lock(filename, *record_ids):
+    """ล็อก record ตาม ID แบบ exclusive สำหรับ อ่าน-ตรวจ-เขียนทับ (เรียง ID ก่อนล็อกเพื่อไม่ให้ deadlock)"""
+    base = _region(filename)
+    with scan_lock(filename), _lock([base + 1 + record_id for record_id in sorted(set(record_ids))], True):
+        yield
+
+@contextmanager
+def deferred_release():
+    """ภายใน block นี้ ล็อกที่ใช้เสร็จแล้วจะยังถือไว้จนกว่าจะเรียก release_deferred() (ใช้กับ group commit)"""
+    global _defer_depth
+    _defer_depth += 1
+    try:
+        yield
+    finally:
+        _defer_depth -= 1
+        if _defer_depth == 0:
+            release_deferred()
+
+def release_deferred():
+    """ปลดล็อกที่ถือค้างไว้ทั้งหมด (เฉพาะที่ไม่มี block ใดใช้งานอยู่แล้ว)"""
+    for offset, (_, count) in list(_held.items()):
+        if count == 0:
+            del _held[offset]
+            fcntl.lockf(_fd(), fcntl.LOCK_UN, 1, offset)
@@ -1,38 +1,241 @@
-import os
-from books import books_menu
-from members import members_menu
-from lendings import lendings_menu
-from report import generate_report
-
-def main():
-    while True:
-        os.system('cls' if os.name == 'nt' else 'clear')
-        print("==============================")
-        print("  PyLibMan - ระบบจัดการห้องสมุด")
-        print("==============================")
-        print("1. จัดการหนังสือ")
-        print("2. จัดการสมาชิก")
-        print("3. จัดการการยืม-คืน")
-        print("4. สร้างรายงาน")
-        print("0. ปิดโปรแกรม")
-        
-        choice = input("เลือกเมนูหลัก: ")
-        
-        if choice == '1':
-            books_menu()
-        elif choice == '2':
-            members_menu()
-        elif choice == '3':
-            lendings_menu()
-        elif choice == '4':
-            generate_report()
-            input("\nกด Enter เพื่อไปต่อ...")
-        elif choice == '0':
-            print("ปิดโปรแกรม")
-            break
-        else:
-            print("ตัวเลือกไม่ถูกต้อง")
-            input("กด Enter เพื่อไปต่อ...")
-
-if __name__ == '__main__':
-    main()
+import os, sys, time, shlex, argparse, contextlib
+from collections import Counter
+from books import books_menu
+from members import members_menu
+from lendings import lendings_menu
+from report import REPORT_ENGINES, generate_report, check_report_engines, report_menu
+from metrics import metrics_menu
+import books, bulk, lendings, members, overdue, query, segments, wal
+
+# ============================================
+# โหมดคำสั่ง (ไม่ต้องตอบเมนู): python main.py <คำสั่ง> [ตัวเลือก]  ไม่ระบุคำสั่ง = เมนูแบบเดิม
+# ============================================
+# เช่น python main.py borrow --book 3 --member 1 / python main.py report / python main.py import books x.csv
+# python main.py report --engine numpy --check  เทียบรายงานของ engine กับ engine python โดยไม่เขียนไฟล์
+# python main.py list lendings --where 'member_id=5; borrow_date>=2024-01-01' --order borrow_date --desc
+#   แสดงหน้าแรก (--limit แถว) แล้วบอก --after สำหรับหน้าถัดไป
+# python main.py batch [ไฟล์]  อ่านคำสั่งบรรทัดละ 1 คำสั่ง (รูปแบบเดียวกับบน command line ไม่ต้องมี
+# python main.py นำหน้า, บรรทัดว่างและบรรทัดที่ขึ้นต้นด้วย # ถูกข้าม) จากไฟล์หรือ stdin แล้วทำทั้งหมดในโปรเซสเดียว:
+# ไฟล์ข้อมูล/WAL/ดัชนีเปิดครั้งเดียว และการเขียนรวมเป็นชุดใน wal.group_commit() (fsync ครั้งเดียวต่อ
+# GROUP_COMMIT_MAX_ENTRIES ธุรกรรม) จบแล้วแสดงจำนวนคำสั่งต่อวินาทีและรายการที่ไม่สำเร็จ
+# คำสั่งที่อ่านไฟล์ข้อมูลตรงทั้งไฟล์หรือผ่านดัชนีค้นหา (report, export, list, search) จะ flush ธุรกรรมที่รออยู่ก่อนเสมอ
+MAX_SHOWN_ERRORS = 20
+
+class CommandError(Exception):
+    """คำสั่งหรือตัวเลือกไม่ถูกต้อง"""
+
+class _BatchParser(argparse.ArgumentParser):
+    """ในโหมด batch ตัวเลือกผิดของบรรทัดหนึ่งต้องไม่ทำให้โปรแกรมจบ"""
+    def error(self, message):
+        raise CommandError(message)
+
+def cmd_add_book(args):
+    book_id = books.create_book(args.isbn, args.title, args.author, args.qty)
+    print(f"✅ เพิ่มหนังสือ '{args.title}' (ID: {book_id}) เรียบร้อยแล้ว")
+
+def cmd_add_member(args):
+    member_id = members.create_member(args.name, args.phone)
+    print(f"✅ เพิ่มสมาชิก '{args.name}' (ID: {member_id}) เรียบร้อยแล้ว")
+
+def cmd_borrow(args):
+    lending_id, title, member_name = lendings.borrow(args.book, args.member)
+    print(f"✅ ยืมหนังสือ '{title}' สำเร็จโดย {member_name} (Lending ID: {lending_id})")
+
+def cmd_return(args):
+    fine = lendings.return_lending(args.lending)
+    print(f"✅ คืนสำเร็จ ค่าปรับ: {fine} บาท" if fine > 0 else "✅ คืนสำเร็จ ไม่มีค่าปรับ")
+
+def cmd_loans(args):
+    if args.member is not None:
+        lendings.print_loans(lendings.member_loans(args.member))
+    elif args.book is not None:
+        lendings.print_loans(lendings.book_loans(args.book))
+    else:
+        raise CommandError("ต้องระบุ --member หรือ --book")
+
+def cmd_search(args):
+    books.print_found_books(args.query, books.find_books(args.query))
+
+def cmd_report(args):
+    if not args.check:
+        generate_report(args.engine, args.workers)
+        return
+    engines = [args.engine] if args.engine not in (None, 'python') else REPORT_ENGINES[1:]
+    if not check_report_engines(engines, args.workers):
+        raise CommandError("รายงานแต่ละ engine ไม่ตรงกัน")
+
+def cmd_overdue(args):
+    overdue.generate_overdue_report(next_count=args.next_count)
+
+def cmd_import(args):
+    bulk.import_file(args.table, args.path, args.format, args.rejects)
+
+def cmd_export(args):
+    bulk.export_file(args.table, args.path, args.format)
+
+def cmd_list(args):
+    where = query.visible(args.table, query.parse_where(args.table, '; '.join(args.where)))
+    after = query.parse_cursor(args.after) if args.after else None
+    rows, cursor = query.select(args.table, where, args.order, args.desc, args.limit, after)
+    show = {'books': books.print_book, 'members': members.print_member, 'lendings': lendings.print_lending}[args.table]
+    for row in rows:
+        show(row)
+    if cursor is not None:
+        print(f"หน้าถัดไป: --after '{query.format_cursor(cursor)}'")
+
+def cmd_batch(args):
+    if args.path == '-':
+        return run_batch(sys.stdin, args.verbose)
+    with open(args.path, encoding='utf-8') as stream:
+        return run_batch(stream, args.verbose)
+
+def build_parser(parser_class=argparse.ArgumentParser):
+    parser = parser_class(prog='main.py', description="PyLibMan - ระบบจัดการห้องสมุด (ไม่ระบุคำสั่ง = เมนู)")
+    commands = parser.add_subparsers(dest='command', metavar='คำสั่ง')
+
+    def command(name, handler, summary, scan=False):
+        sub = commands.add_parser(name, help=summary)
+        sub.set_defaults(handler=handler, scan=scan)
+        return sub
+
+    sub = command('add-book', cmd_add_book, "เพิ่มหนังสือ")
+    sub.add_argument('--isbn', default='')
+    sub.add_argument('--title', required=True)
+    sub.add_argument('--author', default='')
+    sub.add_argument('--qty', type=int, default=1)
+    sub = command('add-member', cmd_add_member, "เพิ่มสมาชิก")
+    sub.add_argument('--name', required=True)
+    sub.add_argument('--phone', default='')
+    sub = command('borrow', cmd_borrow, "ยืมหนังสือ")
+    sub.add_argument('--book', type=int, required=True)
+    sub.add_argument('--member', type=int, required=True)
+    sub = command('return', cmd_return, "คืนหนังสือ")
+    sub.add_argument('--lending', type=int, required=True)
+    sub = command('loans', cmd_loans, "หนังสือที่ยังไม่คืนของสมาชิก/ผู้ที่ยืมหนังสือเล่มนี้อยู่")
+    sub.add_argument('--member', type=int)
+    sub.add_argument('--book', type=int)
+    # ดัชนีค้นหาตามไฟล์ข้อมูลเฉพาะธุรกรรมที่ flush แล้ว
+    sub = command('search', cmd_search, "ค้นหาหนังสือ (ISBN / ชื่อหนังสือ / ผู้แต่ง)", scan=True)
+    sub.add_argument('query')
+    sub = command('report', cmd_report, "สร้างรายงาน library_report.txt", scan=True)
+    sub.add_argument('--engine', choices=REPORT_ENGINES, help="ค่าเริ่มต้น report.REPORT_ENGINE")
+    sub.add_argument('--check', action='store_true',
+                     help="ไม่เขียนไฟล์ เทียบรายงานของ --engine (ไม่ระบุ = ทุก engine) กับ engine python ทุกบรรทัด")
+    sub.add_argument('--workers', type=int, help="จำนวนโปรเซสของ engine parallel (ค่าเริ่มต้น = จำนวน CPU)")
+    sub = command('overdue', cmd_overdue, "สร้างรายงานเกินกำหนดและค่าปรับ")
+    sub.add_argument('--next', type=int, default=overdue.NEXT_DUE_COUNT, dest='next_count')
+    for name, handler, summary in (('import', cmd_import, "นำเข้าหนังสือ/สมาชิกจาก CSV หรือ JSON Lines"),
+                                ('export', cmd_export, "ส่งออกหนังสือ/สมาชิกเป็น CSV หรือ JSON Lines")):
+        sub = command(name, handler, summary, scan=name == 'export')
+        sub.add_argument('table', choices=sorted(bulk.TABLES))
+        sub.add_argument('path')
+        sub.add_argument('--format', choices=['csv', 'jsonl'], help="ค่าเริ่มต้นเลือกจากนามสกุลไฟล์")
+        if name == 'import':
+            sub.add_argument('--rejects', help="ไฟล์สำหรับเก็บแถวที่ไม่ผ่าน (JSON Lines)")
+    sub = command('list', cmd_list, "แสดงหนังสือ/สมาชิก/ประวัติยืม-คืนตามเงื่อนไข ทีละหน้า", scan=True)
+    sub.add_argument('table', choices=sorted(query.FIELDS))
+    sub.add_argument('--where', action='append', default=[], help="เช่น 'qty>=2; status=A' (ระบุซ้ำได้)")
+    sub.add_argument('--order', help="ชื่อฟิลด์ที่ใช้เรียง (ค่าเริ่มต้น ID)")
+    sub.add_argument('--desc', action='store_true', help="เรียงจากมากไปน้อย")
+    sub.add_argument('--limit', type=int, default=query.PAGE_SIZE)
+    sub.add_argument('--after', help="cursor ของหน้าถัดไปที่คำสั่งก่อนแสดง")
+    sub = command('batch', cmd_batch, "ทำคำสั่งจากไฟล์/stdin บรรทัดละ 1 คำสั่งในโปรเซสเดียว")
+    sub.add_argument('path', nargs='?', default='-', help="ไฟล์คำสั่ง (ค่าเริ่มต้น - = stdin)")
+    sub.add_argument('--verbose', action='store_true', help="แสดงผลของทุกคำสั่ง (ปกติแสดงเฉพาะสรุป)")
+    return parser
+
+def run_batch(stream, verbose=False):
+    """ทำคำสั่งจาก stream ทีละบรรทัด แสดงสรุป คืน 0 ถ้าสำเร็จทั้งหมด ไม่งั้น 1"""
+    parser = build_parser(_BatchParser)
+    done, failed, errors = Counter(), Counter(), []
+    start = time.perf_counter()
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, wal.group_commit():
+        output = sys.stdout if verbose else devnull
+        for line_no, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            name = line.split(None, 1)[0]
+            try:
+                args = parser.parse_args(shlex.split(line))
+                if args.command in (None, 'batch'):
+                    raise CommandError("ต้องระบุคำสั่ง (batch ซ้อนกันไม่ได้)")
+                if args.scan:
+                    wal.flush()
+                with contextlib.redirect_stdout(output):
+                    args.handler(args)
+            except (CommandError, lendings.LendingError, ValueError, OSError) as e:
+                failed[name] += 1
+                errors.append((line_no, line, e))
+            else:
+                done[name] += 1
+    seconds = time.perf_counter() - start
+    total = sum(done.values()) + sum(failed.values())
+    print(f"✅ ทำ {total:,} คำสั่ง ใน {seconds:.2f} วินาที ({total / seconds if seconds else 0.0:,.0f} คำสั่ง/วินาที)")
+    for name in sorted(done.keys() | failed.keys()):
+        print(f"   {name:<12} สำเร็จ {done[name]:>8,}  ไม่สำเร็จ {failed[name]:>8,}")
+    if errors:
+        print(f"❌ ไม่สำเร็จ {len(errors):,} คำสั่ง")
+        for line_no, line, e in errors[:MAX_SHOWN_ERRORS]:
+            print(f"   บรรทัด {line_no}: {line} -> {e}")
+        if len(errors) > MAX_SHOWN_ERRORS:
+            print(f"   ... และอีก {len(errors) - MAX_SHOWN_ERRORS:,} คำสั่ง")
+    return 1 if errors else 0
+
+def clear_screen():
+    """ล้างหน้าจอด้วย ANSI escape (ไม่ต้องเปิด subprocess ทุกรอบแบบ os.system('clear'))"""
+    if sys.stdout.isatty():
+        print("\033[2J\033[H", end='', flush=True)
+
+def menu():
+    while True:
+        clear_screen()
+        print("==============================")
+        print("  PyLibMan - ระบบจัดการห้องสมุด")
+        print("==============================")
+        print("1. จัดการหนังสือ")
+        print("2. จัดการสมาชิก")
+        print("3. จัดการการยืม-คืน")
+        print("4. สร้างรายงาน")
+        print("5. สถิติการทำงาน")
+        print("0. ปิดโปรแกรม")
+
+        choice = input("เลือกเมนูหลัก: ")
+
+        if choice == '1':
+            books_menu()
+        elif choice == '2':
+            members_menu()
+        elif choice == '3':
+            lendings_menu()
+        elif choice == '4':
+            report_menu()
+            input("\nกด Enter เพื่อไปต่อ...")
+        elif choice == '5':
+            metrics_menu()
+        elif choice == '0':
+            print("ปิดโปรแกรม")
+            break
+        else:
+            print("ตัวเลือกไม่ถูกต้อง")
+            input("กด Enter เพื่อไปต่อ...")
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # เขียนซ้ำธุรกรรมที่ค้างใน WAL (กรณีโปรแกรมปิดไม่ปกติครั้งก่อน)
+    recovered = wal.recover()
+    if recovered and args.command is None:
+        print(f"กู้คืนธุรกรรมจาก WAL {recovered} รายการ")
+        input("กด Enter เพื่อไปต่อ...")
+    segments.recover()  # archive ครั้งก่อนที่ตัด lendings.dat ไม่เสร็จ
+    if args.command is None:
+        menu()
+        return 0
+    try:
+        return args.handler(args) or 0
+    except (CommandError, lendings.LendingError, ValueError, OSError) as e:
+        print(f"❌ {e}")
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
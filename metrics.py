@@ -0,0 +1,166 @@
+import os, json, time
+from contextlib import nullcontext
+from functools import wraps
+
+# ============================================
+# สถิติการทำงาน: latency histogram ของแต่ละคำสั่ง + ตัวนับ I/O แยกตามไฟล์
+# ============================================
+# ปิดอยู่เป็นค่าเริ่มต้น เปิดด้วย environment variable PYLIBMAN_METRICS=1 หรือจากเมนูหลัก (set_enabled)
+# - operation(name) ครอบช่วงที่เข้าถึงไฟล์ข้อมูลของคำสั่ง (ไม่รวมเวลารอผู้ใช้พิมพ์) ส่วน timed(name)
+#   ใช้ครอบทั้งฟังก์ชัน เวลาแต่ละครั้งเก็บลง histogram แบบ log2: ช่องที่ k = น้อยกว่า 2**k ไมโครวินาที
+# - count_io(filename, ...) ถูกเรียกจากชั้นล่าง (scan, records, wal, record_index ...) นับจำนวน record
+#   ที่อ่านผ่าน, bytes ที่อ่าน/เขียน และจำนวนครั้งที่เปิดไฟล์ ให้กับคำสั่งในสุดที่กำลังทำงานอยู่
+#   ('-' = นอกคำสั่งใด ๆ เช่นตอนเริ่มโปรแกรม) จึงเห็นว่าเวลาของการยืมหมดไปกับไฟล์ไหน
+# ตอนปิด operation() คืน context ว่างตัวเดียวกันทุกครั้ง และผู้เรียก count_io ตรวจ metrics.enabled ก่อน
+# ต้นทุนจึงเหลือการอ่านตัวแปร 1 ครั้งต่อคำสั่ง/ต่อการเข้าถึงไฟล์
+
+METRICS_FILE = 'metrics.json'
+HISTOGRAM_BUCKETS = 28  # ช่องสุดท้ายรวมทุกค่าที่ตั้งแต่ 2**26 ไมโครวินาที (~67 วินาที) ขึ้นไป
+NO_OPERATION = '-'
+
+enabled = os.environ.get('PYLIBMAN_METRICS', '0') not in ('', '0')
+
+_NULL = nullcontext()
+_stack = []  # ชื่อคำสั่งที่กำลังทำงาน (ซ้อนกันได้ เช่น report ภายในคำสั่งของ server)
+_ops = {}  # ชื่อคำสั่ง -> {'count', 'errors', 'total', 'min', 'max', 'histogram'}
+_io = {}  # (ชื่อคำสั่ง, ไฟล์) -> [record ที่อ่านผ่าน, bytes ที่อ่าน, bytes ที่เขียน, จำนวนครั้งที่เปิดไฟล์]
+_since = time.time()
+
+def set_enabled(on):
+    global enabled
+    enabled = bool(on)
+
+def reset():
+    global _since
+    _ops.clear()
+    _io.clear()
+    _since = time.time()
+
+def record_latency(name, seconds, error=False):
+    op = _ops.get(name)
+    if op is None:
+        op = _ops[name] = {'count': 0, 'errors': 0, 'total': 0.0, 'min': seconds, 'max': seconds,
+                           'histogram': [0] * HISTOGRAM_BUCKETS}
+    op['count'] += 1
+    op['errors'] += error
+    op['total'] += seconds
+    op['min'] = min(op['min'], seconds)
+    op['max'] = max(op['max'], seconds)
+    op['histogram'][min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+def count_io(filename, scanned=0, read=0, written=0, opens=0):
+    """บวกตัวนับ I/O ของ filename ให้คำสั่งที่กำลังทำงาน (ผู้เรียกตรวจ enabled ก่อน)"""
+    key = (_stack[-1] if _stack else NO_OPERATION, filename)
+    counters = _io.get(key)
+    if counters is None:
+        counters = _io[key] = [0, 0, 0, 0]
+    counters[0] += scanned
+    counters[1] += read
+    counters[2] += written
+    counters[3] += opens
+
+class _Timer:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        _stack.append(self.name)
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _stack.pop()
+        record_latency(self.name, elapsed, exc_type is not None)
+
+def operation(name):
+    """with operation('borrow'): ... จับเวลาและนับ I/O ภายใน block ให้คำสั่ง name"""
+    return _Timer(name) if enabled else _NULL
+
+def timed(name):
+    """decorator: จับเวลาทั้งฟังก์ชันเป็นคำสั่ง name"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with _Timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# ============================================
+# สรุปผล
+# ============================================
+def _percentile(histogram, count, q, upper):
+    """ค่าประมาณจาก histogram: ขอบบนของช่องที่ครอบ q (ไม่เกินค่ามากสุดที่วัดได้)"""
+    target = q * count
+    seen = 0
+    for k, n in enumerate(histogram):
+        seen += n
+        if n and seen >= target:
+            return min(2 ** k / 1e6, upper)
+    return upper
+
+def snapshot():
+    """dict ของสถิติทั้งหมด (เวลาเป็น ms) พร้อมเขียนเป็น JSON"""
+    operations = {}
+    for name, op in sorted(_ops.items()):
+        count, hist = op['count'], op['histogram']
+        operations[name] = {
+            'count': count,
+            'errors': op['errors'],
+            'total_ms': op['total'] * 1000,
+            'mean_ms': op['total'] / count * 1000,
+            'min_ms': op['min'] * 1000,
+            'max_ms': op['max'] * 1000,
+            'p50_ms': _percentile(hist, count, 0.50, op['max']) * 1000,
+            'p95_ms': _percentile(hist, count, 0.95, op['max']) * 1000,
+            'p99_ms': _percentile(hist, count, 0.99, op['max']) * 1000,
+            # ขอบบนของช่อง (ไมโครวินาที) -> จำนวนครั้ง เฉพาะช่องที่มีค่า
+            'histogram_us': {('inf' if k == HISTOGRAM_BUCKETS - 1 else str(2 ** k)): n
+                             for k, n in enumerate(hist) if n},
+        }
+    io = {}
+    for (name, filename), (scanned, read, written, opens) in sorted(_io.items()):
+        io.setdefault(name, {})[filename] = {
+            'records_scanned': scanned, 'bytes_read': read, 'bytes_written': written, 'file_opens': opens}
+    return {'enabled': enabled, 'since': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(_since)),
+            'operations': operations, 'io': io}
+
+def dump(path=METRICS_FILE):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f, ensure_ascii=False, indent=2)
+    return path
+
+def format_report():
+    """ข้อความตารางสถิติสำหรับแสดงบนหน้าจอ"""
+    data = snapshot()
+    lines = [f"สถิติตั้งแต่ {data['since']} ({'เปิด' if enabled else 'ปิด'}อยู่)"]
+    if not data['operations'] and not data['io']:
+        lines.append("ยังไม่มีข้อมูล")
+        return "\n".join(lines)
+    lines.append(f"{'คำสั่ง':<24}{'ครั้ง':>8}{'ผิดพลาด':>9}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, op in data['operations'].items():
+        lines.append(f"{name:<24}{op['count']:>8}{op['errors']:>9}{op['mean_ms']:>10.3f}"
+                     f"{op['p50_ms']:>10.3f}{op['p99_ms']:>10.3f}{op['max_ms']:>10.3f}")
+    lines.append("")
+    lines.append(f"{'คำสั่ง':<24}{'ไฟล์':<16}{'record':>12}{'อ่าน bytes':>14}{'เขียน bytes':>14}{'เปิดไฟล์':>10}")
+    for name, files in data['io'].items():
+        for filename, c in files.items():
+            lines.append(f"{name:<24}{filename:<16}{c['records_scanned']:>12,}{c['bytes_read']:>14,}"
+                         f"{c['bytes_written']:>14,}{c['file_opens']:>10,}")
+    return "\n".join(lines)
+
+def metrics_menu():
+    while True:
+        print("\n--- 📊 สถิติการทำงาน ---")
+        print(format_report())
+        print(f"\n1. {'ปิด' if enabled else 'เปิด'}การเก็บสถิติ")
+        print(f"2. บันทึกเป็น JSON ({METRICS_FILE})")
+        print("3. ล้างสถิติ")
+        print("0. กลับ")
+        ch = input("เลือก: ")
+        if ch == '1': set_enabled(not enabled)
+        elif ch == '2': print(f"✅ บันทึกสถิติที่ {dump()} เรียบร้อยแล้ว")
+        elif ch == '3': reset()
+        elif ch == '0': break
@@ -0,0 +1,185 @@
+import os, sys, time, argparse
+import locks, record_index, records, strheap, wal
+from scan import iter_records, CHUNK_RECORDS
+from books import BOOKS_FILE, STATUS_ACTIVE
+from members import MEMBERS_FILE
+
+# ============================================
+# แปลงรูปแบบ record ของ books.dat / members.dat (รูปแบบ 1 <-> รูปแบบ 2 ของ strheap.py)
+# ============================================
+# ใช้: python migrate.py [--format 2] [--tables books members]   (--info แสดงรูปแบบและขนาดปัจจุบัน)
+# - รูปแบบ 2 -> 2 ก็ได้: เขียน heap ใหม่เฉพาะข้อความที่ยังถูกอ้างถึง (คืนพื้นที่ของข้อความเก่าจากการแก้ไข/compaction)
+# - รูปแบบ 2 -> 1 ทำได้เฉพาะเมื่อทุกข้อความยาวไม่เกินช่องของรูปแบบ 1 (ไม่ตัดข้อมูลทิ้งเงียบ ๆ)
+# - ID และลำดับ record ไม่เปลี่ยน (record ที่ถูกลบยังอยู่ ใช้ compact.py ตัดออก) lendings.dat จึงไม่ต้องแก้
+# ขั้นตอนเหมือน compaction: ถือ compaction lock + commit lock, ล้าง WAL, เขียน heap/dictionary ของ generation
+# ใหม่และไฟล์ข้อมูลชั่วคราว (header + record) แล้ว os.replace ครั้งเดียวเป็นจุด commit จากนั้นลบ generation เดิม
+# ล่มก่อน os.replace = ไฟล์เดิมไม่เปลี่ยน (heap ใหม่ที่ค้างอยู่ถูกเขียนทับในครั้งถัดไป) ดัชนีทุกตัวสร้างใหม่เองเพราะ inode เปลี่ยน
+# รูปแบบ 2 ไม่ใช่ค่าเริ่มต้น: ประหยัดพื้นที่และเร็วขึ้นเมื่ออ่านเฉพาะฟิลด์ตัวเลข แต่อ่านทั้งไฟล์พร้อม decode string
+# ช้ากว่ารูปแบบ 1 เล็กน้อย (ดู strheap.py) หลังแปลงจะแสดงเวลาทั้งสองแบบก่อน/หลังให้เทียบ ถ้าไม่คุ้มแปลงกลับได้ด้วย --format 1
+MIGRATE_FILES = {'books': BOOKS_FILE, 'members': MEMBERS_FILE}
+
+def _sizes(filename):
+    """(ขนาดไฟล์ข้อมูล, ขนาด heap + dictionary) ของไฟล์ตามรูปแบบปัจจุบัน"""
+    heap = records.layout(filename)[2]
+    extra = 0
+    if heap is not None:
+        extra = sum(os.path.getsize(path) for path in (heap.heap_file, heap.dictionary_file) if os.path.exists(path))
+    return os.path.getsize(filename), extra
+
+def _scan_times(filename):
+    """(เวลาอ่านทั้งไฟล์พร้อม decode string เหมือน view_all_*, เวลาอ่านเฉพาะฟิลด์ตัวเลข) หน่วยวินาที"""
+    start = time.perf_counter()
+    for _ in records.iter_decoded(filename, (STATUS_ACTIVE,)):
+        pass
+    decoded = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in iter_records(filename, records.row_format(filename), (STATUS_ACTIVE,)):
+        pass
+    return decoded, time.perf_counter() - start
+
+def _check_widths(filename, rows, strings):
+    """รูปแบบ 1 เก็บข้อความได้ไม่เกินความยาวช่อง: ข้อความที่ยาวกว่าทำให้แปลงกลับไม่ได้"""
+    for record in rows:
+        for i, width in strings.items():
+            size = len(record[i].encode('utf-8'))
+            if size > width:
+                raise ValueError(f"{filename} ID {record[1]}: ฟิลด์ที่ {i} ยาว {size} bytes เกิน {width} bytes "
+                                 f"ของรูปแบบ 1 แปลงกลับไม่ได้")
+
+def _write_rows(filename, target, out, files):
+    """เขียนทุก record ของไฟล์ (decode แล้ว) ตาม layout target ลง out ทีละชุด คืนจำนวน record"""
+    rec, strings, heap = target
+    count = 0
+    rows = []
+
+    def flush_rows():
+        if heap is None:
+            _check_widths(filename, rows, strings)
+        ops = []
+        data = records.encode_many(filename, rows, ops if heap is not None else None, target)
+        for name, offset, blob in ops:  # heap/dictionary ของ generation ใหม่ยังไม่มีใครอ่าน เขียนตรงไม่ต้องผ่าน WAL
+            files[name].seek(offset)
+            files[name].write(blob)
+            files[name].flush()  # _Writer ชุดถัดไปหาตำแหน่งต่อท้ายจากขนาดไฟล์
+        out.write(b''.join(data))
+        rows.clear()
+
+    for record in records.iter_decoded(filename):
+        rows.append(record)
+        count += 1
+        if len(rows) >= CHUNK_RECORDS:
+            flush_rows()
+    if rows:
+        flush_rows()
+    return count
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def migrate_file(filename, version=2):
+    """
+    แปลง filename เป็นรูปแบบ version (1 หรือ 2) คืนสถิติ
+    {'records', 'from', 'to', 'bytes_before', 'bytes_after', 'scan_before', 'scan_after'} (ขนาดรวม heap/dictionary,
+    เวลาเป็น (decode string, เฉพาะตัวเลข)) หรือ None ถ้าไม่มีไฟล์หรือเป็นรูปแบบ 1 อยู่แล้ว
+    """
+    if not os.path.exists(filename):
+        return None
+    old_generation = strheap.read_generation(filename)
+    if version == 1 and old_generation is None:
+        return None
+    bytes_before, scan_before = sum(_sizes(filename)), _scan_times(filename)
+    with locks.compaction_lock(filename), locks.commit_lock():
+        # ธุรกรรมที่ค้างใน WAL อ้างถึง offset/heap เดิม ต้องเขียนลงไฟล์ให้หมดก่อน
+        wal.flush()
+        wal.checkpoint()
+        old_heap = records.layout(filename)[2]
+        strheap.forget(filename)  # heap ที่เปิดค้างจากการแปลงครั้งก่อนที่ล่มกลางทาง (generation เดียวกัน)
+        generation = None
+        if version == 2:
+            generation = (old_generation or 0) + 1
+        target = records.layout_of(filename, generation)
+        tmp_path = filename + '.migrate'
+        paths = [tmp_path]
+        if generation is not None:
+            paths += [strheap.heap_path(filename, generation), strheap.dictionary_path(filename, generation)]
+        _remove(*paths)  # เศษจากการแปลงครั้งก่อนที่ล่มกลางทาง
+        try:
+            files = {path: open(path, 'wb') for path in paths}
+            try:
+                out = files[tmp_path]
+                if generation is not None:
+                    out.write(strheap.pack_header(generation, target[0].size))
+                count = _write_rows(filename, target, out, files)
+                for f in files.values():
+                    f.flush()
+                    os.fsync(f.fileno())
+            finally:
+                for f in files.values():
+                    f.close()
+        except BaseException:
+            strheap.forget(filename)
+            _remove(*paths)
+            raise
+        os.replace(tmp_path, filename)
+        strheap.forget(filename)
+        if old_heap is not None:
+            _remove(old_heap.heap_file, old_heap.dictionary_file)
+        record_index.rebuild_index(filename, records.record_size(filename))
+    return {
+        'records': count,
+        'from': 1 if old_generation is None else 2,
+        'to': version,
+        'bytes_before': bytes_before,
+        'bytes_after': sum(_sizes(filename)),
+        'scan_before': scan_before,
+        'scan_after': _scan_times(filename),
+    }
+
+def print_info(tables):
+    for table in tables:
+        filename = MIGRATE_FILES[table]
+        if not os.path.exists(filename):
+            print(f"{filename}: ไม่มีไฟล์")
+            continue
+        rec, _, heap = records.layout(filename)
+        rows = (os.path.getsize(filename) - records.data_start(filename)) // rec.size
+        data_bytes, heap_bytes = _sizes(filename)
+        if heap is None:
+            print(f"{filename}: รูปแบบ 1, {rows:,} record x {rec.size} bytes = {data_bytes:,} bytes")
+        else:
+            codes = os.path.getsize(heap.dictionary_file) // strheap.REF_SIZE if os.path.exists(heap.dictionary_file) else 0
+            print(f"{filename}: รูปแบบ 2 (generation {strheap.read_generation(filename)}), {rows:,} record x {rec.size} bytes"
+                  f" = {data_bytes:,} bytes + heap/dictionary {heap_bytes:,} bytes ({codes:,} ค่าใน dictionary)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="แปลงรูปแบบ record ของ books.dat/members.dat (string heap + dictionary)")
+    parser.add_argument('--format', type=int, choices=[1, 2], default=2, dest='version',
+                        help="รูปแบบปลายทาง (ค่าเริ่มต้น 2, 2 ซ้ำ = คืนพื้นที่ heap)")
+    parser.add_argument('--tables', nargs='+', choices=tuple(MIGRATE_FILES), default=tuple(MIGRATE_FILES))
+    parser.add_argument('--info', action='store_true', help="แสดงรูปแบบและขนาดปัจจุบันเท่านั้น")
+    args = parser.parse_args(argv)
+    wal.recover()
+    if args.info:
+        print_info(args.tables)
+        return 0
+    for table in args.tables:
+        filename = MIGRATE_FILES[table]
+        try:
+            stats = migrate_file(filename, args.version)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        if stats is None:
+            print(f"{filename}: ไม่มีไฟล์หรือเป็นรูปแบบ {args.version} อยู่แล้ว")
+            continue
+        (decoded_before, numbers_before), (decoded_after, numbers_after) = stats['scan_before'], stats['scan_after']
+        print(f"✅ {filename}: รูปแบบ {stats['from']} -> {stats['to']}, {stats['records']:,} record, "
+              f"ขนาดรวม {stats['bytes_before']:,} -> {stats['bytes_after']:,} bytes")
+        print(f"   เวลาอ่านทั้งไฟล์ (decode string) {decoded_before * 1000:.1f} -> {decoded_after * 1000:.1f} ms, "
+              f"เฉพาะฟิลด์ตัวเลข {numbers_before * 1000:.1f} -> {numbers_after * 1000:.1f} ms")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,265 @@
+import os, struct, pickle, heapq
+import lendings, metrics, segments, wal
+from scan import iter_chunks, get_struct
+
+# ============================================
+# ดัชนีการยืมที่ยังไม่คืน (open loans) แยกตาม member_id และ book_id
+# ============================================
+# สร้างจาก lendings.dat (record ใหม่ต่อท้าย) + lendings.chg (บันทึกการคืน) แบบเดียวกับรายงาน incremental
+# - lending_id -> (book_id, member_id, วันยืม) เฉพาะที่สถานะยังเป็น 'A'
+# - member_id -> set ของ lending_id, book_id -> set ของ lending_id
+# - สรุปของ segment รายเดือนใน lendings.dat (ดู segments.py) อ่านจากข้อมูลชุดเดียวกันจึงเก็บไว้ที่นี่ด้วย
+# - min-heap ของ (วันยืม, lending_id) เรียงตามวันครบกำหนด (วันยืม + LOAN_DAYS) ให้ overdue.py หา
+#   "เกินกำหนดแล้ว" / "ครบกำหนดถัดไป N รายการ" ใน O(k log n) การคืนไม่ลบออกจาก heap ทันที
+#   (รายการที่ไม่อยู่ใน open แล้วถูกทิ้งตอนดึงผ่าน และ heap ถูกสร้างใหม่เมื่อมีรายการค้างเกินครึ่ง)
+# ยืม/คืนผ่าน lendings.borrow/return_lending จะอัปเดตดัชนีในหน่วยความจำทันที (note_borrow/note_return)
+# ส่วนที่เขียนจากโปรเซสอื่นจะอ่านต่อจากตำแหน่งล่าสุดของทั้งสองไฟล์ตอนเรียกครั้งถัดไป
+# บันทึกลง open_loans.ckpt เมื่อมีการเปลี่ยนแปลงสะสมเกิน SAVE_EVERY รายการ
+OPEN_LOANS_FILE = 'open_loans.ckpt'
+OPEN_LOANS_VERSION = 3
+SAVE_EVERY = 1000
+
+_state = None
+_unsaved = 0  # จำนวนการเปลี่ยนแปลงที่ยังไม่ได้บันทึกลงดิสก์
+
+def _file_id(filename):
+    return os.stat(filename).st_ino if os.path.exists(filename) else None
+
+def _fingerprint(offset):
+    """ส่วนที่ไม่เปลี่ยนของ record สุดท้ายที่อ่านแล้ว (lending_id, book_id, member_id, วันยืม)"""
+    if offset == 0:
+        return None
+    with open(lendings.LENDINGS_FILE, 'rb') as f:
+        f.seek(offset - lendings.LENDING_RECORD_SIZE)
+        return f.read(lendings.LENDING_RECORD_SIZE)[1:21]
+
+def _empty_state():
+    return {
+        'version': OPEN_LOANS_VERSION,
+        'lendings_ino': None, 'lendings_offset': 0, 'tail': None,
+        'changes_ino': None, 'changes_offset': 0,
+        'open': {},  # lending_id -> (book_id, member_id, วันยืม)
+        'by_member': {},  # member_id -> set ของ lending_id
+        'by_book': {},  # book_id -> set ของ lending_id
+        'segments': [],  # สรุปของ segment รายเดือนตามลำดับในไฟล์
+        'due': [],  # heap ของ (วันยืม, lending_id) รวมรายการที่คืนไปแล้วบางส่วน
+    }
+
+def _open(state, lid, bid, mid, borrow_date):
+    state['open'][lid] = (bid, mid, borrow_date)
+    state['by_member'].setdefault(mid, set()).add(lid)
+    state['by_book'].setdefault(bid, set()).add(lid)
+    due = state['due']
+    heapq.heappush(due, (borrow_date, lid))  # วันยืมเพิ่มขึ้นตามลำดับ จึงแทบไม่ต้องสลับตำแหน่ง
+    if len(due) > 2 * len(state['open']) + 1024:
+        due[:] = [(loan[2], lid) for lid, loan in state['open'].items()]
+        heapq.heapify(due)
+
+def _close(state, lid):
+    loan = state['open'].pop(lid, None)
+    if loan is None:
+        return
+    bid, mid, _ = loan
+    segments.note_return(state['segments'], lid)
+    for key, table in ((mid, state['by_member']), (bid, state['by_book'])):
+        ids = table[key]
+        ids.discard(lid)
+        if not ids:
+            del table[key]
+
+def _matches_data(state):
+    """ตรวจว่าดัชนียังต่อยอดจากไฟล์ปัจจุบันได้ (ไฟล์ไม่ถูกแทนที่หรือสั้นลง)"""
+    offset = state['lendings_offset']
+    if offset:
+        if _file_id(lendings.LENDINGS_FILE) != state['lendings_ino']:
+            return False
+        if os.path.getsize(lendings.LENDINGS_FILE) < offset or _fingerprint(offset) != state['tail']:
+            return False
+    if state['changes_ino'] is not None:
+        if _file_id(lendings.LENDING_CHANGES_FILE) != state['changes_ino']:
+            return False
+        if os.path.getsize(lendings.LENDING_CHANGES_FILE) < state['changes_offset']:
+            return False
+    return True
+
+def _catch_up(state):
+    """อ่าน record ที่ต่อท้าย lendings.dat และการคืนใน lendings.chg ที่ยังไม่ได้อ่าน คืนจำนวนรายการ"""
+    count = 0
+    offset = state['lendings_offset']
+    if os.path.exists(lendings.LENDINGS_FILE):
+        rec = get_struct(lendings.LENDING_FORMAT)
+        end = os.path.getsize(lendings.LENDINGS_FILE)  # record ที่ต่อท้ายเพิ่มระหว่างอ่าน ไว้อ่านรอบหน้า
+        for pos, data in iter_chunks(lendings.LENDINGS_FILE, rec.size, offset, end):
+            segments.note_records(state['segments'], data, pos // rec.size)
+            for status, lid, bid, mid, borrow_date, _ in rec.iter_unpack(data):
+                if status == lendings.STATUS_BORROWED:
+                    _open(state, lid, bid, mid, borrow_date)
+            count += len(data) // rec.size
+            offset = pos + len(data)
+        state['lendings_offset'] = offset
+        state['lendings_ino'] = _file_id(lendings.LENDINGS_FILE)
+        state['tail'] = _fingerprint(offset)
+    if os.path.exists(lendings.LENDING_CHANGES_FILE):
+        with open(lendings.LENDING_CHANGES_FILE, 'rb') as f:
+            f.seek(state['changes_offset'])
+            data = f.read()
+        if metrics.enabled:
+            metrics.count_io(lendings.LENDING_CHANGES_FILE, scanned=len(data) // lendings.LENDING_CHANGE_SIZE,
+                             read=len(data), opens=1)
+        data = data[:len(data) - len(data) % lendings.LENDING_CHANGE_SIZE]
+        # lending ที่ไม่อยู่ใน open แปลว่าอ่านสถานะล่าสุดจาก lendings.dat มาแล้ว _close จะข้ามไปเอง
+        for lid, status in struct.iter_unpack(lendings.LENDING_CHANGE_FORMAT, data):
+            if status == lendings.STATUS_RETURNED:
+                _close(state, lid)
+        count += len(data) // lendings.LENDING_CHANGE_SIZE
+        state['changes_offset'] += len(data)
+        state['changes_ino'] = _file_id(lendings.LENDING_CHANGES_FILE)
+    return count
+
+def save_open_loans(state=None):
+    global _unsaved
+    state = state or _state
+    if state is None:
+        return
+    tmp_path = f'{OPEN_LOANS_FILE}.{os.getpid()}.tmp'  # หลายโปรแกรมอาจบันทึกพร้อมกัน
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, OPEN_LOANS_FILE)
+    _unsaved = 0
+
+def _read_saved():
+    if not os.path.exists(OPEN_LOANS_FILE):
+        return None
+    try:
+        with open(OPEN_LOANS_FILE, 'rb') as f:
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    return state if state.get('version') == OPEN_LOANS_VERSION else None
+
+def rebuild_open_loans():
+    """สร้างดัชนีใหม่จาก lendings.dat ทั้งไฟล์"""
+    global _state
+    state = _empty_state()
+    # สถานะใน lendings.dat สะท้อนการคืนที่บันทึกไว้แล้วทั้งหมด จึงเริ่มอ่าน lendings.chg จากท้ายไฟล์
+    if os.path.exists(lendings.LENDING_CHANGES_FILE):
+        state['changes_ino'] = _file_id(lendings.LENDING_CHANGES_FILE)
+        size = os.path.getsize(lendings.LENDING_CHANGES_FILE)
+        state['changes_offset'] = size - size % lendings.LENDING_CHANGE_SIZE
+    _catch_up(state)
+    save_open_loans(state)
+    _state = state
+    return state
+
+def load_open_loans():
+    """คืนดัชนีที่ตรงกับไฟล์ปัจจุบัน (ใช้ที่อยู่ในหน่วยความจำ / โหลดจากดิสก์ / สร้างใหม่)"""
+    global _state, _unsaved
+    state = _state
+    if state is None or not _matches_data(state):
+        state = _read_saved()
+        if state is None or not _matches_data(state):
+            return rebuild_open_loans()
+        _state = state
+    _unsaved += _catch_up(state)
+    if _unsaved >= SAVE_EVERY:
+        save_open_loans(state)
+    return state
+
+def note_borrow(offset, record):
+    """เรียกหลังต่อท้าย record การยืมใหม่ที่ตำแหน่ง offset ของ lendings.dat"""
+    global _unsaved
+    state = _state
+    if state is None or state['lendings_offset'] != offset:
+        return  # ดัชนียังไม่ได้โหลด หรือมี record อื่นที่ยังไม่ได้อ่านอยู่ก่อน (จะอ่านต่อเองรอบหน้า)
+    status, lid, bid, mid, borrow_date, _ = get_struct(lendings.LENDING_FORMAT).unpack(record)
+    if state['lendings_ino'] is None:
+        state['lendings_ino'] = _file_id(lendings.LENDINGS_FILE)
+    segments.note_records(state['segments'], record, offset // len(record))
+    if status == lendings.STATUS_BORROWED:
+        _open(state, lid, bid, mid, borrow_date)
+    state['lendings_offset'] = offset + len(record)
+    state['tail'] = record[1:21]
+    _unsaved += 1
+
+def note_return(change_offset, lending_id):
+    """เรียกหลังบันทึกการคืน lending_id ลง lendings.chg ที่ตำแหน่ง change_offset"""
+    global _unsaved
+    state = _state
+    if state is None or state['changes_offset'] != change_offset:
+        return
+    if state['changes_ino'] is None:
+        state['changes_ino'] = _file_id(lendings.LENDING_CHANGES_FILE)
+    _close(state, lending_id)
+    state['changes_offset'] = change_offset + lendings.LENDING_CHANGE_SIZE
+    _unsaved += 1
+
+# ============================================
+# การค้นหา (รวมธุรกรรมที่ยังรอ flush ในโหมด group commit)
+# ============================================
+def _pending():
+    """การยืม/คืนที่ยังรออยู่ใน WAL: ({lending_id: (book_id, member_id, วันยืม)}, set ของ lending_id ที่คืนแล้ว)"""
+    opened, returned = {}, set()
+    rec = get_struct(lendings.LENDING_FORMAT)
+    for offset, data in wal.pending_records(lendings.LENDINGS_FILE):
+        for pos in range(0, len(data) - rec.size + 1, rec.size):
+            status, lid, bid, mid, borrow_date, _ = rec.unpack_from(data, pos)
+            if status == lendings.STATUS_BORROWED:
+                opened[lid] = (bid, mid, borrow_date)
+            else:
+                opened.pop(lid, None)
+                returned.add(lid)
+    return opened, returned
+
+def _loans(key_index, key):
+    state = load_open_loans()
+    loans = {lid: state['open'][lid] for lid in state[key_index].get(key, ())}
+    opened, returned = _pending()
+    if opened or returned:
+        field = 1 if key_index == 'by_member' else 0  # ตำแหน่ง member_id / book_id ใน (book_id, member_id, วันยืม)
+        loans.update((lid, loan) for lid, loan in opened.items() if loan[field] == key)
+        for lid in returned:
+            loans.pop(lid, None)
+    return [(lid,) + loans[lid] for lid in sorted(loans)]
+
+def by_due_date(after=None, before=None, limit=None):
+    """
+    การยืมที่ยังไม่คืนเรียงตามวันยืม (ครบกำหนดก่อนอยู่ก่อน) [(lending_id, book_id, member_id, วันยืม)]
+    เฉพาะที่ยืมในช่วง [after, before) (timestamp) และไม่เกิน limit รายการ: ดึงจาก heap ทีละรายการแล้วใส่คืน
+    จึงใช้เวลา O(k log n) เมื่อ k = จำนวนที่ยืมก่อน before หรือก่อนรายการที่ limit ไม่ใช่จำนวนที่ค้างทั้งหมด
+    """
+    state = load_open_loans()
+    due, loans = state['due'], state['open']
+    opened, returned = _pending()
+    taken, result = [], []
+    while due and (limit is None or len(result) < limit):
+        borrow_date, lid = due[0]
+        if lid not in loans:
+            heapq.heappop(due)  # คืนไปแล้ว
+            continue
+        if before is not None and borrow_date >= before:
+            break
+        taken.append(heapq.heappop(due))
+        if lid not in returned and (after is None or borrow_date >= after):
+            result.append((lid,) + loans[lid])
+    for item in taken:
+        heapq.heappush(due, item)
+    if opened:
+        extra = sorted(((lid,) + loan for lid, loan in opened.items()
+                        if (after is None or loan[2] >= after) and (before is None or loan[2] < before)),
+                       key=lambda loan: loan[3])
+        result = list(heapq.merge(result, extra, key=lambda loan: loan[3]))[:limit]
+    return result
+
+def loans_by_member(member_id):
+    """การยืมที่ยังไม่คืนของสมาชิก [(lending_id, book_id, member_id, วันยืม)] เรียงตาม lending_id"""
+    return _loans('by_member', member_id)
+
+def loans_by_book(book_id):
+    """การยืมที่ยังไม่คืนของหนังสือเล่มนี้ [(lending_id, book_id, member_id, วันยืม)] เรียงตาม lending_id"""
+    return _loans('by_book', book_id)
+
+def count_by_member(member_id):
+    """จำนวนเล่มที่สมาชิกยืมอยู่"""
+    if not wal.pending_records(lendings.LENDINGS_FILE):
+        return len(load_open_loans()['by_member'].get(member_id, ()))
+    return len(loans_by_member(member_id))
@@ -0,0 +1,149 @@
+import sys, time, datetime, argparse
+try:
+    import numpy as np
+except ImportError:  # ไม่มี numpy: คำนวณค่าปรับทีละรายการด้วย lendings.fine_for (ผลเหมือนกัน)
+    np = None
+import lendings, metrics, open_loans, records, segments, wal
+from books import BOOKS_FILE, STATUS_ACTIVE
+from members import MEMBERS_FILE, STATUS_ACTIVE as MEMBER_ACTIVE
+
+# ============================================
+# รายการยืมที่เกินกำหนด + ค่าปรับค้างชำระทั้งหมด (คำนวณทีละชุด)
+# ============================================
+# กติกาเดียวกับตอนคืน (lendings.fine_for): ยืมได้ LOAN_DAYS วัน เกินจากนั้นวันละ FINE_PER_DAY บาท
+# - รายการที่ยังไม่คืนมาจาก min-heap ตามวันครบกำหนดใน open_loans: "เกินกำหนดแล้ว" ดึงเฉพาะส่วนต้นของ heap
+#   ส่วน "ครบกำหนดถัดไป N รายการ" ดึงต่อจากนั้นอีก N รายการ ไม่ต้องไล่อ่านประวัติการยืมทั้งหมด
+# - ค่าปรับของทุกรายการคำนวณพร้อมกันเป็น array ด้วย NumPy (ถ้าติดตั้งไว้)
+# - ชื่อสมาชิก/หนังสืออ่านผ่านดัชนี ID เฉพาะที่ปรากฏในรายการ
+# รายงานเขียนเป็น overdue_report.txt คู่กับ library_report.txt
+OVERDUE_REPORT_FILE = 'overdue_report.txt'
+NEXT_DUE_COUNT = 10
+
+UNKNOWN_MEMBER = ('ไม่ระบุ', '-')
+UNKNOWN_BOOK = 'ไม่พบชื่อหนังสือ'
+
+def due_date(borrow_date):
+    return borrow_date + lendings.LOAN_DAYS * 86400
+
+def compute_fines(borrow_dates, now):
+    """
+    ค่าปรับ ณ เวลา now ของทุกวันยืมใน borrow_dates พร้อมกัน คืน (วันที่เกินกำหนด, ค่าปรับ) เป็น list ของ int
+    (ค่าปรับเท่ากับ lendings.fine_for ทีละรายการทุกค่า เพราะคำนวณเป็น float แบบเดียวกันแล้วตัดเศษ)
+    """
+    if np is None:
+        late = [int((now - d) / 86400 - lendings.LOAN_DAYS) for d in borrow_dates]
+        return late, [lendings.fine_for(d, now) for d in borrow_dates]
+    days = (now - np.asarray(borrow_dates, dtype=np.float64)) / 86400
+    late = np.trunc(days - lendings.LOAN_DAYS).astype(np.int64)
+    return late.tolist(), np.maximum(0, late * lendings.FINE_PER_DAY).tolist()
+
+def overdue_loans(now=None):
+    """การยืมที่เกินกำหนดแล้ว ณ เวลา now [(lending_id, book_id, member_id, วันยืม)] ครบกำหนดก่อนอยู่ก่อน"""
+    now = time.time() if now is None else now
+    return open_loans.by_due_date(before=now - lendings.LOAN_DAYS * 86400)
+
+def next_due(limit=NEXT_DUE_COUNT, now=None):
+    """limit รายการถัดไปที่จะครบกำหนด (ยังไม่เกินกำหนด ณ เวลา now)"""
+    now = time.time() if now is None else now
+    return open_loans.by_due_date(after=now - lendings.LOAN_DAYS * 86400, limit=limit)
+
+def _names(loans):
+    """({member_id: (ชื่อ, เบอร์โทร)}, {book_id: ชื่อหนังสือ}) ของสมาชิก/หนังสือที่อยู่ใน loans"""
+    members_dict, books_dict = {}, {}
+    for _, bid, mid, _ in loans:
+        if mid not in members_dict:
+            _, member = records.read(MEMBERS_FILE, mid)
+            members_dict[mid] = member[2:4] if member and member[0] == MEMBER_ACTIVE else UNKNOWN_MEMBER
+        if bid not in books_dict:
+            _, book = records.read(BOOKS_FILE, bid)
+            books_dict[bid] = book[3] if book and book[0] == STATUS_ACTIVE else UNKNOWN_BOOK
+    return members_dict, books_dict
+
+def collect_overdue(now=None, next_count=NEXT_DUE_COUNT):
+    """
+    รวบรวมข้อมูลรายงานเกินกำหนด คืน (rows, upcoming, totals)
+    rows = [(lending_id, ชื่อสมาชิก, เบอร์โทร, ชื่อหนังสือ, วันยืม, วันที่เกิน, ค่าปรับ)] ครบกำหนดก่อนอยู่ก่อน
+    upcoming = [(lending_id, ชื่อสมาชิก, ชื่อหนังสือ, วันครบกำหนด)] และ
+    totals = (จำนวนที่เกินกำหนด, ค่าปรับรวม, {member_id: ค่าปรับรวมของสมาชิก})
+    """
+    now = time.time() if now is None else now
+    loans = overdue_loans(now)
+    upcoming = next_due(next_count, now)
+    late, fines = compute_fines([loan[3] for loan in loans], now)
+    members_dict, books_dict = _names(loans + upcoming)
+    rows, by_member = [], {}
+    for (lid, bid, mid, borrow_date), days, fine in zip(loans, late, fines):
+        name, phone = members_dict[mid]
+        rows.append((lid, name, phone, books_dict[bid], borrow_date, days, fine))
+        by_member[mid] = by_member.get(mid, 0) + fine
+    upcoming = [(lid, members_dict[mid][0], books_dict[bid], due_date(borrow_date))
+                for lid, bid, mid, borrow_date in upcoming]
+    return rows, upcoming, (len(rows), sum(fines), by_member)
+
+def _date(ts):
+    return datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d')
+
+def render_overdue(rows, upcoming, totals, now=None):
+    """จัดรูปแบบรายงานเกินกำหนดเป็นข้อความ (หัวรายงานแบบเดียวกับ library_report.txt)"""
+    now = now or datetime.datetime.now()
+    count, total_fine, by_member = totals
+    lines = []
+    lines.append("=" * 120)
+    lines.append("Library Management System – Overdue Report".center(120))
+    lines.append(f"Generated At : {now.strftime('%Y-%m-%d %H:%M:%S')}".center(120))
+    lines.append(f"Loan Period : {lendings.LOAN_DAYS} days, Fine : {lendings.FINE_PER_DAY} baht/day".center(120))
+    lines.append("=" * 120)
+    lines.append("")
+    lines.append(f"{'LID':>10} {'สมาชิก':<30} {'เบอร์โทร':<14} {'หนังสือ':<36} {'ยืม':<10} {'เกิน(วัน)':>9} {'ค่าปรับ':>8}")
+    lines.append("=" * 120)
+    for lid, name, phone, title, borrow_date, days, fine in rows:
+        lines.append(f"{lid:>10} {name:<30} {phone:<14} {title[:36]:<36} {_date(borrow_date):<10} {days:>9} {fine:>8}")
+    lines.append("=" * 120)
+    lines.append("")
+    lines.append(f"Next {len(upcoming)} Due".center(120))
+    lines.append("-" * 120)
+    for lid, name, title, due in upcoming:
+        lines.append(f"{lid:>10} {name:<30} {title[:36]:<36} ครบกำหนด {_date(due)}")
+    lines.append("=" * 120)
+    lines.append("")
+    lines.append("Summary".center(120))
+    lines.append("-" * 120)
+    lines.append(f"- Overdue Loans      : {count}")
+    lines.append(f"- Members With Fines : {sum(1 for fine in by_member.values() if fine)}")
+    lines.append(f"- Fines Outstanding  : {total_fine} baht")
+    lines.append("=" * 120)
+    return "\n".join(lines)
+
+@metrics.timed('overdue')
+def build_overdue_report(now=None, next_count=NEXT_DUE_COUNT):
+    now = now or datetime.datetime.now()
+    rows, upcoming, totals = collect_overdue(now.timestamp(), next_count)
+    return render_overdue(rows, upcoming, totals, now)
+
+def generate_overdue_report(path=OVERDUE_REPORT_FILE, next_count=NEXT_DUE_COUNT):
+    text = build_overdue_report(next_count=next_count)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    print(f"✅ สร้างรายงาน {path} เรียบร้อยแล้ว")
+
+def view_next_due():
+    loans = next_due()
+    if not loans:
+        print("ไม่มีรายการที่ใกล้ครบกำหนด"); return
+    print(f"\n--- ⏰ {len(loans)} รายการที่จะครบกำหนดถัดไป ---")
+    for lid, bid, mid, borrow_date in loans:
+        print(f"LID:{lid}, BookID:{bid}, MemberID:{mid}, ยืม:{_date(borrow_date)}, ครบกำหนด:{_date(due_date(borrow_date))}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="สร้างรายงานการยืมที่เกินกำหนดและค่าปรับค้างชำระ")
+    parser.add_argument('--next', type=int, default=NEXT_DUE_COUNT, dest='next_count',
+                        help="จำนวนรายการที่จะครบกำหนดถัดไปที่แสดงท้ายรายงาน")
+    parser.add_argument('--output', default=OVERDUE_REPORT_FILE)
+    args = parser.parse_args(argv)
+    wal.recover()
+    segments.recover()
+    generate_overdue_report(args.output, args.next_count)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,261 @@
+import re, json, math, time, heapq, operator, itertools
+import books, lendings, locks, members, metrics, records, segments
+from scan import iter_chunks, get_struct
+
+# ============================================
+# ชั้น query ของไฟล์ข้อมูล: กรองบน bytes ดิบ, เรียงตามฟิลด์ใดก็ได้, top-k และแบ่งหน้าด้วย cursor
+# ============================================
+# select(table, where, order_by, desc, limit, after) -> (แถวที่ decode แล้ว, cursor ของหน้าถัดไปหรือ None)
+# - where: [(ชื่อฟิลด์, op, ค่า)] op = '=', '!=', '<', '<=', '>', '>=', 'in' (ค่าเป็นชุด) ทุกเงื่อนไขต้องเป็นจริง
+#   ไฟล์ถูกอ่านทีละก้อน (scan.iter_chunks) แล้ว unpack ด้วย struct "แคบ" ที่มีเฉพาะฟิลด์ที่ใช้กรอง/เรียง + ID
+#   (ฟิลด์อื่นเป็น pad byte) เงื่อนไขจึงถูกตรวจก่อน decode: ไม่สร้าง string ของแถวที่ไม่ผ่าน
+#   ฟิลด์ string ของรูปแบบ 2 แปลงเป็นข้อความเฉพาะฟิลด์ที่ถูกใช้ของแถวที่ผ่านเงื่อนไขตัวเลขแล้ว
+# - order_by: ชื่อฟิลด์ (ค่าเริ่มต้น ID) ลำดับที่เท่ากันตัดสินด้วย ID ลำดับจึงแน่นอนเสมอ
+# - limit: top-k ด้วย heapq.nsmallest/nlargest เก็บแค่ (key, ID, ไฟล์, ตำแหน่ง) ของ k แถวที่ดีที่สุดระหว่างอ่าน
+#   แล้ว decode เต็มแถวเฉพาะ k แถวนั้น
+# - after: cursor = (key, ID) ของแถวสุดท้ายของหน้าก่อน หน้าถัดไป = แถวที่อยู่หลัง cursor ตามลำดับที่ขอ
+#   (ไม่ต้องนับ offset และไม่ซ้ำ/ตกหล่นเมื่อมีการเพิ่ม/ลบ record ระหว่างดูทีละหน้า)
+# lendings อ่านจาก archive + lendings.dat ผ่าน segments.lending_ranges(): เงื่อนไขช่วง borrow_date และ
+# สถานะ 'ยืมอยู่' ข้าม segment ที่ไม่เกี่ยวข้องทั้ง segment
+# ID ถูกแจกเพิ่มขึ้นเสมอและ record ถูกต่อท้ายตามลำดับนั้น (compaction / archive / migrate คงลำดับ) ลำดับในไฟล์
+# จึงเป็นลำดับ ID: การเรียงตาม ID จากน้อยไปมาก (ค่าเริ่มต้นของ view) หยุดอ่านได้ทันทีที่ได้ครบหน้า
+# และข้ามก้อนที่ ID สุดท้ายยังไม่ถึง cursor โดยไม่ต้อง unpack
+# ตลอดการอ่านถือ scan lock ของไฟล์หลัก (compaction / archive / migrate ต้องรอ) ตำแหน่งที่จำไว้จึงยังถูกต้องตอน decode
+FIELDS = {
+    'books': ('status', 'book_id', 'isbn', 'title', 'author', 'qty'),
+    'members': ('status', 'member_id', 'name', 'phone'),
+    'lendings': ('status', 'lending_id', 'book_id', 'member_id', 'borrow_date', 'return_date'),
+}
+DATE_FIELDS = ('borrow_date', 'return_date')  # รับค่าเป็น YYYY-MM-DD ได้
+# สถานะที่แสดงเมื่อผู้ใช้ไม่ได้กรอง status เอง (ไม่แสดง record ที่ถูกลบ)
+VISIBLE_STATUSES = {
+    'books': frozenset((books.STATUS_ACTIVE,)),
+    'members': frozenset((members.STATUS_ACTIVE,)),
+    'lendings': frozenset((lendings.STATUS_BORROWED, lendings.STATUS_RETURNED)),
+}
+PAGE_SIZE = 20
+EXAMPLES = {'books': 'qty>=2; author=สมชาย ใจดี', 'members': 'member_id<100',
+            'lendings': 'status=A; borrow_date>=2024-01-01'}
+OPERATORS = {
+    '=': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+    'in': lambda value, wanted: value in wanted,
+}
+CONDITION_RE = re.compile(r'^\s*(\w+)\s*(!=|<=|>=|=|<|>)\s*(.*?)\s*$')
+
+def table_file(table):
+    return {'books': books.BOOKS_FILE, 'members': members.MEMBERS_FILE, 'lendings': lendings.LENDINGS_FILE}[table]
+
+def _field_index(table, name):
+    names = FIELDS[table]
+    if name == 'id':
+        return 1
+    if name not in names:
+        raise ValueError(f"ตาราง {table} ไม่มีฟิลด์ {name} (มี {', '.join(names)})")
+    return names.index(name)
+
+def _columns(current):
+    """[(token, ชนิด)] ของแต่ละฟิลด์ใน record ตาม layout ปัจจุบัน ชนิด = 'status', 'str', 'int' หรือ 'float'"""
+    rec, strings, _ = current
+    columns = []
+    for count, code in records.FORMAT_FIELD_RE.findall(rec.format):
+        tokens = [count + code] if code == 's' else [code] * int(count or 1)
+        for token in tokens:
+            i = len(columns)
+            kind = ('str' if i in strings else 'status' if code == 'c' else
+                    'float' if code in 'fd' else 'int')
+            columns.append((token, kind))
+    return columns
+
+def _convert(name, kind, text):
+    """ค่าจากข้อความที่ผู้ใช้พิมพ์ -> ค่าที่เทียบกับฟิลด์ได้ (ValueError ถ้าแปลงไม่ได้)"""
+    try:
+        if kind == 'status':
+            return text.encode('ascii')
+        if kind == 'str':
+            return text
+        if kind == 'int':
+            return int(text)
+        if name in DATE_FIELDS and '-' in text:
+            return time.mktime(time.strptime(text, '%Y-%m-%d'))
+        return float(text)
+    except (ValueError, UnicodeEncodeError):
+        raise ValueError(f"ค่าของ {name} ไม่ถูกต้อง: {text}") from None
+
+def parse_where(table, text):
+    """
+    'qty>=2; status=A' -> [('qty', '>=', 2), ('status', '=', b'A')] (ValueError ถ้าไม่ถูกต้อง)
+    เงื่อนไขคั่นด้วย ; ค่าของฟิลด์ที่ไม่ใช่ string คั่นด้วย | เป็น 'in' เช่น status=A|R
+    """
+    columns = _columns(records.layout(table_file(table)))
+    where = []
+    for part in text.split(';'):
+        if not part.strip():
+            continue
+        match = CONDITION_RE.match(part)
+        if not match:
+            raise ValueError(f"เงื่อนไขไม่ถูกต้อง: {part.strip()} (ตัวอย่าง qty>=2)")
+        name, op, value = match.groups()
+        kind = columns[_field_index(table, name)][1]
+        if op == '=' and kind != 'str' and '|' in value:
+            where.append((name, 'in', frozenset(_convert(name, kind, v.strip()) for v in value.split('|'))))
+        else:
+            where.append((name, op, _convert(name, kind, value)))
+    return where
+
+def visible(table, where):
+    """where + เงื่อนไขสถานะของ VISIBLE_STATUSES ถ้า where ไม่ได้กรอง status เอง"""
+    where = list(where)
+    if not any(name == 'status' for name, _, _ in where):
+        where.insert(0, ('status', 'in', VISIBLE_STATUSES[table]))
+    return where
+
+def _check(conditions):
+    """[(ตำแหน่งใน tuple, op, ค่า)] -> ฟังก์ชัน row -> bool (None ถ้าไม่มีเงื่อนไข)"""
+    check = None
+    # ตรวจเงื่อนไข '=' ก่อน (มักตัดแถวทิ้งได้มากที่สุด) แล้วต่อ closure เป็นทอด ๆ แทน all() ที่ต้องสร้าง generator ทุกแถว
+    for pos, op, value in sorted(conditions, key=lambda c: c[1] != '=', reverse=True):
+        test = OPERATORS[op]
+        if check is None:
+            check = lambda row, pos=pos, test=test, value=value: test(row[pos], value)
+        else:
+            check = lambda row, pos=pos, test=test, value=value, rest=check: test(row[pos], value) and rest(row)
+    return check
+
+def _lending_bounds(where):
+    """(start, end, statuses) สำหรับ segments.lending_ranges() จากเงื่อนไขของ borrow_date และ status"""
+    start = end = statuses = None
+    for name, op, value in where:
+        if name == 'borrow_date':
+            if op in ('>', '>=', '='):
+                start = value if start is None else max(start, value)
+            if op in ('<', '<=', '='):
+                value = value if op == '<' else math.nextafter(value, math.inf)
+                end = value if end is None else min(end, value)
+        elif name == 'status' and op in ('=', 'in'):
+            statuses = (value,) if op == '=' else tuple(value)
+    return start, end, statuses
+
+def _text(current, index, value):
+    heap = current[2]
+    return records.unpack_string(bytes(value)) if heap is None else heap.text(index, int(value))
+
+def _candidates(table, filename, current, where, order_by, desc, after):
+    """วนคืน (key, ID, ไฟล์, ตำแหน่ง) ของแถวที่ผ่านทุกเงื่อนไขและอยู่หลัง cursor (เรียกภายใต้ scan lock)"""
+    rec = current[0]
+    columns = _columns(current)
+    key_index = _field_index(table, order_by)
+    numeric, strings = [], []
+    for name, op, value in where:
+        index = _field_index(table, name)
+        (strings if columns[index][1] == 'str' else numeric).append((index, op, value))
+    # struct แคบ: unpack เฉพาะ ID + ฟิลด์ที่ใช้ ฟิลด์อื่นข้ามด้วย pad byte
+    used = sorted({1, key_index} | {index for index, _, _ in numeric + strings})
+    narrow = get_struct('< ' + ' '.join(token if i in used else f'{get_struct("<" + token).size}x'
+                                        for i, (token, _) in enumerate(columns)))
+    at = {index: n for n, index in enumerate(used)}
+    check_numeric = _check([(at[index], op, value) for index, op, value in numeric])
+    string_tests = [(at[index], index, OPERATORS[op], value) for index, op, value in strings]
+    key_pos, id_pos, key_kind = at[key_index], at[1], columns[key_index][1]
+    follows = operator.lt if desc else operator.gt  # แถวที่อยู่หลัง cursor ตามลำดับที่ขอ
+    after = tuple(after) if after is not None else None
+    skip_to = after[1] if after is not None and key_index == 1 and not desc else None
+
+    if table == 'lendings':
+        ranges = list(segments.lending_ranges(*_lending_bounds(where)))
+    else:
+        ranges = [(filename, records.data_start(filename), None)]
+    for path, start, stop in ranges:
+        for offset, chunk in iter_chunks(path, rec.size, start, stop):
+            if skip_to is not None and int.from_bytes(chunk[-rec.size + 1:-rec.size + 5], 'little', signed=True) <= skip_to:
+                continue
+            for n, row in enumerate(narrow.iter_unpack(chunk)):
+                if check_numeric is not None and not check_numeric(row):
+                    continue
+                if string_tests and not all(test(_text(current, index, row[pos]), value)
+                                            for pos, index, test, value in string_tests):
+                    continue
+                key = row[key_pos]
+                if key_kind == 'str':
+                    key = _text(current, key_index, key)
+                elif key_kind == 'status':
+                    key = key.decode('ascii')  # cursor เป็น JSON ได้
+                if after is not None and not follows((key, row[id_pos]), after):
+                    continue
+                yield key, row[id_pos], path, offset + n * rec.size
+
+def select(table, where=(), order_by=None, desc=False, limit=None, after=None):
+    """
+    แถว (tuple ที่ decode แล้ว) ของ table ที่ผ่านทุกเงื่อนไขใน where เรียงตาม order_by (desc = มากไปน้อย)
+    limit: จำนวนแถวสูงสุด (top-k) after: cursor ที่ได้จากหน้าก่อน
+    คืน (แถว, cursor ของหน้าถัดไป) cursor เป็น None เมื่อไม่มีหน้าถัดไป
+    """
+    filename = table_file(table)
+    order_by = order_by or FIELDS[table][1]
+    with locks.scan_lock(filename):
+        current = records.layout(filename)  # ภายใต้ scan lock: การแปลงรูปแบบไฟล์ต้องรอจนอ่านเสร็จ
+        found = _candidates(table, filename, current, list(where), order_by, desc, after)
+        if limit is None:
+            chosen = sorted(found, reverse=desc)
+        elif order_by in ('id', FIELDS[table][1]) and not desc:
+            chosen = list(itertools.islice(found, limit + 1))  # ลำดับในไฟล์ = ลำดับ ID
+            found.close()
+        else:
+            chosen = (heapq.nlargest if desc else heapq.nsmallest)(limit + 1, found)
+        more = limit is not None and len(chosen) > limit
+        chosen = chosen[:limit] if more else chosen
+        rows, files = [], {}
+        try:
+            for key, record_id, path, pos in chosen:
+                if path not in files:
+                    files[path] = open(path, 'rb')
+                files[path].seek(pos)
+                rows.append(records.decode(filename, files[path].read(current[0].size), current))
+        finally:
+            for f in files.values():
+                f.close()
+    cursor = list(chosen[-1][:2]) if more else None
+    return rows, cursor
+
+# ============================================
+# แสดงผลทีละหน้า (ใช้โดย view_all_books / view_all_members / view_lendings)
+# ============================================
+def ask(table):
+    """ถามเงื่อนไขและการเรียงจากผู้ใช้ คืน (where, order_by, desc) (ValueError ถ้าพิมพ์ไม่ถูกต้อง)"""
+    print(f"ฟิลด์: {', '.join(FIELDS[table])}")
+    where = parse_where(table, input(f"กรอง (เช่น {EXAMPLES[table]}, เว้นว่าง = ทั้งหมด): "))
+    order = input("เรียงตาม (ชื่อฟิลด์, - นำหน้า = มากไปน้อย, เว้นว่าง = ID): ").strip()
+    desc = order.startswith('-')
+    order = order.lstrip('-').strip() or None
+    if order is not None:
+        _field_index(table, order)
+    return where, order, desc
+
+def page_through(table, show, where=(), order_by=None, desc=False, page_size=PAGE_SIZE, operation=None):
+    """
+    แสดงผลของ select() หน้าละ page_size แถวด้วย show(row) แล้วถามก่อนแสดงหน้าถัดไป
+    operation: ชื่อคำสั่งใน metrics สำหรับจับเวลาการดึงแต่ละหน้า (ไม่รวมเวลารอผู้ใช้)
+    """
+    cursor, shown = None, 0
+    while True:
+        with metrics.operation(operation or f'query_{table}'):
+            rows, cursor = select(table, where, order_by, desc, page_size, cursor)
+            for row in rows:
+                show(row)
+        shown += len(rows)
+        if cursor is None:
+            break
+        if input(f"-- แสดงแล้ว {shown:,} แถว: Enter = หน้าถัดไป, q = หยุด -- ").strip().lower() == 'q':
+            break
+    if shown == 0:
+        print("ไม่พบข้อมูลตามเงื่อนไข")
+    return shown
+
+def format_cursor(cursor):
+    return json.dumps(cursor, ensure_ascii=False)
+
+def parse_cursor(text):
+    """cursor ที่ format_cursor() แสดง -> [key, ID] (ValueError ถ้าไม่ถูกต้อง)"""
+    cursor = json.loads(text)
+    if not isinstance(cursor, list) or len(cursor) != 2:
+        raise ValueError(f"cursor ไม่ถูกต้อง: {text}")
+    return cursor
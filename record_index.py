@@ -0,0 +1,163 @@
+import struct, os
+import metrics, wal
+
+# ============================================
+# ดัชนี Primary Key (ID -> ตำแหน่ง record) สำหรับไฟล์ .dat
+# ============================================
+# ไฟล์ดัชนีเก็บคู่กับไฟล์ข้อมูล เช่น books.dat -> books.idx
+# header : ขนาดไฟล์ .dat (8 bytes) + inode (8 bytes) ณ เวลาที่ดัชนีตรงกับข้อมูล
+# entry  : id (4 bytes) + ลำดับ record/slot (4 bytes) ต่อท้ายไปเรื่อย ๆ (entry หลังทับ entry ก่อน)
+# การเขียนทับ record เดิม (update/delete/ยืม/คืน) ไม่เปลี่ยนทั้ง ID, slot, ขนาดไฟล์ และ inode
+# ดัชนีจึงยังใช้ได้ทันที ส่วนการต่อท้ายไฟล์ต้องเรียก note_append() เพื่อเพิ่ม entry
+# ถ้าไฟล์ดัชนีหายหรือ header ไม่ตรงกับไฟล์ .dat จะสร้างใหม่จากไฟล์ .dat อัตโนมัติ
+INDEX_HEADER_FORMAT = '< q Q'
+INDEX_HEADER_SIZE = struct.calcsize(INDEX_HEADER_FORMAT)
+INDEX_ENTRY_FORMAT = '< i i'
+INDEX_ENTRY_SIZE = struct.calcsize(INDEX_ENTRY_FORMAT)
+
+STATUS_DELETED = b'D'
+
+_cache = {}  # filename -> (stamp, {id: slot}) ดัชนีที่โหลดไว้แล้วในโปรเซสนี้
+
+def index_path(filename):
+    """books.dat -> books.idx"""
+    return os.path.splitext(filename)[0] + '.idx'
+
+def _stamp(filename):
+    st = os.stat(filename)
+    return (st.st_size, st.st_ino)
+
+def _read_index_file(filename, stamp):
+    """โหลดไฟล์ดัชนีจากดิสก์ (คืน None ถ้าไม่มีหรือไม่ตรงกับไฟล์ .dat)"""
+    path = index_path(filename)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        data = f.read()
+    if metrics.enabled:
+        metrics.count_io(path, read=len(data), opens=1)
+    if len(data) < INDEX_HEADER_SIZE or struct.unpack_from(INDEX_HEADER_FORMAT, data) != stamp:
+        return None
+    body = memoryview(data)[INDEX_HEADER_SIZE:]
+    body = body[:len(body) - len(body) % INDEX_ENTRY_SIZE]
+    index = {}
+    for record_id, slot in struct.iter_unpack(INDEX_ENTRY_FORMAT, body):
+        index[record_id] = slot
+    return index
+
+def rebuild_index(filename, record_size):
+    """อ่านไฟล์ .dat ทั้งไฟล์ครั้งเดียวเพื่อสร้างดัชนีใหม่ แล้วเขียนลงดิสก์"""
+    index = {}
+    with open(filename, 'rb') as f:
+        data = f.read()
+        stamp = (len(data), os.fstat(f.fileno()).st_ino)
+    if metrics.enabled:
+        metrics.count_io(filename, scanned=len(data) // record_size, read=len(data), opens=1)
+    for slot in range(len(data) // record_size):
+        pos = slot * record_size
+        record_id = struct.unpack_from('<i', data, pos + 1)[0]
+        # ID ซ้ำ: record ที่ยังไม่ถูกลบชนะ record ที่ถูกลบ, นอกนั้น record หลังชนะ
+        if data[pos:pos + 1] != STATUS_DELETED or record_id not in index:
+            index[record_id] = slot
+    path = index_path(filename)
+    tmp_path = f'{path}.{os.getpid()}.tmp'  # แยกตามโปรเซส (หลายโปรแกรมอาจสร้างพร้อมกัน)
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack(INDEX_HEADER_FORMAT, *stamp))
+        f.write(b''.join(struct.pack(INDEX_ENTRY_FORMAT, rid, slot) for rid, slot in index.items()))
+    os.replace(tmp_path, path)
+    _cache[filename] = (stamp, index)
+    return index
+
+def load_index(filename, record_size):
+    """คืน dict {id: slot} ที่ตรงกับไฟล์ .dat ปัจจุบัน"""
+    if not os.path.exists(filename):
+        return {}
+    stamp = _stamp(filename)
+    cached = _cache.get(filename)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    index = _read_index_file(filename, stamp)
+    if index is None:
+        return rebuild_index(filename, record_size)
+    _cache[filename] = (stamp, index)
+    return index
+
+def find_offset(filename, record_size, record_id):
+    """คืนตำแหน่ง byte ของ record ที่มี ID นี้ (None ถ้าไม่พบ)"""
+    slot = load_index(filename, record_size).get(record_id)
+    return None if slot is None else slot * record_size
+
+def read_by_id(f, filename, record_size, record_id):
+    """
+    seek ครั้งเดียว + read ครั้งเดียว เพื่ออ่าน record ตาม ID จากไฟล์ที่เปิดไว้แล้ว (f เป็น None = เปิดเอง)
+    รวมธุรกรรมที่ยังรอ flush ใน WAL ด้วย คืน (pos, record) หรือ (None, None) ถ้าไม่พบ
+    """
+    for attempt in range(2):
+        pos = wal.find_pending(filename, record_id)
+        if pos is None:
+            pos = find_offset(filename, record_size, record_id)
+        if pos is None:
+            return None, None
+        record = wal.read_at(f, filename, pos, record_size)
+        if len(record) == record_size and struct.unpack_from('<i', record, 1)[0] == record_id:
+            return pos, record
+        # ดัชนีไม่ตรงกับข้อมูล (เช่นไฟล์ถูกแก้จากภายนอก) -> สร้างใหม่แล้วลองอีกครั้ง
+        rebuild_index(filename, record_size)
+    return None, None
+
+def note_append(filename, record_size, record_id, offset):
+    """เรียกหลังต่อท้าย record ใหม่ที่ตำแหน่ง offset เพื่อให้ดัชนีบนดิสก์ตรงกับไฟล์ .dat"""
+    note_append_many(filename, record_size, [record_id], offset)
+
+def note_append_many(filename, record_size, record_ids, offset):
+    """เหมือน note_append แต่สำหรับหลาย record ที่ต่อท้ายติดกันเริ่มที่ offset (เช่น bulk import)"""
+    new_stamp = _stamp(filename)
+    old_stamp = (offset, new_stamp[1])
+    first_slot = offset // record_size
+    cached = _cache.pop(filename, None)
+    path = index_path(filename)
+    if not os.path.exists(path):
+        return  # ยังไม่เคยสร้างดัชนี จะสร้างเมื่อค้นหาครั้งแรก
+    with open(path, 'r+b') as f:
+        header = f.read(INDEX_HEADER_SIZE)
+        if len(header) < INDEX_HEADER_SIZE or struct.unpack(INDEX_HEADER_FORMAT, header) != old_stamp:
+            return  # ดัชนีล้าสมัยอยู่แล้ว ปล่อยให้สร้างใหม่ภายหลัง
+        f.seek(0, os.SEEK_END)
+        f.write(b''.join(struct.pack(INDEX_ENTRY_FORMAT, record_id, first_slot + i)
+                         for i, record_id in enumerate(record_ids)))
+        f.seek(0)
+        f.write(struct.pack(INDEX_HEADER_FORMAT, *new_stamp))
+    if cached and cached[0] == old_stamp:
+        for i, record_id in enumerate(record_ids):
+            cached[1][record_id] = first_slot + i
+        _cache[filename] = (new_stamp, cached[1])
+
+# ============================================
+# ID สูงสุดที่เคยใช้ (high-water mark)
+# ============================================
+# ID ใหม่ = ID ของ record สุดท้ายในไฟล์ + 1 แต่ compaction อาจตัด record ที่ถูกลบออกจากท้ายไฟล์
+# จึงบันทึก ID สูงสุดไว้ใน .seq (เช่น books.seq) เพื่อไม่ให้ ID เดิมถูกนำกลับมาใช้
+# (lendings.dat ยังอ้างถึง book_id/member_id เดิมอยู่)
+SEQ_FORMAT = '< i'
+
+def seq_path(filename):
+    """books.dat -> books.seq"""
+    return os.path.splitext(filename)[0] + '.seq'
+
+def read_high_water(filename):
+    """ID สูงสุดที่บันทึกไว้ (0 ถ้ายังไม่เคยบันทึก)"""
+    path = seq_path(filename)
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as f:
+        data = f.read(struct.calcsize(SEQ_FORMAT))
+    return struct.unpack(SEQ_FORMAT, data)[0] if len(data) == struct.calcsize(SEQ_FORMAT) else 0
+
+def save_high_water(filename, last_id):
+    path = seq_path(filename)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack(SEQ_FORMAT, last_id))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
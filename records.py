@@ -0,0 +1,277 @@
+import os, re, mmap
+from collections import OrderedDict
+import locks, metrics, record_index, strheap, wal
+from scan import get_struct, CHUNK_RECORDS
+
+# ============================================
+# การเข้าถึง record ร่วมกันของทุกไฟล์ข้อมูล + LRU cache ของ record ที่ decode แล้ว
+# ============================================
+# books.py / members.py / lendings.py ลงทะเบียนรูปแบบ record ของตัวเองด้วย register()
+# read() อ่าน record ตาม ID (seek + read ครั้งเดียวผ่าน record_index) แล้วคืน tuple ที่ decode string แล้ว
+# cache เก็บ (filename, record_id) -> (bytes ดิบ, tuple ที่ decode แล้ว) ไม่เกิน CACHE_SIZE รายการ
+# - ใช้ค่าใน cache เฉพาะเมื่อ bytes ที่เพิ่งอ่านตรงกับที่เก็บไว้ทุก byte: การแก้ไขจากโปรแกรมอื่น
+#   หรือ compaction จึงไม่มีทางได้ค่าเก่า (การอ่านจากดิสก์ยังต้องทำเพื่อให้เห็นข้อมูลล่าสุด
+#   ส่วนที่ประหยัดคือ struct.unpack + decode UTF-8)
+# - ทุกการเขียนผ่าน wal.commit (แก้ไขในที่ / tombstone / ต่อท้าย) ลบรายการของ ID นั้นออกจาก cache ทันที
+# - iter_decoded() ใช้ cache เฉพาะไฟล์ที่มี record ไม่เกิน CACHE_SIZE (ไฟล์ใหญ่กว่านั้นอ่านผ่านไป
+#   โดยไม่ใส่ cache เพื่อไม่ไล่ record ที่ใช้บ่อยทิ้งหมด)
+#
+# ไฟล์ที่มีฟิลด์ string เก็บได้สองรูปแบบ (ดู strheap.py): รูปแบบ 1 = ช่อง string ตายตัวใน record,
+# รูปแบบ 2 = ref/รหัส dictionary ไปยัง string heap  layout() ตรวจรูปแบบจาก record แรกของไฟล์
+# (ตรวจใหม่เมื่อ inode เปลี่ยน) tuple ที่ decode แล้วเหมือนกันทั้งสองรูปแบบ ผู้เขียนจึงใช้
+# encode()/encode_many()/modify() แทน struct.pack เอง (รูปแบบ 2 ต้องต่อท้าย heap ในธุรกรรมเดียวกัน)
+CACHE_SIZE = 10000
+FORMAT_FIELD_RE = re.compile(r'(\d*)([a-zA-Z?])')
+
+_layouts = {}  # filename -> (Struct รูปแบบ 1, {ตำแหน่งฟิลด์ string: ความยาว}, Struct รูปแบบ 2, ฟิลด์ dictionary)
+_formats = {}  # filename -> (inode, layout ปัจจุบัน)
+_cache = OrderedDict()  # (filename, record_id) -> (bytes ดิบ, tuple ที่ decode แล้ว)
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+def pack_string(s, length):
+    """แปลง string เป็น bytes fixed length (ข้อความที่ยาวเกินถูกตัดที่ขอบตัวอักษร ไม่ตัดกลาง UTF-8)"""
+    data = s.encode('utf-8')
+    if len(data) > length:
+        data = data[:length].decode('utf-8', 'ignore').encode('utf-8')
+    return data.ljust(length, b'\x00')
+
+def unpack_string(b):
+    """แปลง bytes fixed length เป็น string (ไม่สนใจตัวอักษรที่ถูกตัดครึ่งไว้ท้ายช่องโดยข้อมูลเก่า)"""
+    return b.rstrip(b'\x00').decode('utf-8', 'ignore')
+
+def get_last_id(filename, record_size):
+    """ดึง ID ล่าสุดในไฟล์ (return 0 ถ้าไฟล์ว่าง) รวม ID สูงสุดที่บันทึกไว้ตอน compaction"""
+    high_water = record_index.read_high_water(filename)
+    size = wal.file_size(filename)  # รวม record ที่ยังรอ flush ใน WAL
+    if size == 0:
+        return high_water
+    record = wal.read_at(None, filename, size - record_size, record_size)
+    return max(int.from_bytes(record[1:5], 'little', signed=True), high_water)
+
+def register(filename, record_format, dictionary=()):
+    """
+    ลงทะเบียนรูปแบบ record ของไฟล์ (ฟิลด์ 's' จะถูก decode เป็น string)
+    dictionary: ตำแหน่งฟิลด์ string ที่รูปแบบ 2 เก็บเป็นรหัส dictionary (ค่าที่ซ้ำกันมาก)
+    """
+    strings, index, tokens = {}, 0, []
+    for count, code in FORMAT_FIELD_RE.findall(record_format):
+        if code == 's':
+            strings[index] = int(count or 1)
+            tokens.append('I' if index in dictionary else 'Q')
+            index += 1
+        else:
+            tokens.append(count + code)
+            index += int(count or 1)
+    packed = get_struct('< ' + ' '.join(tokens)) if strings else None
+    _layouts[filename] = (get_struct(record_format), strings, packed, frozenset(dictionary))
+
+def layout_of(filename, generation=None):
+    """(Struct, {ตำแหน่งฟิลด์ string: ความยาว}, StringHeap หรือ None) ของรูปแบบ 1 (generation None) หรือรูปแบบ 2"""
+    rec, strings, packed, dictionary = _layouts[filename]
+    if generation is None or packed is None:
+        return rec, strings, None
+    return packed, strings, strheap.get_heap(filename, generation, dictionary)
+
+def layout(filename):
+    """layout_of() ตามรูปแบบที่ไฟล์เก็บอยู่จริง (ไฟล์ที่ไม่มีฟิลด์ string เป็นรูปแบบ 1 เสมอ ไม่ต้องตรวจไฟล์)"""
+    if _layouts[filename][2] is None:
+        return layout_of(filename)
+    try:
+        ino = os.stat(filename).st_ino
+    except FileNotFoundError:
+        ino = None
+    cached = _formats.get(filename)
+    if cached is None or cached[0] != ino:
+        current = layout_of(filename, strheap.read_generation(filename))
+        if cached is not None and cached[1] != current:
+            # ไฟล์ถูกแปลงรูปแบบ: bytes เดียวกันอาจหมายถึงข้อความอื่นใน heap ใหม่ ทิ้ง cache ของไฟล์นี้ทั้งหมด
+            for key in [key for key in _cache if key[0] == filename]:
+                del _cache[key]
+        cached = _formats[filename] = (ino, current)
+    return cached[1]
+
+def record_size(filename):
+    """ขนาด record ของไฟล์ตามรูปแบบปัจจุบัน"""
+    return layout(filename)[0].size
+
+def row_format(filename):
+    """format ของ struct ตามรูปแบบปัจจุบัน (ใช้กับ scan.iter_records เมื่อต้องการเฉพาะฟิลด์ตัวเลข)"""
+    return layout(filename)[0].format
+
+def data_start(filename):
+    """ตำแหน่ง byte ของ record ข้อมูลแรก (รูปแบบ 2 มี header 1 record)"""
+    rec, _, heap = layout(filename)
+    return rec.size if heap is not None else 0
+
+def text(filename, index, value):
+    """ค่าดิบของฟิลด์ string ตำแหน่ง index จาก record ที่ unpack แล้ว -> string"""
+    heap = layout(filename)[2]
+    return unpack_string(bytes(value)) if heap is None else heap.text(index, int(value))
+
+def _decode(current, raw):
+    rec, strings, heap = current
+    fields = rec.unpack(raw)
+    if not strings:
+        return fields
+    fields = list(fields)
+    if heap is None:
+        for i in strings:
+            fields[i] = unpack_string(fields[i])
+    else:
+        heap.decode_fields(fields, strings)
+    return tuple(fields)
+
+def decode(filename, raw, current=None):
+    """bytes ของ 1 record -> tuple ที่ฟิลด์ string ถูก decode แล้ว (ไม่ผ่าน cache, current: layout ที่จะใช้)"""
+    return _decode(current or layout(filename), raw)
+
+def _pack_fields(current, writer, record):
+    rec, strings, heap = current
+    if strings:
+        if heap is None:
+            record = [pack_string(value, strings[i]) if i in strings else value for i, value in enumerate(record)]
+        else:
+            record = [writer.store(i, value) if i in strings else value for i, value in enumerate(record)]
+    return rec.pack(*record)
+
+def encode_many(filename, rows, ops=None, current=None):
+    """
+    tuple แบบที่ decode() คืน -> [bytes ของ record] (current: layout ที่จะใช้ ค่าเริ่มต้นตามไฟล์)
+    รูปแบบ 2: ข้อความใหม่ถูกต่อท้าย heap/dictionary เป็น op ใน ops (ต้องเรียกภายใต้ commit lock
+    แล้ว commit ops พร้อม record ในธุรกรรมเดียวกัน)
+    """
+    current = current or layout(filename)
+    heap = current[2]
+    if heap is not None and ops is None:
+        raise ValueError(f"{filename} เป็นรูปแบบ 2: ต้องส่ง ops สำหรับต่อท้าย string heap")
+    writer = heap.writer(ops) if heap is not None else None
+    data = [_pack_fields(current, writer, record) for record in rows]
+    if writer is not None:
+        writer.finish()
+    return data
+
+def encode(filename, record, ops=None):
+    """tuple แบบที่ decode() คืน -> bytes ของ record (ดู encode_many)"""
+    return encode_many(filename, [record], ops)[0]
+
+def modify(filename, raw, changes, ops=None):
+    """
+    bytes ของ record เดิมที่เปลี่ยนเฉพาะฟิลด์ใน changes {ตำแหน่ง: ค่าใหม่} ฟิลด์อื่นคงเดิมทุก byte
+    (รูปแบบ 2 ไม่ต้องเขียนข้อความเดิมลง heap ซ้ำ) ถ้ามีฟิลด์ string ใน changes ต้องส่ง ops เหมือน encode_many
+    """
+    current = layout(filename)
+    rec, strings, heap = current
+    fields = list(rec.unpack(raw))
+    if not any(i in strings for i in changes):
+        for i, value in changes.items():
+            fields[i] = value
+        return rec.pack(*fields)
+    if heap is not None and ops is None:
+        raise ValueError(f"{filename} เป็นรูปแบบ 2: ต้องส่ง ops สำหรับต่อท้าย string heap")
+    writer = heap.writer(ops) if heap is not None else None
+    for i, value in changes.items():
+        if i in strings:
+            value = pack_string(value, strings[i]) if heap is None else writer.store(i, value)
+        fields[i] = value
+    if writer is not None:
+        writer.finish()
+    return rec.pack(*fields)
+
+def max_bytes(filename, index):
+    """ความยาว (bytes UTF-8) สูงสุดของฟิลด์ string ตำแหน่ง index ที่เก็บได้โดยไม่ถูกตัด"""
+    rec, strings, heap = layout(filename)
+    return strings[index] if heap is None else strheap.MAX_STRING
+
+def _cached(filename, record_id, raw, current=None):
+    key = (filename, record_id)
+    entry = _cache.get(key)
+    if entry is not None and entry[0] == raw:
+        _cache.move_to_end(key)
+        _stats['hits'] += 1
+        return entry[1]
+    _stats['misses'] += 1
+    record = _decode(current or layout(filename), raw)
+    _cache[key] = (raw, record)
+    _cache.move_to_end(key)
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+        _stats['evictions'] += 1
+    return record
+
+def read_raw(filename, record_id, f=None):
+    """
+    เหมือน read() แต่คืน bytes ดิบด้วย: (pos, bytes, tuple ที่ decode แล้ว) หรือ (None, None, None)
+    สำหรับผู้ที่จะเขียน record กลับด้วย modify()
+    """
+    current = layout(filename)
+    pos, raw = record_index.read_by_id(f, filename, current[0].size, record_id)
+    if raw is None or raw[:1] == strheap.HEADER_STATUS:
+        return None, None, None
+    return pos, raw, _cached(filename, record_id, raw, current)
+
+def read(filename, record_id, f=None):
+    """อ่าน record ตาม ID (รวมที่ยังรอ flush ใน WAL) คืน (pos, tuple ที่ decode แล้ว) หรือ (None, None)"""
+    pos, _, record = read_raw(filename, record_id, f)
+    return pos, record
+
+def iter_decoded(filename, statuses=None, start=0):
+    """
+    วนคืน tuple ที่ decode แล้วของทุก record ในไฟล์ (ตามลำดับในไฟล์) เหมือน scan.iter_records
+    start: ตำแหน่ง byte ที่เริ่มอ่าน (ขอบ record) header ของรูปแบบ 2 ถูกข้ามเสมอ
+    """
+    if not os.path.exists(filename) or os.path.getsize(filename) <= start:
+        return
+    with locks.scan_lock(filename), open(filename, 'rb') as f:
+        current = layout(filename)  # ภายใต้ scan lock: การแปลงรูปแบบไฟล์ต้องรอจนอ่านเสร็จ
+        rec, _, heap = current
+        size = rec.size
+        if heap is not None:
+            start = max(start, size)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = len(mm) - len(mm) % size
+            if metrics.enabled:
+                metrics.count_io(filename, scanned=max(0, end - start) // size, read=max(0, end - start), opens=1)
+            use_cache = end // size <= CACHE_SIZE
+            wanted = None if statuses is None else {s[0] for s in statuses}
+            if heap is not None and not use_cache:
+                # รูปแบบ 2 ทั้งไฟล์: unpack ทีละก้อนแล้ว decode ข้อความทั้งก้อนในครั้งเดียว
+                step = size * CHUNK_RECORDS
+                for pos in range(start, end, step):
+                    rows = rec.iter_unpack(mm[pos:min(pos + step, end)])
+                    if wanted is not None:
+                        rows = [row for row in rows if row[0][0] in wanted]
+                    yield from heap.decode_rows(rows, current[1])
+                return
+            for pos in range(start, end, size):
+                if wanted is not None and mm[pos] not in wanted:
+                    continue
+                raw = mm[pos:pos + size]
+                if use_cache:
+                    yield _cached(filename, int.from_bytes(raw[1:5], 'little', signed=True), raw, current)
+                else:
+                    yield _decode(current, raw)
+
+def invalidate(filename, record_id):
+    if _cache.pop((filename, record_id), None) is not None:
+        _stats['invalidations'] += 1
+
+def _note_write(filename, offset, data):
+    """เรียกจาก wal.commit ทุกการเขียน: ลบ record ที่ถูกเขียนทับออกจาก cache"""
+    if filename not in _layouts or not _cache:
+        return
+    size = record_size(filename)
+    for pos in range(0, len(data) - size + 1, size):
+        invalidate(filename, int.from_bytes(data[pos + 1:pos + 5], 'little', signed=True))
+
+def cache_stats():
+    """สถิติของ cache: hits, misses, invalidations, evictions, size, capacity, hit_rate"""
+    lookups = _stats['hits'] + _stats['misses']
+    return dict(_stats, size=len(_cache), capacity=CACHE_SIZE,
+                hit_rate=_stats['hits'] / lookups if lookups else 0.0)
+
+def clear_cache():
+    _cache.clear()
+    for key in _stats:
+        _stats[key] = 0
+
+wal.write_hook = _note_write
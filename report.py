@@ -1,84 +1,146 @@
-import struct
-import os
-import datetime
-from books import BOOKS_FILE, BOOK_FORMAT, BOOK_RECORD_SIZE, STATUS_ACTIVE, unpack_string
-from members import MEMBERS_FILE, MEMBER_FORMAT, MEMBER_RECORD_SIZE, STATUS_ACTIVE as MEMBER_ACTIVE
-from lendings import LENDINGS_FILE, LENDING_FORMAT, LENDING_RECORD_SIZE, STATUS_BORROWED, STATUS_RETURNED
-
-def generate_report():
-    lines = []
-    lines.append("=" * 120)
-    lines.append("Library Management System – Lending Report".center(120))
-    lines.append(f"Generated At : {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}".center(120))
-    lines.append("App Version : 1.0".center(120))
-    lines.append("Encoding : UTF-8".center(120))
-    lines.append("=" * 120)
-    lines.append("")
-    header = f"{'สมาชิก':<30} {'เบอร์โทร':<18} {'หนังสือ':<50} {'สถานะ':<12}"
-    lines.append(header)
-    lines.append("=" * 120)
-    members_dict = {}
-    if os.path.exists(MEMBERS_FILE) and os.path.getsize(MEMBERS_FILE) > 0:
-        with open(MEMBERS_FILE, 'rb') as f:
-            for _ in range(os.path.getsize(MEMBERS_FILE) // MEMBER_RECORD_SIZE):
-                r = f.read(MEMBER_RECORD_SIZE)
-                status, member_id, name, phone = struct.unpack(MEMBER_FORMAT, r)
-                if status == MEMBER_ACTIVE:
-                    members_dict[member_id] = {
-                        'name': unpack_string(name),
-                        'phone': unpack_string(phone)
-                    }
-    books_dict = {}
-    if os.path.exists(BOOKS_FILE) and os.path.getsize(BOOKS_FILE) > 0:
-        with open(BOOKS_FILE, 'rb') as f:
-            for _ in range(os.path.getsize(BOOKS_FILE) // BOOK_RECORD_SIZE):
-                r = f.read(BOOK_RECORD_SIZE)
-                status, book_id, _, title, _, _ = struct.unpack(BOOK_FORMAT, r)
-                if status == STATUS_ACTIVE:
-                    books_dict[book_id] = unpack_string(title)
-    total_lendings = borrowed_count = returned_count = 0
-    member_lendings = {}  # key = member_name, value = dict {phone, books[], status_counts}
-
-    if os.path.exists(LENDINGS_FILE) and os.path.getsize(LENDINGS_FILE) > 0:
-        with open(LENDINGS_FILE, 'rb') as f:
-            for _ in range(os.path.getsize(LENDINGS_FILE) // LENDING_RECORD_SIZE):
-                r = f.read(LENDING_RECORD_SIZE)
-                status, _, bid, mid, _, _ = struct.unpack(LENDING_FORMAT, r)
-                total_lendings += 1
-                if status == STATUS_BORROWED:
-                    borrowed_count += 1
-                elif status == STATUS_RETURNED:
-                    returned_count += 1
-                member_info = members_dict.get(mid, {'name': 'ไม่ระบุ', 'phone': '-'})
-                member_name = member_info['name']
-                member_phone = member_info['phone']
-                if member_name not in member_lendings:
-                    member_lendings[member_name] = {
-                        'phone': member_phone,
-                        'books': [],
-                        'statuses': []
-                    }
-                member_lendings[member_name]['books'].append(books_dict.get(bid, "ไม่พบชื่อหนังสือ"))
-                member_lendings[member_name]['statuses'].append(status)
-    for member_name, data in member_lendings.items():
-        book_titles = ", ".join(data['books'])
-        # กำหนดสถานะ: ถ้ามีเล่มใดยังยืมอยู่ให้แสดง 📕 ยืมอยู่, ถ้าคืนหมดแล้วแสดง ✅ คืนแล้ว
-        if STATUS_BORROWED in data['statuses']:
-            status_text = "📕 ยืมอยู่"
-        else:
-            status_text = "✅ คืนแล้ว"
-
-        lines.append(f"{member_name:<30} {data['phone']:<18} {book_titles:<50} {status_text:<12}")
-
-    lines.append("=" * 120)
-    lines.append("")
-    lines.append("Summary".center(120))
-    lines.append("-" * 120)
-    lines.append(f"- Total Lendings     : {total_lendings}")
-    lines.append(f"- Currently Borrowed : {borrowed_count}")
-    lines.append(f"- Already Returned   : {returned_count}")
-    lines.append("=" * 120)
-    with open('library_report.txt', 'w', encoding='utf-8') as f:
-        f.write("\n".join(lines))
-
-    print("✅ สร้างรายงาน library_report.txt เรียบร้อยแล้ว")
+import datetime
+import metrics, records, segments
+from books import BOOKS_FILE, STATUS_ACTIVE
+from members import MEMBERS_FILE, STATUS_ACTIVE as MEMBER_ACTIVE
+from lendings import STATUS_BORROWED, STATUS_RETURNED
+
+REPORT_FILE = 'library_report.txt'
+# เครื่องมือสร้างรายงาน: 'python' (วนลูปทีละ record), 'numpy' (คำนวณแบบ vectorized, ต้องติดตั้ง numpy)
+# 'incremental' (อ่านเฉพาะข้อมูลใหม่ตั้งแต่ checkpoint ล่าสุด) หรือ 'parallel' (แบ่งช่วงให้หลายโปรเซสอ่านพร้อมกัน)
+# เลือกได้จาก python main.py report --engine หรือเมนูสร้างรายงาน, --check / 'check' ในเมนู เทียบทุก engine กับ 'python'
+REPORT_ENGINE = 'incremental'
+REPORT_ENGINES = ('python', 'numpy', 'incremental', 'parallel')
+
+def collect_report_rows():
+    """
+    รวบรวมข้อมูลรายงานแบบวนลูป Python
+    คืน (rows, totals) โดย rows = [(ชื่อสมาชิก, เบอร์โทร, [ชื่อหนังสือ...], ยังมีเล่มที่ยืมอยู่หรือไม่)]
+    และ totals = (total_lendings, borrowed_count, returned_count)
+    """
+    # ชื่อ/เบอร์โทร/ชื่อหนังสือที่ decode แล้วมาจาก cache ของ records (ถ้า record ไม่เปลี่ยนตั้งแต่ครั้งก่อน)
+    members_dict = {}
+    for status, member_id, name, phone in records.iter_decoded(MEMBERS_FILE, (MEMBER_ACTIVE,)):
+        members_dict[member_id] = {
+            'name': name,
+            'phone': phone
+        }
+    books_dict = {}
+    for status, book_id, _, title, _, _ in records.iter_decoded(BOOKS_FILE, (STATUS_ACTIVE,)):
+        books_dict[book_id] = title
+    total_lendings = borrowed_count = returned_count = 0
+    member_lendings = {}  # key = member_name, value = dict {phone, books[], status_counts}
+
+    # ประวัติทั้งหมด: segment ที่ archive แล้วตามลำดับเวลา ต่อด้วย lendings.dat
+    for status, _, bid, mid, _, _ in segments.iter_lendings():
+        total_lendings += 1
+        if status == STATUS_BORROWED:
+            borrowed_count += 1
+        elif status == STATUS_RETURNED:
+            returned_count += 1
+        member_info = members_dict.get(mid, {'name': 'ไม่ระบุ', 'phone': '-'})
+        member_name = member_info['name']
+        member_phone = member_info['phone']
+        if member_name not in member_lendings:
+            member_lendings[member_name] = {
+                'phone': member_phone,
+                'books': [],
+                'statuses': []
+            }
+        member_lendings[member_name]['books'].append(books_dict.get(bid, "ไม่พบชื่อหนังสือ"))
+        member_lendings[member_name]['statuses'].append(status)
+    rows = [(member_name, data['phone'], data['books'], STATUS_BORROWED in data['statuses'])
+            for member_name, data in member_lendings.items()]
+    return rows, (total_lendings, borrowed_count, returned_count)
+
+def render_report(rows, totals, now=None):
+    """จัดรูปแบบรายงานเป็นข้อความ (ใช้ร่วมกันทุก engine เพื่อให้ผลลัพธ์เหมือนกันทุกตัวอักษร)"""
+    now = now or datetime.datetime.now()
+    total_lendings, borrowed_count, returned_count = totals
+    lines = []
+    lines.append("=" * 120)
+    lines.append("Library Management System – Lending Report".center(120))
+    lines.append(f"Generated At : {now.strftime('%Y-%m-%d %H:%M:%S')}".center(120))
+    lines.append("App Version : 1.0".center(120))
+    lines.append("Encoding : UTF-8".center(120))
+    lines.append("=" * 120)
+    lines.append("")
+    header = f"{'สมาชิก':<30} {'เบอร์โทร':<18} {'หนังสือ':<50} {'สถานะ':<12}"
+    lines.append(header)
+    lines.append("=" * 120)
+    for member_name, phone, books, has_borrowed in rows:
+        book_titles = ", ".join(books)
+        # กำหนดสถานะ: ถ้ามีเล่มใดยังยืมอยู่ให้แสดง 📕 ยืมอยู่, ถ้าคืนหมดแล้วแสดง ✅ คืนแล้ว
+        if has_borrowed:
+            status_text = "📕 ยืมอยู่"
+        else:
+            status_text = "✅ คืนแล้ว"
+
+        lines.append(f"{member_name:<30} {phone:<18} {book_titles:<50} {status_text:<12}")
+
+    lines.append("=" * 120)
+    lines.append("")
+    lines.append("Summary".center(120))
+    lines.append("-" * 120)
+    lines.append(f"- Total Lendings     : {total_lendings}")
+    lines.append(f"- Currently Borrowed : {borrowed_count}")
+    lines.append(f"- Already Returned   : {returned_count}")
+    lines.append("=" * 120)
+    return "\n".join(lines)
+
+def build_report(engine=None, now=None, workers=None):
+    """
+    สร้างข้อความรายงานด้วย engine ที่เลือก ('python', 'numpy', 'incremental' หรือ 'parallel')
+    workers: จำนวนโปรเซสของ engine 'parallel' (None = report_parallel.WORKERS)
+    """
+    engine = engine or REPORT_ENGINE
+    with metrics.operation(f'report[{engine}]'):
+        if engine == 'numpy':
+            import report_numpy
+            rows, totals = report_numpy.collect_report_rows()
+        elif engine == 'incremental':
+            import report_incremental
+            rows, totals = report_incremental.collect_report_rows()
+        elif engine == 'parallel':
+            import report_parallel
+            rows, totals = report_parallel.collect_report_rows(workers)
+        elif engine == 'python':
+            rows, totals = collect_report_rows()
+        else:
+            raise ValueError(f"ไม่รู้จัก report engine: {engine}")
+        return render_report(rows, totals, now)
+
+def generate_report(engine=None, workers=None):
+    text = build_report(engine, workers=workers)
+    with open(REPORT_FILE, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+    print(f"✅ สร้างรายงาน {REPORT_FILE} เรียบร้อยแล้ว")
+
+def check_report_engines(engines=REPORT_ENGINES[1:], workers=None):
+    """สร้างรายงานด้วย engine 'python' และ engine อื่น (เวลาเดียวกัน) แล้วตรวจว่าได้ข้อความเหมือนกันทุกบรรทัด"""
+    now = datetime.datetime.now()
+    python_text = build_report('python', now)
+    all_same = True
+    for engine in engines:
+        other_text = build_report(engine, now, workers)
+        if python_text == other_text:
+            print(f"✅ รายงานจาก engine python และ {engine} ตรงกัน")
+            continue
+        all_same = False
+        for i, (a, b) in enumerate(zip(python_text.split("\n"), other_text.split("\n")), 1):
+            if a != b:
+                print(f"❌ {engine}: บรรทัด {i} ไม่ตรงกัน\n  python: {a}\n  {engine}: {b}")
+                break
+        else:
+            print(f"❌ {engine}: จำนวนบรรทัดไม่ตรงกัน")
+    return all_same
+
+def report_menu():
+    engine = input(f"engine ({'/'.join(REPORT_ENGINES)}, Enter = {REPORT_ENGINE}, "
+                   f"check = ตรวจว่าทุก engine ได้รายงานเดียวกัน): ").strip()
+    if engine == 'check':
+        check_report_engines()
+    elif not engine or engine in REPORT_ENGINES:
+        generate_report(engine or None)
+    else:
+        print("ไม่มี engine นี้")
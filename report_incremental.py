@@ -0,0 +1,202 @@
+import os, struct, pickle, bisect
+from array import array
+import locks, metrics, records, segments
+from scan import iter_records
+from books import BOOKS_FILE, STATUS_ACTIVE
+from members import MEMBERS_FILE, STATUS_ACTIVE as MEMBER_ACTIVE
+from lendings import (LENDINGS_FILE, LENDING_FORMAT, LENDING_RECORD_SIZE, STATUS_BORROWED, STATUS_RETURNED,
+                      LENDING_CHANGES_FILE, LENDING_CHANGE_FORMAT, LENDING_CHANGE_SIZE)
+
+# ============================================
+# Report engine แบบ incremental (เก็บผลรวมไว้ใน checkpoint)
+# ============================================
+# lendings.dat แทบจะมีแต่การต่อท้าย ยกเว้นการเปลี่ยนสถานะ A -> R ตอนคืน (บันทึกไว้ใน lendings.chg)
+# checkpoint จึงเก็บ: ตำแหน่งล่าสุดที่อ่านแล้วของทั้งสองไฟล์, ยอดรวม, รายการยืมของแต่ละสมาชิก
+# และ lending ที่ยังยืมอยู่ รอบถัดไปอ่านเฉพาะ record ใหม่ + การเปลี่ยนสถานะใหม่เท่านั้น
+# ถ้า checkpoint ไม่ตรงกับไฟล์ (ไฟล์ถูกแทนที่/สั้นลง/record สุดท้ายไม่ตรง) จะสร้างใหม่ทั้งหมด
+# ชื่อสมาชิกและชื่อหนังสือไม่ได้เก็บใน checkpoint แต่ดึงใหม่ทุกครั้งตอนแสดงผล
+# segment ที่ archive แล้ว (segments.py) ไม่เปลี่ยนอีก จึงอ่านเฉพาะตอนสร้างใหม่ และนับลำดับ record ต่อกัน
+# (archived = จำนวน record ใน archive) การ archive ครั้งใหม่แทนที่ lendings.dat จึงสร้างใหม่ทั้งหมดเอง
+
+CHECKPOINT_FILE = 'report.ckpt'
+CHECKPOINT_VERSION = 2
+
+UNKNOWN_MEMBER = {'name': 'ไม่ระบุ', 'phone': '-'}
+UNKNOWN_BOOK = 'ไม่พบชื่อหนังสือ'
+
+def _file_id(filename):
+    return os.stat(filename).st_ino if os.path.exists(filename) else None
+
+def _fingerprint(filename, offset):
+    """ส่วนที่ไม่เปลี่ยนของ record สุดท้ายที่อ่านแล้ว (lending_id, book_id, member_id, วันยืม)"""
+    if offset == 0:
+        return None
+    with open(filename, 'rb') as f:
+        f.seek(offset - LENDING_RECORD_SIZE)
+        return f.read(LENDING_RECORD_SIZE)[1:21]
+
+def _empty_state():
+    return {
+        'version': CHECKPOINT_VERSION,
+        'record_size': LENDING_RECORD_SIZE,
+        'archived': 0,  # จำนวน record ใน segment ที่ archive แล้ว (ลำดับของ record ใน lendings.dat นับต่อจากนี้)
+        'lendings_ino': None, 'lendings_offset': 0, 'tail': None,
+        'changes_ino': None, 'changes_offset': 0,
+        'totals': [0, 0, 0],  # total, borrowed, returned
+        'members': {},  # member_id -> (array ของลำดับ record, array ของ book_id, bytearray ของสถานะ)
+        'open': {},  # lending_id ที่ยังยืมอยู่ -> (member_id, ลำดับ record)
+    }
+
+def load_checkpoint():
+    """โหลด checkpoint (คืน None ถ้าไม่มีหรืออ่านไม่ได้)"""
+    if not os.path.exists(CHECKPOINT_FILE):
+        return None
+    try:
+        with open(CHECKPOINT_FILE, 'rb') as f:
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    if state.get('version') != CHECKPOINT_VERSION or state.get('record_size') != LENDING_RECORD_SIZE:
+        return None
+    return state
+
+def save_checkpoint(state):
+    tmp_path = f'{CHECKPOINT_FILE}.{os.getpid()}.tmp'  # หลายโปรแกรมอาจสร้างรายงานพร้อมกัน
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, CHECKPOINT_FILE)
+
+def _matches_data(state):
+    """ตรวจว่า checkpoint ยังต่อยอดจากไฟล์ปัจจุบันได้"""
+    offset = state['lendings_offset']
+    if offset:
+        if _file_id(LENDINGS_FILE) != state['lendings_ino'] or os.path.getsize(LENDINGS_FILE) < offset:
+            return False
+        if _fingerprint(LENDINGS_FILE, offset) != state['tail']:
+            return False
+    if state['changes_ino'] is not None:
+        if _file_id(LENDING_CHANGES_FILE) != state['changes_ino']:
+            return False
+        if os.path.getsize(LENDING_CHANGES_FILE) < state['changes_offset']:
+            return False
+    return True
+
+def _add_lending(state, slot, status, lid, bid, mid):
+    totals = state['totals']
+    totals[0] += 1
+    if status == STATUS_BORROWED:
+        totals[1] += 1
+        state['open'][lid] = (mid, slot)
+    elif status == STATUS_RETURNED:
+        totals[2] += 1
+    entry = state['members'].get(mid)
+    if entry is None:
+        entry = state['members'][mid] = (array('i'), array('i'), bytearray())
+    entry[0].append(slot)
+    entry[1].append(bid)
+    entry[2].extend(status)
+
+def _apply_archived(state):
+    """เพิ่ม record ของทุก segment ที่ archive แล้ว (เรียกตอนสร้าง checkpoint ใหม่เท่านั้น)"""
+    slot = 0
+    for seg in segments.load_manifest():
+        for status, lid, bid, mid, _, _ in iter_records(seg['file'], LENDING_FORMAT):
+            _add_lending(state, slot, status, lid, bid, mid)
+            slot += 1
+    state['archived'] = slot
+
+def _apply_new_lendings(state):
+    """เพิ่ม record ที่ต่อท้าย lendings.dat มาตั้งแต่ checkpoint"""
+    if not os.path.exists(LENDINGS_FILE):
+        return
+    offset = state['lendings_offset']
+    end = os.path.getsize(LENDINGS_FILE)
+    end -= end % LENDING_RECORD_SIZE
+    for status, lid, bid, mid, _, _ in iter_records(LENDINGS_FILE, LENDING_FORMAT, start=offset):
+        if offset >= end:
+            break  # มี record ต่อท้ายเพิ่มระหว่างอ่าน ไว้อ่านรอบหน้า
+        _add_lending(state, state['archived'] + offset // LENDING_RECORD_SIZE, status, lid, bid, mid)
+        offset += LENDING_RECORD_SIZE
+    state['lendings_offset'] = offset
+    state['lendings_ino'] = _file_id(LENDINGS_FILE)
+    state['tail'] = _fingerprint(LENDINGS_FILE, offset)
+
+def _apply_changes(state):
+    """นำการเปลี่ยนสถานะ (คืนหนังสือ) ที่บันทึกหลัง checkpoint มาปรับยอด"""
+    if not os.path.exists(LENDING_CHANGES_FILE):
+        return
+    offset = state['changes_offset']
+    with open(LENDING_CHANGES_FILE, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    if metrics.enabled:
+        metrics.count_io(LENDING_CHANGES_FILE, scanned=len(data) // LENDING_CHANGE_SIZE, read=len(data), opens=1)
+    data = data[:len(data) - len(data) % LENDING_CHANGE_SIZE]
+    totals, members, open_lendings = state['totals'], state['members'], state['open']
+    for lid, status in struct.iter_unpack(LENDING_CHANGE_FORMAT, data):
+        # lending ที่ไม่อยู่ใน open แปลว่าอ่านสถานะล่าสุดจาก lendings.dat มาแล้ว ข้ามได้เลย
+        if status == STATUS_RETURNED and lid in open_lendings:
+            mid, slot = open_lendings.pop(lid)
+            slots, _, statuses = members[mid]
+            statuses[bisect.bisect_left(slots, slot)] = status[0]
+            totals[1] -= 1
+            totals[2] += 1
+    state['changes_offset'] = offset + len(data)
+    state['changes_ino'] = _file_id(LENDING_CHANGES_FILE)
+
+def rebuild_checkpoint():
+    """สร้าง checkpoint ใหม่จาก lendings.dat ทั้งไฟล์"""
+    state = _empty_state()
+    # สถานะใน lendings.dat สะท้อนการเปลี่ยนแปลงทั้งหมดแล้ว จึงข้ามบันทึกการเปลี่ยนสถานะที่มีอยู่
+    # (ถ้ามีบันทึกใหม่เข้ามาระหว่างนี้ จะถูกข้ามในรอบหน้าเพราะ lending นั้นไม่อยู่ใน open แล้ว)
+    if os.path.exists(LENDING_CHANGES_FILE):
+        state['changes_ino'] = _file_id(LENDING_CHANGES_FILE)
+        size = os.path.getsize(LENDING_CHANGES_FILE)
+        state['changes_offset'] = size - size % LENDING_CHANGE_SIZE
+    # scan lock กันไม่ให้ segments.archive() ย้าย record ระหว่างอ่าน archive กับ lendings.dat
+    with locks.scan_lock(LENDINGS_FILE):
+        _apply_archived(state)
+        _apply_new_lendings(state)
+    save_checkpoint(state)
+    return state
+
+def update_checkpoint():
+    """ต่อยอด checkpoint ด้วยข้อมูลใหม่ (หรือสร้างใหม่ถ้าไม่ตรงกับไฟล์) แล้วบันทึกลงดิสก์"""
+    state = load_checkpoint()
+    if state is None or not _matches_data(state):
+        return rebuild_checkpoint()
+    _apply_new_lendings(state)
+    _apply_changes(state)
+    save_checkpoint(state)
+    return state
+
+def collect_report_rows():
+    state = update_checkpoint()
+    members_dict = {}
+    for status, member_id, name, phone in records.iter_decoded(MEMBERS_FILE, (MEMBER_ACTIVE,)):
+        members_dict[member_id] = {'name': name, 'phone': phone}
+    books_dict = {}
+    for status, book_id, _, title, _, _ in records.iter_decoded(BOOKS_FILE, (STATUS_ACTIVE,)):
+        books_dict[book_id] = title
+
+    # members ใน checkpoint เรียงตามลำดับที่ปรากฏครั้งแรก ชื่อที่เจอก่อนจึงอยู่ก่อนเหมือน engine ปกติ
+    groups = {}  # ชื่อสมาชิก -> (เบอร์โทร, [รายการของแต่ละ member_id])
+    for mid, entry in state['members'].items():
+        info = members_dict.get(mid, UNKNOWN_MEMBER)
+        group = groups.get(info['name'])
+        if group is None:
+            groups[info['name']] = (info['phone'], [entry])
+        else:
+            group[1].append(entry)
+    borrowed = STATUS_BORROWED[0]
+    rows = []
+    for name, (phone, entries) in groups.items():
+        if len(entries) == 1:
+            book_ids = entries[0][1]
+        else:
+            # หลาย member_id ใช้ชื่อเดียวกัน: เรียงรวมตามลำดับ record ในไฟล์
+            merged = sorted((slot, bid) for slots, bids, _ in entries for slot, bid in zip(slots, bids))
+            book_ids = [bid for _, bid in merged]
+        has_borrowed = any(borrowed in statuses for _, _, statuses in entries)
+        rows.append((name, phone, [books_dict.get(bid, UNKNOWN_BOOK) for bid in book_ids], has_borrowed))
+    return rows, tuple(state['totals'])
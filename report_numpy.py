@@ -0,0 +1,120 @@
+import os
+import numpy as np
+import locks, metrics, records, segments
+from books import BOOKS_FILE, STATUS_ACTIVE
+from members import MEMBERS_FILE, STATUS_ACTIVE as MEMBER_ACTIVE
+from lendings import LENDINGS_FILE, LENDING_FORMAT, STATUS_BORROWED, STATUS_RETURNED
+
+# ============================================
+# Report engine แบบ vectorized ด้วย NumPy
+# ============================================
+# อ่านไฟล์ .dat ตรงเป็น structured array ตาม *_FORMAT เดิม แล้วนับสถานะ, จับกลุ่มตามสมาชิก
+# และ join ชื่อหนังสือด้วย operation ของ NumPy แทนการวนลูปทีละ record
+# ผลลัพธ์ (rows, totals) มีรูปแบบเดียวกับ report.collect_report_rows()
+# books.dat/members.dat อ่านตามรูปแบบปัจจุบันของไฟล์ (records.row_format) รูปแบบ 2 ได้ ref/รหัสของ string
+# แทนตัวข้อความ ข้อความจึง decode ผ่าน records.text() เฉพาะแถวที่ใช้ (ชื่อสมาชิก decode ทุกแถวเพื่อจับกลุ่ม)
+
+UNKNOWN_MEMBER = 'ไม่ระบุ'
+UNKNOWN_PHONE = '-'
+UNKNOWN_BOOK = 'ไม่พบชื่อหนังสือ'
+
+_NUMPY_CODES = {'c': 'S1', 'h': '<i2', 'i': '<i4', 'I': '<u4', 'q': '<i8', 'Q': '<u8', 'd': '<f8'}
+
+def record_dtype(record_format):
+    """แปลง format ของ struct (เช่น '< c i 16s') เป็น structured dtype ของ NumPy (ฟิลด์ f0, f1, ...)"""
+    fields = []
+    for token in record_format.split()[1:]:
+        if token.endswith('s'):
+            fields.append(f'S{token[:-1]}')
+        else:
+            fields.append(_NUMPY_CODES[token])
+    return np.dtype([(f'f{i}', code) for i, code in enumerate(fields)])
+
+def load_records(filename, record_format=None):
+    """
+    อ่านทั้งไฟล์เป็น structured array (ไม่สนใจ record ที่เขียนไม่ครบท้ายไฟล์)
+    record_format: None = ไฟล์ที่ลงทะเบียนใน records (ใช้รูปแบบปัจจุบันของไฟล์ และข้าม header ของรูปแบบ 2)
+    """
+    if not os.path.exists(filename):
+        return np.zeros(0, record_dtype(record_format or records.row_format(filename)))
+    with locks.scan_lock(filename):
+        start = 0
+        if record_format is None:
+            record_format, start = records.row_format(filename), records.data_start(filename)
+        dtype = record_dtype(record_format)
+        count = (os.path.getsize(filename) - start) // dtype.itemsize
+        if metrics.enabled:
+            metrics.count_io(filename, scanned=count, read=count * dtype.itemsize, opens=1)
+        return np.fromfile(filename, dtype=dtype, count=max(count, 0), offset=start)
+
+def _lookup(keys, ids):
+    """
+    หาแถวของ ids ใน keys (ID ซ้ำให้แถวหลังชนะ เหมือน dict ของ engine แบบ Python)
+    คืน (index ของแถว, mask ว่าพบหรือไม่)
+    """
+    if len(keys) == 0:
+        return np.zeros(len(ids), np.intp), np.zeros(len(ids), bool)
+    last = len(keys) - 1 - np.unique(keys[::-1], return_index=True)[1]  # แถวสุดท้ายของแต่ละ ID
+    sorted_keys = keys[last]
+    pos = np.searchsorted(sorted_keys, ids).clip(0, len(sorted_keys) - 1)
+    found = sorted_keys[pos] == ids
+    return last[pos], found
+
+def collect_report_rows():
+    members = load_records(MEMBERS_FILE)
+    members = members[members['f0'] == MEMBER_ACTIVE]
+    books = load_records(BOOKS_FILE)
+    books = books[books['f0'] == STATUS_ACTIVE]
+    # segment ที่ archive แล้วตามลำดับเวลา ต่อด้วย lendings.dat (ลำดับเดียวกับ engine แบบ Python)
+    # scan lock กันไม่ให้ segments.archive() ย้าย record ระหว่างอ่าน manifest กับ lendings.dat
+    with locks.scan_lock(LENDINGS_FILE):
+        parts = [load_records(seg['file'], LENDING_FORMAT) for seg in segments.load_manifest()]
+        parts.append(load_records(LENDINGS_FILE, LENDING_FORMAT))
+    lendings = np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    # --- นับสถานะ ---
+    status = lendings['f0']
+    is_borrowed = status == STATUS_BORROWED
+    totals = (len(lendings), int(is_borrowed.sum()), int((status == STATUS_RETURNED).sum()))
+    if len(lendings) == 0:
+        return [], totals
+
+    # --- join lendings -> members แล้วจับกลุ่มตามชื่อสมาชิก (ชื่อซ้ำกันรวมเป็นกลุ่มเดียว) ---
+    member_row, member_found = _lookup(members['f1'], lendings['f3'])
+    # เพิ่มชื่อ "ไม่ระบุ" ไว้ท้ายสุด เพื่อให้สมาชิกที่ไม่พบใช้รหัสชื่อเดียวกับสมาชิกที่ชื่อนี้จริง ๆ
+    if members['f2'].dtype.kind == 'S':
+        names = np.append(members['f2'], np.array([UNKNOWN_MEMBER.encode('utf-8')], dtype=members['f2'].dtype))
+    else:  # รูปแบบ 2: ref ต่างกันอาจเป็นชื่อเดียวกัน ต้องจับกลุ่มจากข้อความ
+        names = np.array([records.text(MEMBERS_FILE, 2, ref) for ref in members['f2']] + [UNKNOWN_MEMBER], dtype=object)
+    _, name_code = np.unique(names, return_inverse=True)
+    member_row = np.where(member_found, member_row, len(names) - 1)
+    group = name_code[member_row]
+    # เรียงกลุ่มตามลำดับที่ชื่อปรากฏครั้งแรกใน lendings และคงลำดับ lending ภายในกลุ่ม
+    group_ids, first_seen = np.unique(group, return_index=True)
+    order = np.argsort(first_seen, kind='stable')
+    group_ids, first_seen = group_ids[order], first_seen[order]
+    rank = np.empty(group_ids.max() + 1, np.intp)
+    rank[group_ids] = np.arange(len(group_ids))
+    group_rank = rank[group]
+    by_group = np.argsort(group_rank, kind='stable')
+    bounds = np.cumsum(np.bincount(group_rank, minlength=len(group_ids)))[:-1]
+    has_borrowed = np.bincount(group_rank, weights=is_borrowed, minlength=len(group_ids)) > 0
+
+    # --- join lendings -> books: decode ชื่อหนังสือเฉพาะเล่มที่ถูกยืมจริง ครั้งละหนึ่งเล่ม ---
+    book_row, book_found = _lookup(books['f1'], lendings['f2'])
+    used_rows, book_code = np.unique(np.where(book_found, book_row, -1), return_inverse=True)
+    used_titles = np.array([UNKNOWN_BOOK if r < 0 else records.text(BOOKS_FILE, 3, books['f3'][r])
+                            for r in used_rows], dtype=object)
+    titles = used_titles[book_code.ravel()][by_group]
+
+    # --- ข้อมูลสมาชิกของแต่ละกลุ่ม มาจาก lending แรกของกลุ่ม ---
+    rows = []
+    first_member = member_row[first_seen]
+    for i, books_of_member in enumerate(np.split(titles, bounds)):
+        r = first_member[i]
+        if r == len(names) - 1:
+            name, phone = UNKNOWN_MEMBER, UNKNOWN_PHONE
+        else:
+            name, phone = records.text(MEMBERS_FILE, 2, members['f2'][r]), records.text(MEMBERS_FILE, 3, members['f3'][r])
+        rows.append((name, phone, books_of_member.tolist(), bool(has_borrowed[i])))
+    return rows, totals
@@ -0,0 +1,213 @@
+import os, sys, time, struct, argparse, datetime, multiprocessing
+from array import array
+import locks, metrics, records, report, segments
+from scan import CHUNK_RECORDS
+from books import BOOKS_FILE, STATUS_ACTIVE
+from members import MEMBERS_FILE, STATUS_ACTIVE as MEMBER_ACTIVE
+from lendings import LENDINGS_FILE, LENDING_RECORD_SIZE, STATUS_BORROWED, STATUS_RETURNED
+
+# ============================================
+# Report engine แบบขนานหลายโปรเซส
+# ============================================
+# แบ่งประวัติการยืม (archive ตามลำดับใน lendings.arc แล้วต่อด้วย lendings.dat) เป็นช่วง byte ที่ตรงขอบ
+# LENDING_RECORD_SIZE ช่วงละไม่น้อยกว่า CHUNK_RECORDS record (ราว TASKS_PER_WORKER ช่วงต่อ worker เพื่อให้
+# worker ที่เสร็จก่อนรับช่วงถัดไปได้) แล้วให้ process pool นับสถานะและรวบรวม book_id ของแต่ละกลุ่มสมาชิกในแต่ละช่วง
+# - engine แบบ Python จับกลุ่มตาม "ชื่อ" สมาชิก (หลาย member_id ชื่อเดียวกันรวมกัน) worker จึงได้ตาราง
+#   member_id -> รหัสกลุ่มชื่อ ตั้งแต่เริ่ม และคืนกลุ่มตามลำดับที่ปรากฏครั้งแรกในช่วงของตัวเอง
+# - ผลของแต่ละช่วงถูกรวมตามลำดับของช่วงในไฟล์ (ไม่ใช่ลำดับที่ worker ทำเสร็จ) ลำดับกลุ่ม, ลำดับหนังสือในกลุ่ม
+#   และเบอร์โทร (ของสมาชิกคนแรกที่พบในกลุ่ม) จึงเหมือน engine แบบ Python ทุกตัวอักษร
+# - ถือ scan lock ของ lendings.dat ตั้งแต่แบ่งช่วงจนรวมผลเสร็จ: segments.archive() ย้าย record ไม่ได้ระหว่างนี้
+#   record ที่ต่อท้ายหลังแบ่งช่วงไม่รวมในรายงานครั้งนี้ (เหมือนอ่านทั้งไฟล์ ณ เวลาที่เริ่ม)
+# - ชื่อหนังสือถูก decode ในโปรเซสหลักระหว่างที่ worker อ่าน lendings อยู่
+# workers = 1 ทำทุกช่วงในโปรเซสเดียว (ไม่สร้าง pool) ใช้เป็นฐานของ benchmark
+# ใช้: python report_parallel.py [--workers N] [--repeat R]  วัดเวลาตั้งแต่ 1 ถึง N worker และตรวจผลกับ engine 'python'
+WORKERS = None  # None = os.cpu_count()
+TASKS_PER_WORKER = 4
+
+UNKNOWN_MEMBER = 'ไม่ระบุ'
+UNKNOWN_PHONE = '-'
+UNKNOWN_BOOK = 'ไม่พบชื่อหนังสือ'
+
+_FIELDS = struct.Struct('< c 4x i i 16x')  # status, book_id, member_id จาก record ของ lendings.dat
+_BORROWED, _RETURNED = STATUS_BORROWED[0], STATUS_RETURNED[0]
+
+_codes = None  # ใน worker: array ของรหัสกลุ่มตาม member_id
+_unknown = None  # รหัสกลุ่มของสมาชิกที่ไม่พบ (ชื่อ "ไม่ระบุ")
+
+def _init_worker(codes, unknown):
+    global _codes, _unknown
+    _codes, _unknown = codes, unknown
+
+def split_ranges(ranges, parts):
+    """
+    [(ไฟล์, byte เริ่ม, byte หยุดหรือ None)] -> งานราว parts งานตามลำดับเดิม แต่ละงาน = [(ไฟล์, byte เริ่ม, byte หยุด)]
+    ขนาดงานละไม่น้อยกว่า CHUNK_RECORDS record ทุกช่วงตรงขอบ record (ไม่รวม record ที่เขียนไม่ครบท้ายไฟล์)
+    ไฟล์ archive เล็ก ๆ หลายไฟล์ที่ติดกันรวมเป็นงานเดียว (ผลของแต่ละงานมีทุกกลุ่มสมาชิกที่พบ งานน้อยลง = รวมผลน้อยลง)
+    """
+    spans = []
+    for path, start, stop in ranges:
+        if not os.path.exists(path):
+            continue
+        end = os.path.getsize(path)
+        end -= end % LENDING_RECORD_SIZE
+        if stop is not None:
+            end = min(end, stop)
+        if end > start:
+            spans.append((path, start, end))
+    total = sum(end - start for _, start, end in spans) // LENDING_RECORD_SIZE
+    step = max(CHUNK_RECORDS, -(-total // max(parts, 1))) * LENDING_RECORD_SIZE
+    tasks, task, room = [], [], step
+    for path, start, end in spans:
+        while start < end:
+            stop = min(end, start + room)
+            task.append((path, start, stop))
+            room -= stop - start
+            start = stop
+            if room == 0:
+                tasks.append(task)
+                task, room = [], step
+    if task:
+        tasks.append(task)
+    return tasks
+
+def scan_range(task):
+    """
+    อ่าน 1 งานของ split_ranges (ทำงานใน worker) คืน (จำนวน record, ยืมอยู่, คืนแล้ว, รหัสกลุ่ม, member_id แรก,
+    จำนวนเล่ม, book_id ของทุกกลุ่มต่อกัน, มีเล่มที่ยืมอยู่) สี่ตัวหลังเป็น array เรียงตามกลุ่มที่ปรากฏครั้งแรกในงาน
+    (ส่งกลับโปรเซสหลักเป็น array ไม่กี่ก้อนแทน object ของทุกกลุ่ม)
+    """
+    codes, unknown, size = _codes, _unknown, len(_codes)
+    counts = [0, 0, 0]
+    groups = {}  # รหัสกลุ่ม -> [member_id แรก, array ของ book_id, มีเล่มที่ยืมอยู่]
+    for path, start, stop in task:
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(stop - start)
+        data = data[:len(data) - len(data) % LENDING_RECORD_SIZE]
+        statuses = data[::LENDING_RECORD_SIZE]
+        counts[0] += len(statuses)
+        counts[1] += statuses.count(_BORROWED)
+        counts[2] += statuses.count(_RETURNED)
+        for status, bid, mid in _FIELDS.iter_unpack(data):
+            code = codes[mid] if 0 <= mid < size else unknown
+            group = groups.get(code)
+            if group is None:
+                group = groups[code] = [mid, array('i'), False]
+            group[1].append(bid)
+            if status == STATUS_BORROWED:
+                group[2] = True
+    book_ids = array('i')
+    for _, bids, _ in groups.values():
+        book_ids.extend(bids)
+    return (*counts, array('i', groups), array('i', [g[0] for g in groups.values()]),
+            array('i', [len(g[1]) for g in groups.values()]), book_ids, bytes(g[2] for g in groups.values()))
+
+def _member_codes():
+    """(array รหัสกลุ่มตาม member_id, รหัสของ "ไม่ระบุ", [ชื่อของแต่ละรหัส], {member_id: เบอร์โทร})"""
+    members = {}
+    for status, member_id, name, phone in records.iter_decoded(MEMBERS_FILE, (MEMBER_ACTIVE,)):
+        members[member_id] = (name, phone)  # ID ซ้ำ: แถวหลังชนะ เหมือน dict ของ engine แบบ Python
+    code_of = {}
+    for name, _ in members.values():
+        code_of.setdefault(name, len(code_of))
+    unknown = code_of.setdefault(UNKNOWN_MEMBER, len(code_of))
+    codes = array('i', [unknown]) * (max(members, default=-1) + 1)
+    for member_id, (name, _) in members.items():
+        if member_id >= 0:
+            codes[member_id] = code_of[name]
+    phones = {member_id: phone for member_id, (_, phone) in members.items()}
+    return codes, unknown, list(code_of), phones
+
+def collect_report_rows(workers=None):
+    """เหมือน report.collect_report_rows() แต่อ่าน lendings ด้วย workers โปรเซส (None = WORKERS)"""
+    workers = max(1, workers or WORKERS or os.cpu_count() or 1)
+    codes, unknown, names, phones = _member_codes()
+    with locks.scan_lock(LENDINGS_FILE):
+        tasks = split_ranges(segments.lending_ranges(), workers * TASKS_PER_WORKER)
+        if metrics.enabled:
+            for path, start, stop in (piece for task in tasks for piece in task):
+                metrics.count_io(path, scanned=(stop - start) // LENDING_RECORD_SIZE, read=stop - start, opens=1)
+        pool = None
+        if workers > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(min(workers, len(tasks)), _init_worker, (codes, unknown))
+        try:
+            if pool is not None:
+                pending = pool.map_async(scan_range, tasks, chunksize=1)  # ผลเรียงตามลำดับ tasks เสมอ
+            titles = {}
+            for status, book_id, _, title, _, _ in records.iter_decoded(BOOKS_FILE, (STATUS_ACTIVE,)):
+                titles[book_id] = title
+            if pool is not None:
+                results = pending.get()
+            else:
+                _init_worker(codes, unknown)
+                results = [scan_range(task) for task in tasks]
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    # รวมผลตามลำดับช่วงในไฟล์: กลุ่มที่พบครั้งแรกในช่วงก่อนอยู่ก่อน หนังสือในกลุ่มต่อกันตามลำดับช่วง
+    totals = [0, 0, 0]
+    merged = {}  # รหัสกลุ่ม -> [member_id แรก, array ของ book_id, มีเล่มที่ยืมอยู่]
+    for count, borrowed, returned, group_codes, first_mids, lengths, book_ids, flags in results:
+        totals[0] += count
+        totals[1] += borrowed
+        totals[2] += returned
+        pos = 0
+        for code, mid, n, has_borrowed in zip(group_codes, first_mids, lengths, flags):
+            bids = book_ids[pos:pos + n]
+            pos += n
+            group = merged.get(code)
+            if group is None:
+                merged[code] = [mid, bids, has_borrowed]
+            else:
+                group[1].extend(bids)
+                group[2] = group[2] or has_borrowed
+    rows = []
+    for code, (mid, bids, has_borrowed) in merged.items():
+        phone = phones.get(mid, UNKNOWN_PHONE)
+        rows.append((names[code], phone, [titles.get(bid, UNKNOWN_BOOK) for bid in bids], bool(has_borrowed)))
+    return rows, tuple(totals)
+
+# ============================================
+# benchmark การขยายตามจำนวน worker
+# ============================================
+def benchmark(max_workers, repeat=3):
+    """
+    เวลา (median) ของ collect_report_rows ตั้งแต่ 1 ถึง max_workers worker คืน [(workers, วินาที)]
+    และตรวจว่ารายงานทุกแบบตรงกับ engine 'python' ทุกตัวอักษร (ValueError ถ้าไม่ตรง)
+    """
+    now = datetime.datetime.now()
+    expected = report.render_report(*report.collect_report_rows(), now)
+    results = []
+    for workers in range(1, max_workers + 1):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows, totals = collect_report_rows(workers)
+            times.append(time.perf_counter() - start)
+        if report.render_report(rows, totals, now) != expected:
+            raise ValueError(f"รายงานจาก {workers} worker ไม่ตรงกับ engine 'python'")
+        results.append((workers, sorted(times)[len(times) // 2]))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark report engine แบบขนาน ตั้งแต่ 1 ถึง N worker")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="จำนวน worker สูงสุด (ค่าเริ่มต้น = จำนวน CPU)")
+    parser.add_argument('--repeat', type=int, default=3, help="จำนวนรอบต่อจำนวน worker (ใช้ค่า median)")
+    args = parser.parse_args(argv)
+    try:
+        results = benchmark(args.workers, args.repeat)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    base = results[0][1]
+    print(f"CPU {os.cpu_count()} core, lendings แบ่งช่วงละไม่น้อยกว่า {CHUNK_RECORDS:,} record")
+    print(f"{'workers':>8} {'วินาที':>10} {'เร็วขึ้น':>10}")
+    for workers, seconds in results:
+        print(f"{workers:>8} {seconds:>10.3f} {base / seconds if seconds else 0.0:>9.2f}x")
+    print("✅ รายงานทุกจำนวน worker ตรงกับ engine 'python'")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
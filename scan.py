@@ -0,0 +1,71 @@
+import struct, os, mmap
+import locks, metrics
+
+# ============================================
+# ชั้นการอ่านทั้งไฟล์ (full-table scan) แบบ memory-map
+# ============================================
+# แทนการเรียก f.read(RECORD_SIZE) + struct.unpack ทีละ record (1 syscall + bytes ใหม่ทุกแถว)
+# ฟังก์ชันนี้ map ไฟล์ทั้งไฟล์เข้าหน่วยความจำครั้งเดียว แล้วใช้ struct.Struct ที่คอมไพล์ไว้แล้ว
+# unpack ตรงจาก buffer ของ mmap โดยไม่คัดลอกข้อมูลก้อนใหญ่
+# ถ้ากำหนด statuses จะดู byte สถานะ (byte แรกของ record) ก่อน และ unpack เฉพาะแถวที่ผ่าน
+# ผู้เรียกควร decode ฟิลด์ string (unpack_string) เฉพาะแถวที่ต้องใช้จริงเท่านั้น
+# ระหว่างอ่านถือ locks.scan_lock (shared) ซึ่งกันเฉพาะ compaction ไม่กันการยืม/คืน/แก้ไข
+
+CHUNK_RECORDS = 1 << 16  # จำนวน record ต่อก้อนของ iter_chunks
+
+_structs = {}  # format -> struct.Struct ที่คอมไพล์แล้ว
+
+def get_struct(record_format):
+    s = _structs.get(record_format)
+    if s is None:
+        s = _structs[record_format] = struct.Struct(record_format)
+    return s
+
+def iter_records(filename, record_format, statuses=None, start=0, stop=None):
+    """
+    วนคืน tuple ของแต่ละ record ในไฟล์ (ตามลำดับในไฟล์)
+    statuses: ชุดของสถานะ เช่น (b'A',) เพื่อข้าม record ที่ไม่ต้องการโดยไม่ unpack
+    start: ตำแหน่ง byte ที่เริ่มอ่าน (ต้องตรงกับขอบ record) ใช้อ่านเฉพาะส่วนที่ต่อท้ายมาใหม่
+    stop: ตำแหน่ง byte ที่หยุดอ่าน (ไม่รวม) เช่นขอบท้ายของ segment ใน lendings.dat
+    """
+    if not os.path.exists(filename) or os.path.getsize(filename) <= start:
+        return
+    rec = get_struct(record_format)
+    with locks.scan_lock(filename), open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = len(mm) - len(mm) % rec.size  # ไม่สนใจ record ที่เขียนไม่ครบท้ายไฟล์
+            if stop is not None:
+                end = max(start, min(end, stop))
+            if metrics.enabled:
+                metrics.count_io(filename, scanned=(end - start) // rec.size, read=end - start, opens=1)
+            if statuses is None:
+                view = memoryview(mm)[start:end]
+                try:
+                    yield from rec.iter_unpack(view)
+                finally:
+                    view.release()
+            else:
+                wanted = {s[0] for s in statuses}  # เทียบเป็น int ไม่ต้องสร้าง bytes
+                unpack_from = rec.unpack_from
+                for pos in range(start, end, rec.size):
+                    if mm[pos] in wanted:
+                        yield unpack_from(mm, pos)
+
+def iter_chunks(filename, record_size, start=0, stop=None, chunk_records=CHUNK_RECORDS):
+    """
+    วนคืน (offset, bytes) ของ record ที่ติดกันทีละก้อน ก้อนละไม่เกิน chunk_records record
+    สำหรับงานที่ประมวลผลทั้งก้อนด้วยฟังก์ชันของ C (iter_unpack, bytes.count, min/max) แทนการวนทีละ record
+    start/stop: ช่วง byte ที่อ่าน เหมือน iter_records
+    """
+    if not os.path.exists(filename) or os.path.getsize(filename) <= start:
+        return
+    with locks.scan_lock(filename), open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = len(mm) - len(mm) % record_size
+            if stop is not None:
+                end = max(start, min(end, stop))
+            if metrics.enabled:
+                metrics.count_io(filename, scanned=(end - start) // record_size, read=end - start, opens=1)
+            step = chunk_records * record_size
+            for pos in range(start, end, step):
+                yield pos, mm[pos:min(pos + step, end)]
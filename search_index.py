@@ -0,0 +1,320 @@
+import os, re, bisect, heapq, pickle, unicodedata
+from array import array
+import books, locks, metrics, record_index, records, wal
+
+# ============================================
+# ดัชนีค้นหาหนังสือ (ISBN, ชื่อหนังสือ, ผู้แต่ง)
+# ============================================
+# - ISBN: hash (dict) จาก ISBN ที่ตัดขีด/ช่องว่างแล้ว -> book_id
+# - ชื่อหนังสือ/ผู้แต่ง: inverted index จาก term -> array ของ book_id (เรียงจากน้อยไปมาก)
+#   คำภาษาอังกฤษ/ตัวเลขใช้ทั้งคำเป็น term ค้นแบบ prefix ผ่านรายการ term ที่เรียงไว้ (bisect)
+#   ภาษาไทยไม่มีช่องว่างระหว่างคำ จึงแตกเป็น bigram (ทีละ 2 ตัวอักษร) + ตัวอักษรสุดท้ายของช่วง
+#   คำค้นภาษาไทยจึงหาเจอได้แม้อยู่กลางคำ เช่น "สือ" เจอ "หนังสือ"
+# - ทุกเล่มที่ได้จากดัชนีจะถูกอ่านจาก books.dat (ผ่าน record_index) เพื่อตัดเล่มที่ถูกลบแล้วออก
+#   คำค้นภาษาไทยที่ยาวกว่า 2 ตัวอักษร (ดัชนีบอกได้แค่ว่ามี bigram ครบ) จะตรวจข้อความจริงซ้ำอีกชั้น
+# - ถ้าโปรแกรมล่มหลังเขียน books.dat แต่ก่อนบันทึก journal ให้เรียก rebuild_search_index()
+#
+# เก็บบนดิสก์เป็น snapshot (books.sdx) + journal ของการแก้ไข (books.sdj)
+# - record ที่ต่อท้าย books.dat หลัง snapshot ไม่ต้องลง journal: อ่านต่อจากขนาดไฟล์ที่เคยอ่านถึง
+# - การแก้ไข/ลบ (เขียนทับ record เดิม) ต่อท้าย journal เป็นคู่ (record เดิม, record ใหม่) แบบ bytes ดิบ
+#   ตามรูปแบบของ books.dat ตอนนั้น (ข้อความของรูปแบบ 2 อยู่ใน heap ที่มีแต่ต่อท้าย จึง decode ภายหลังได้)
+# - inode ของ books.dat เปลี่ยน (compaction) -> สร้างใหม่ทั้งหมด
+# - การเขียน journal (ใน after-callback ของ WAL) และการเริ่ม snapshot ใหม่ทำภายใต้ commit lock
+#   โปรแกรมอื่นจึงไม่เขียน journal เก่าทิ้งไว้ระหว่างที่ snapshot ถูกแทนที่
+SEARCH_SNAPSHOT_FILE = 'books.sdx'
+SEARCH_JOURNAL_FILE = 'books.sdj'
+SEARCH_INDEX_VERSION = 1
+SNAPSHOT_EVERY = 5000  # อ่าน journal/record ใหม่เกินนี้ในครั้งเดียว -> เขียน snapshot ใหม่
+DEFAULT_LIMIT = 20
+
+TOKEN_RE = re.compile('([\u0e00-\u0e7f]+)|[^\\W_\u0e00-\u0e7f]+')  # ช่วงภาษาไทย | คำอื่น ๆ
+ISBN_STRIP_RE = re.compile(r'[\s-]+')
+MAX_CHAR = '\U0010ffff'
+
+_state = None  # ดัชนีที่โหลดไว้แล้วในโปรเซสนี้
+
+def isbn_key(isbn):
+    return ISBN_STRIP_RE.sub('', isbn).upper()
+
+def _pieces(text):
+    """แยกข้อความเป็น [(เป็นภาษาไทยหรือไม่, ข้อความ)] หลัง normalize (NFC + ตัวพิมพ์เล็ก)"""
+    text = unicodedata.normalize('NFC', text).lower()
+    return [(m.group(1) is not None, m.group(0)) for m in TOKEN_RE.finditer(text)]
+
+def _terms(text):
+    terms = set()
+    for thai, piece in _pieces(text):
+        if thai:
+            terms.update(piece[i:i + 2] for i in range(len(piece) - 1))
+            terms.add(piece[-1])  # ทุกตัวอักษรจึงเป็นตัวแรกของ term ใดสัก term (ใช้ค้นคำค้น 1 ตัวอักษร)
+        else:
+            terms.add(piece)
+    return terms
+
+def _document(record):
+    """record ของ books.dat (decode แล้ว) -> (book_id, ISBN key, ชุด term) หรือ None ถ้า record ถูกลบ"""
+    status, book_id, isbn, title, author, qty = record
+    if status != books.STATUS_ACTIVE:
+        return None
+    return book_id, isbn_key(isbn), _terms(title + '\n' + author)
+
+# ============================================
+# การเพิ่ม/ลบ book_id ในดัชนีที่อยู่ในหน่วยความจำ
+# ============================================
+def _empty_state(ino, journal_ino):
+    return {
+        'version': SEARCH_INDEX_VERSION,
+        'ino': ino,  # inode ของ books.dat
+        'size': 0,  # อ่าน books.dat มาถึง byte นี้แล้ว
+        'journal_ino': journal_ino, 'journal': 0,  # อ่าน journal มาถึง byte นี้แล้ว
+        'isbn': {},  # ISBN -> book_id (หรือ tuple ถ้ามีหลายเล่มใช้ ISBN เดียวกัน)
+        'postings': {},  # term -> array('i') ของ book_id
+        'terms': [],  # term ทั้งหมดเรียงตามตัวอักษร (สำหรับค้นแบบ prefix)
+    }
+
+def _add(state, record, new_terms=None):
+    """new_terms: ถ้ากำหนด จะเก็บ term ใหม่ไว้ในนี้แทนการแทรกลง state['terms'] ทีละตัว (ผู้เรียกเรียงเอง)"""
+    doc = _document(record)
+    if doc is None:
+        return
+    book_id, key, terms = doc
+    ids = state['isbn'].get(key)
+    if ids is None:
+        state['isbn'][key] = book_id
+    elif isinstance(ids, int):
+        if ids != book_id:
+            state['isbn'][key] = (ids, book_id)
+    elif book_id not in ids:
+        state['isbn'][key] = ids + (book_id,)
+    postings = state['postings']
+    for term in terms:
+        ids = postings.get(term)
+        if ids is None:
+            postings[term] = array('i', [book_id])
+            if new_terms is None:
+                bisect.insort(state['terms'], term)
+            else:
+                new_terms.append(term)
+            continue
+        i = bisect.bisect_left(ids, book_id)
+        if i == len(ids) or ids[i] != book_id:
+            ids.insert(i, book_id)
+
+def _remove(state, record):
+    doc = _document(record)
+    if doc is None:
+        return
+    book_id, key, terms = doc
+    ids = state['isbn'].get(key)
+    if ids == book_id:
+        del state['isbn'][key]
+    elif isinstance(ids, tuple) and book_id in ids:
+        rest = tuple(i for i in ids if i != book_id)
+        state['isbn'][key] = rest[0] if len(rest) == 1 else rest
+    postings = state['postings']
+    for term in terms:
+        ids = postings.get(term)
+        if ids is None:
+            continue
+        i = bisect.bisect_left(ids, book_id)
+        if i < len(ids) and ids[i] == book_id:
+            del ids[i]
+            if not ids:
+                del postings[term]
+                del state['terms'][bisect.bisect_left(state['terms'], term)]
+
+# ============================================
+# snapshot + journal บนดิสก์
+# ============================================
+def _file_ino(filename):
+    return os.stat(filename).st_ino if os.path.exists(filename) else None
+
+def _save_snapshot(state):
+    """เขียน snapshot แล้วเริ่ม journal ใหม่ (ไฟล์ใหม่ = inode ใหม่ โปรเซสอื่นจะรู้ว่าต้องโหลด snapshot ใหม่)"""
+    journal_tmp = SEARCH_JOURNAL_FILE + '.tmp'
+    open(journal_tmp, 'wb').close()
+    state['journal_ino'] = _file_ino(journal_tmp)
+    state['journal'] = 0
+    tmp_path = SEARCH_SNAPSHOT_FILE + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, SEARCH_SNAPSHOT_FILE)
+    os.replace(journal_tmp, SEARCH_JOURNAL_FILE)
+
+def _read_snapshot():
+    if not os.path.exists(SEARCH_SNAPSHOT_FILE):
+        return None
+    try:
+        with open(SEARCH_SNAPSHOT_FILE, 'rb') as f:
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    return state if state.get('version') == SEARCH_INDEX_VERSION else None
+
+def _replay_journal(state):
+    """นำการแก้ไขใน journal ที่ยังไม่ได้อ่านมาปรับดัชนี คืนจำนวน entry"""
+    if not os.path.exists(SEARCH_JOURNAL_FILE):
+        return 0
+    size = records.record_size(books.BOOKS_FILE)
+    with open(SEARCH_JOURNAL_FILE, 'rb') as f:
+        f.seek(state['journal'])
+        data = f.read()
+    data = data[:len(data) - len(data) % (size * 2)]
+    for pos in range(0, len(data), size * 2):
+        _remove(state, records.decode(books.BOOKS_FILE, data[pos:pos + size]))
+        _add(state, records.decode(books.BOOKS_FILE, data[pos + size:pos + size * 2]))
+    state['journal'] += len(data)
+    return len(data) // (size * 2)
+
+def _catch_up(state):
+    """เพิ่ม record ที่ต่อท้าย books.dat หลังจากที่ดัชนีอ่านไว้ คืนจำนวน record"""
+    size = records.record_size(books.BOOKS_FILE)
+    state['size'] = max(state['size'], records.data_start(books.BOOKS_FILE))  # ข้าม header ของรูปแบบ 2
+    count = 0
+    new_terms = []
+    for record in records.iter_decoded(books.BOOKS_FILE, start=state['size']):
+        state['size'] += size
+        count += 1
+        if record[0] == books.STATUS_ACTIVE:
+            _add(state, record, new_terms)
+    if new_terms:
+        state['terms'] = sorted(state['terms'] + new_terms)
+    return count
+
+def load_search_index():
+    """คืนดัชนีที่ตรงกับ books.dat ปัจจุบัน (โหลด snapshot / อ่านต่อ / สร้างใหม่ตามความจำเป็น)"""
+    global _state
+    ino = _file_ino(books.BOOKS_FILE)
+    journal_ino = _file_ino(SEARCH_JOURNAL_FILE)
+    state = _state
+    if state is None or state['ino'] != ino or state['journal_ino'] != journal_ino:
+        state = _read_snapshot()
+        if state is None or state['ino'] != ino or state['journal_ino'] != journal_ino:
+            return rebuild_search_index()
+    changed = _replay_journal(state) + _catch_up(state)
+    if changed >= SNAPSHOT_EVERY:
+        with locks.commit_lock():
+            _replay_journal(state)  # entry ที่เขียนเพิ่มก่อนได้ล็อก
+            _save_snapshot(state)
+    _state = state
+    return state
+
+def rebuild_search_index():
+    """สร้างดัชนีใหม่จาก books.dat ทั้งไฟล์แล้วเขียน snapshot"""
+    global _state
+    # scan_lock ก่อน commit_lock ตามลำดับการล็อกใน locks.py
+    with locks.scan_lock(books.BOOKS_FILE), locks.commit_lock():
+        _state = _empty_state(_file_ino(books.BOOKS_FILE), None)
+        _catch_up(_state)
+        _save_snapshot(_state)
+    return _state
+
+def note_append(offset, record):
+    """เรียกหลังต่อท้าย record ใหม่ใน books.dat (ถ้าไม่ได้เรียก จะอ่านต่อจากท้ายไฟล์ตอนค้นหาครั้งถัดไปเอง)"""
+    state = _state
+    if state is not None and state['size'] == offset and state['ino'] == _file_ino(books.BOOKS_FILE):
+        _add(state, records.decode(books.BOOKS_FILE, record))
+        state['size'] = offset + len(record)
+
+def note_update(old_record, new_record):
+    """เรียกหลังเขียนทับ record ใน books.dat (แก้ไข/ลบ) เพื่อบันทึกลง journal"""
+    if not os.path.exists(SEARCH_SNAPSHOT_FILE):
+        return  # ยังไม่เคยสร้างดัชนี จะสร้างจาก books.dat ตอนค้นหาครั้งแรก
+    entry_size = len(old_record) + len(new_record)
+    with open(SEARCH_JOURNAL_FILE, 'ab') as f:
+        f.write(old_record + new_record)
+        end = f.tell()
+        journal_ino = os.fstat(f.fileno()).st_ino
+    state = _state
+    if state is not None and state['journal_ino'] == journal_ino and state['journal'] == end - entry_size:
+        _remove(state, records.decode(books.BOOKS_FILE, old_record))
+        _add(state, records.decode(books.BOOKS_FILE, new_record))
+        state['journal'] = end
+
+# ============================================
+# การค้นหา
+# ============================================
+def _prefix_postings(state, prefix):
+    """posting ของทุก term ที่ขึ้นต้นด้วย prefix"""
+    terms = state['terms']
+    lo = bisect.bisect_left(terms, prefix)
+    hi = bisect.bisect_left(terms, prefix + MAX_CHAR, lo)
+    return [state['postings'][term] for term in terms[lo:hi]]
+
+def _union(postings):
+    """รวมหลาย posting เป็น book_id เรียงจากน้อยไปมากไม่ซ้ำ (แบบ lazy ผ่าน heapq.merge)"""
+    last = None
+    for book_id in heapq.merge(*postings):
+        if book_id != last:
+            yield book_id
+            last = book_id
+
+def _contains(ids, book_id):
+    i = bisect.bisect_left(ids, book_id)
+    return i < len(ids) and ids[i] == book_id
+
+def _matches(record, pieces):
+    """ตรวจข้อความจริงของ record ว่ามีคำค้นภาษาไทยทุกช่วง (คำอื่น ๆ ดัชนีตอบได้ตรงอยู่แล้ว)"""
+    text = record[3] + '\n' + record[4]
+    text = unicodedata.normalize('NFC', text).lower()
+    return all(piece in text for thai, piece in pieces if thai)
+
+def _read_books(book_ids, limit=None, check=None):
+    """อ่าน record (decode แล้ว) ของ book_id ตามลำดับ เฉพาะที่ยังไม่ถูกลบ (และผ่าน check) ได้ไม่เกิน limit เล่ม"""
+    results = []
+    if not book_ids:
+        return results
+    size = records.record_size(books.BOOKS_FILE)
+    index = record_index.load_index(books.BOOKS_FILE, size)
+    if metrics.enabled:
+        metrics.count_io(books.BOOKS_FILE, opens=1)
+    with open(books.BOOKS_FILE, 'rb') as f:
+        for book_id in book_ids:
+            # ใช้ดัชนี ID ที่โหลดไว้ครั้งเดียว ถ้าไม่ตรง (เช่นยังรออยู่ใน WAL) ค่อยใช้ read_by_id
+            slot = index.get(book_id)
+            record = None if slot is None else wal.read_at(f, books.BOOKS_FILE, slot * size, size)
+            if record is None or len(record) != size or int.from_bytes(record[1:5], 'little', signed=True) != book_id:
+                _, record = record_index.read_by_id(f, books.BOOKS_FILE, size, book_id)
+                if record is None:
+                    continue
+            if record[:1] != books.STATUS_ACTIVE:
+                continue
+            record = records.decode(books.BOOKS_FILE, record)
+            if check and not check(record):
+                continue
+            results.append(record)
+            if limit is not None and len(results) >= limit:
+                break
+    return results
+
+def find_by_isbn(isbn):
+    """คืน record (tuple) ของหนังสือที่มี ISBN นี้"""
+    if not os.path.exists(books.BOOKS_FILE):
+        return []
+    key = isbn_key(isbn)
+    ids = load_search_index()['isbn'].get(key)
+    if ids is None:
+        return []
+    return _read_books((ids,) if isinstance(ids, int) else ids,
+                       check=lambda record: isbn_key(record[2]) == key)
+
+def search(query, limit=DEFAULT_LIMIT):
+    """ค้นหนังสือจากชื่อหรือผู้แต่ง (ทุกคำในคำค้นต้องตรง) คืน record เรียงตาม book_id ไม่เกิน limit เล่ม"""
+    pieces = _pieces(query)
+    if not pieces or not os.path.exists(books.BOOKS_FILE):
+        return []
+    state = load_search_index()
+    groups = []  # แต่ละส่วนของคำค้น -> รายการ posting (book_id ต้องอยู่ใน posting ใดก็ได้ของกลุ่ม)
+    for thai, piece in pieces:
+        if thai and len(piece) > 1:
+            groups.extend([state['postings'].get(piece[i:i + 2], ())] for i in range(len(piece) - 1))
+        else:
+            groups.append(_prefix_postings(state, piece))
+    # เดินตามกลุ่มที่เล็กที่สุด แล้วตรวจว่า book_id อยู่ในกลุ่มอื่นครบทุกกลุ่ม
+    groups.sort(key=lambda group: sum(map(len, group)))
+    smallest, others = groups[0], groups[1:]
+    others = [group[0] if len(group) == 1 else sorted(set().union(*group)) for group in others]
+    driver = smallest[0] if len(smallest) == 1 else _union(smallest)
+    candidates = (book_id for book_id in driver if all(_contains(ids, book_id) for ids in others))
+    exact = all(not thai or len(piece) <= 2 for thai, piece in pieces)
+    return _read_books(candidates, limit, check=None if exact else lambda record: _matches(record, pieces))
@@ -0,0 +1,273 @@
+import os, sys, json, time, bisect, struct, argparse
+import locks, lendings, open_loans, record_index, wal
+from scan import iter_records
+
+# ============================================
+# แบ่ง lendings แบบตามเวลา: segment รายเดือนของ borrow_date พร้อมสรุปของแต่ละ segment
+# ============================================
+# lendings.dat เป็นส่วน "ร้อน" (hot) ที่ยังรับการยืม/คืนอยู่ record ถูกต่อท้ายตามลำดับเวลา
+# ช่วงติดกันของ record ที่ยืมในเดือนเดียวกันจึงเป็น 1 segment (ไม่ต้องแยกไฟล์ WAL / ดัชนี ID /
+# open loans / checkpoint ของรายงานที่อ้าง offset ของ lendings.dat จึงใช้ได้เหมือนเดิม)
+# สรุปของ segment: เดือน, slot แรก, จำนวน record, borrow_date ต่ำสุด/สูงสุด, ID ต่ำสุด/สูงสุด,
+# จำนวนที่ยังไม่คืน ถูกดูแลไปพร้อมกับดัชนี open loans (อ่านต่อท้าย + lendings.chg แบบเดียวกัน)
+# - iter_lendings(start, end) ข้าม segment ที่ช่วงวันที่ไม่ทับกับช่วงที่ถามทั้ง segment
+#   และถ้าถามเฉพาะที่ยังไม่คืน จะข้าม segment ที่คืนครบแล้ว
+# - archive(before) ย้าย segment ต้นไฟล์ที่คืนครบแล้วและเก่ากว่าเดือน before ไปเป็นไฟล์
+#   lendings-YYYY-MM.dat (segment ส่วน "เย็น" ไม่ถูกเขียนอีก) รายชื่อ + สรุปอยู่ใน lendings.arc (JSON)
+#   ลำดับ: เขียนไฟล์ archive -> บันทึก lendings.arc -> ตัดต้น lendings.dat (os.replace แบบ compaction)
+#   ถ้าโปรแกรมล่มก่อนตัด recover() จะตัด record ที่ ID ไม่เกิน ID สูงสุดของ archive ออกให้
+# ID ของการยืมไม่ถูกแจกซ้ำ: ID สูงสุดถูกบันทึกลง .seq ก่อนตัด (แบบเดียวกับ compaction)
+# การยืมที่ยังไม่คืนอยู่ใน lendings.dat เสมอ การคืนจึงยังหา ID ผ่านดัชนีได้ทันทีเหมือนเดิม
+# ประวัติทั้งหมด (รายงาน, view_lendings) = ไฟล์ archive ตามลำดับใน lendings.arc แล้วต่อด้วย lendings.dat
+ARCHIVE_MANIFEST = 'lendings.arc'
+ARCHIVE_PREFIX = 'lendings-'
+MONTH_FORMAT = '%Y-%m'
+DATE_STRUCT = struct.Struct('< 13x d 8x')  # เฉพาะ borrow_date จาก record ของ lendings.dat
+
+def month_bounds(ts):
+    """เดือนของ timestamp: ('YYYY-MM', เวลาเริ่มเดือน, เวลาเริ่มเดือนถัดไป) ตามเวลาท้องถิ่น"""
+    t = time.localtime(ts)
+    start = time.mktime((t.tm_year, t.tm_mon, 1, 0, 0, 0, 0, 0, -1))
+    end = time.mktime((t.tm_year + t.tm_mon // 12, t.tm_mon % 12 + 1, 1, 0, 0, 0, 0, 0, -1))
+    return f'{t.tm_year:04d}-{t.tm_mon:02d}', start, end
+
+def parse_month(text):
+    """'YYYY-MM' -> (เวลาเริ่มเดือน, เวลาเริ่มเดือนถัดไป) (ValueError ถ้ารูปแบบไม่ถูกต้อง)"""
+    t = time.strptime(text.strip(), MONTH_FORMAT)
+    return month_bounds(time.mktime(t))[1:]
+
+# ============================================
+# สรุปของ segment ใน lendings.dat (เก็บใน state ของ open_loans)
+# ============================================
+def note_records(segments, data, first_slot):
+    """
+    เพิ่ม record ที่ติดกันใน data (bytes ของ lendings.dat เริ่มที่ slot first_slot ต้องเรียกตามลำดับในไฟล์)
+    เข้าสรุปของ segment: วนลูป Python เฉพาะการเทียบวันที่กับขอบเดือน ส่วนการนับที่ยังไม่คืนและ
+    ค่าต่ำสุด/สูงสุดทำทีละช่วงของเดือนเดียวกันด้วยฟังก์ชันของ C
+    """
+    size = DATE_STRUCT.size
+    dates = [d for d, in DATE_STRUCT.iter_unpack(data)]
+    i = 0
+    while i < len(dates):
+        seg = segments[-1] if segments else None
+        if seg is None or not seg['month_start'] <= dates[i] < seg['month_end']:
+            month, month_start, month_end = month_bounds(dates[i])
+            lid = int.from_bytes(data[i * size + 1:i * size + 5], 'little', signed=True)
+            seg = {'month': month, 'month_start': month_start, 'month_end': month_end,
+                   'first_slot': first_slot + i, 'records': 0, 'min_date': dates[i], 'max_date': dates[i],
+                   'min_id': lid, 'max_id': lid, 'open': 0}
+            segments.append(seg)
+        lo, hi = seg['month_start'], seg['month_end']
+        j = i + 1
+        while j < len(dates) and lo <= dates[j] < hi:
+            j += 1
+        run = dates[i:j]
+        seg['records'] += j - i
+        seg['min_date'] = min(seg['min_date'], min(run))
+        seg['max_date'] = max(seg['max_date'], max(run))
+        seg['max_id'] = max(seg['max_id'], int.from_bytes(data[(j - 1) * size + 1:(j - 1) * size + 5],
+                                                          'little', signed=True))
+        seg['open'] += data[i * size:j * size:size].count(lendings.STATUS_BORROWED)
+        i = j
+
+def note_return(segments, lid):
+    """ลดจำนวนที่ยังไม่คืนของ segment ที่มี lending_id นี้ (ID เพิ่มขึ้นตามลำดับในไฟล์)"""
+    i = bisect.bisect_right(segments, lid, key=lambda seg: seg['min_id']) - 1
+    if i >= 0 and lid <= segments[i]['max_id']:
+        segments[i]['open'] -= 1
+
+# ============================================
+# ไฟล์ archive
+# ============================================
+def load_manifest():
+    """รายการ segment ที่ archive แล้วตามลำดับเวลา [{'file', 'month', 'records', 'min_date', ...}]"""
+    if not os.path.exists(ARCHIVE_MANIFEST):
+        return []
+    with open(ARCHIVE_MANIFEST, encoding='utf-8') as f:
+        return json.load(f)['segments']
+
+def _save_manifest(archived):
+    tmp_path = f'{ARCHIVE_MANIFEST}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'segments': archived}, f, ensure_ascii=False, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, ARCHIVE_MANIFEST)
+
+def is_archive_file(name):
+    return name.startswith(ARCHIVE_PREFIX) and name.endswith('.dat')
+
+def _archive_name(month, archived):
+    """lendings-YYYY-MM.dat (เติม .2, .3 ... ถ้าเดือนนั้นเคยถูก archive แยกเป็นหลายช่วง)"""
+    used = {seg['file'] for seg in archived}
+    name, n = f'{ARCHIVE_PREFIX}{month}.dat', 1
+    while name in used or os.path.exists(name):
+        n += 1
+        name = f'{ARCHIVE_PREFIX}{month}.{n}.dat'
+    return name
+
+def all_segments():
+    """สรุปของทุก segment ตามลำดับเวลา (archive ก่อน แล้วต่อด้วย segment ใน lendings.dat)"""
+    hot = [dict(seg, file=lendings.LENDINGS_FILE) for seg in open_loans.load_open_loans()['segments']]
+    return [dict(seg, open=0) for seg in load_manifest()] + hot
+
+# ============================================
+# การอ่านประวัติการยืม (ข้าม segment ที่ไม่เกี่ยวข้อง)
+# ============================================
+def _overlaps(seg, start, end):
+    return (start is None or seg['max_date'] >= start) and (end is None or seg['min_date'] < end)
+
+def lending_ranges(start=None, end=None, statuses=None):
+    """
+    วนคืน (ไฟล์, byte เริ่ม, byte หยุดหรือ None) ของช่วง record ที่อาจมีการยืมในช่วง borrow_date [start, end)
+    ตามลำดับเวลา (ข้าม segment ที่ไม่เกี่ยวข้องทั้ง segment) record ในช่วงยังต้องตรวจวันที่/สถานะเอง
+    ต้องเรียกภายใต้ scan lock ของ lendings.dat (ดู iter_lendings)
+    """
+    size = lendings.LENDING_RECORD_SIZE
+    open_only = statuses is not None and set(statuses) == {lendings.STATUS_BORROWED}
+    ranged = start is not None or end is not None
+    if not open_only:  # archive มีแต่การยืมที่คืนแล้ว
+        for seg in load_manifest():
+            if _overlaps(seg, start, end):
+                yield seg['file'], 0, None
+    if not ranged and not open_only:
+        yield lendings.LENDINGS_FILE, 0, None
+        return
+    for seg in open_loans.load_open_loans()['segments']:
+        if not _overlaps(seg, start, end) or (open_only and seg['open'] == 0):
+            continue
+        first = seg['first_slot'] * size
+        yield lendings.LENDINGS_FILE, first, first + seg['records'] * size
+
+def iter_lendings(start=None, end=None, statuses=None):
+    """
+    วนคืน tuple ของ record การยืมตามลำดับเวลา (archive แล้วต่อด้วย lendings.dat) เหมือน iter_records
+    start/end: ช่วง borrow_date [start, end) ที่ต้องการ (None = ไม่จำกัด)
+    statuses: เช่น (STATUS_BORROWED,) ถ้าถามเฉพาะที่ยังไม่คืนจะข้าม segment ที่คืนครบแล้ว
+    """
+    ranged = start is not None or end is not None
+    # ถือ scan lock ตลอดการอ่าน: archive() ย้าย record จาก lendings.dat ไปไฟล์ archive ไม่ได้ระหว่างนี้
+    # (ไม่อ่านซ้ำ/ตกหล่น และ slot ในสรุปของ segment ยังถูกต้อง)
+    with locks.scan_lock(lendings.LENDINGS_FILE):
+        for filename, first, stop in lending_ranges(start, end, statuses):
+            for record in iter_records(filename, lendings.LENDING_FORMAT, statuses, first, stop):
+                if not ranged or ((start is None or record[4] >= start) and (end is None or record[4] < end)):
+                    yield record
+
+# ============================================
+# archive segment เก่าที่คืนครบแล้ว
+# ============================================
+def _trim_hot(data, cut):
+    """เขียน lendings.dat ใหม่โดยตัด cut bytes แรกออก (เรียกภายใต้ compaction lock + commit lock)"""
+    size = lendings.LENDING_RECORD_SIZE
+    if data:
+        last_id = int.from_bytes(data[len(data) - size + 1:len(data) - size + 5], 'little', signed=True)
+        if last_id > record_index.read_high_water(lendings.LENDINGS_FILE):
+            record_index.save_high_water(lendings.LENDINGS_FILE, last_id)
+    tmp_path = lendings.LENDINGS_FILE + '.archive'
+    with open(tmp_path, 'wb') as f:
+        f.write(data[cut:])
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, lendings.LENDINGS_FILE)
+    # ดัชนี ID, open loans และ checkpoint ของรายงานจะสร้างใหม่เองเพราะ inode เปลี่ยน
+    record_index.rebuild_index(lendings.LENDINGS_FILE, size)
+
+def _read_hot():
+    """อ่าน lendings.dat ทั้งไฟล์หลังล้าง WAL (ธุรกรรมใน WAL อ้างถึง offset ของไฟล์เดิม)"""
+    wal.flush()
+    wal.checkpoint()
+    if not os.path.exists(lendings.LENDINGS_FILE):
+        return b''
+    with open(lendings.LENDINGS_FILE, 'rb') as f:
+        data = f.read()
+    return data[:len(data) - len(data) % lendings.LENDING_RECORD_SIZE]
+
+def _archived_prefix(data, archived):
+    """จำนวน bytes ต้นไฟล์ที่ถูก archive แล้ว (เหลือค้างถ้าโปรแกรมล่มระหว่าง archive ครั้งก่อน)"""
+    if not archived:
+        return 0
+    max_id = max(seg['max_id'] for seg in archived)
+    size = lendings.LENDING_RECORD_SIZE
+    pos = 0
+    while pos < len(data) and int.from_bytes(data[pos + 1:pos + 5], 'little', signed=True) <= max_id:
+        pos += size
+    return pos
+
+def recover():
+    """ตัด record ที่ถูก archive ไปแล้วแต่ยังค้างอยู่ต้น lendings.dat ออก คืนจำนวน record ที่ตัด"""
+    archived = load_manifest()
+    if not archived or not os.path.exists(lendings.LENDINGS_FILE):
+        return 0
+    with open(lendings.LENDINGS_FILE, 'rb') as f:
+        first = f.read(5)
+    if len(first) < 5 or int.from_bytes(first[1:5], 'little', signed=True) > archived[-1]['max_id']:
+        return 0
+    with locks.compaction_lock(lendings.LENDINGS_FILE), locks.commit_lock():
+        data = _read_hot()
+        cut = _archived_prefix(data, archived)
+        if cut:
+            _trim_hot(data, cut)
+    return cut // lendings.LENDING_RECORD_SIZE
+
+def _month_groups(data):
+    """แบ่ง record ใน data เป็น segment รายเดือน [(สรุปแบบ note_records, offset เริ่ม, offset จบ)]"""
+    size = lendings.LENDING_RECORD_SIZE
+    segments = []
+    note_records(segments, data, 0)
+    return [(seg, seg['first_slot'] * size, (seg['first_slot'] + seg['records']) * size) for seg in segments]
+
+def archive(before):
+    """
+    ย้าย segment ต้น lendings.dat ที่ยืมก่อนเดือน before ('YYYY-MM') และคืนครบแล้วไปเป็นไฟล์ archive
+    (segment ล่าสุดของไฟล์ยังคงอยู่เสมอ) คืนรายการสรุปของ segment ที่ย้าย
+    """
+    cutoff = parse_month(before)[0]
+    with locks.compaction_lock(lendings.LENDINGS_FILE), locks.commit_lock():
+        data = _read_hot()
+        archived = load_manifest()
+        skip = _archived_prefix(data, archived)  # archive ครั้งก่อนที่ตัดไม่เสร็จ
+        moved, cut = [], skip
+        for seg, first, last in _month_groups(data[skip:])[:-1]:
+            if seg['month_end'] > cutoff or seg['open']:
+                break
+            name = _archive_name(seg['month'], archived + moved)
+            with open(name, 'wb') as f:
+                f.write(data[skip + first:skip + last])
+                f.flush()
+                os.fsync(f.fileno())
+            moved.append({'file': name, 'month': seg['month'], 'records': seg['records'],
+                          'min_date': seg['min_date'], 'max_date': seg['max_date'],
+                          'min_id': seg['min_id'], 'max_id': seg['max_id']})
+            cut = skip + last
+        if moved:
+            _save_manifest(archived + moved)
+        if cut:
+            _trim_hot(data, cut)
+    return moved
+
+def print_segments():
+    print(f"{'เดือน':<10}{'ไฟล์':<24}{'record':>10}{'ยังไม่คืน':>10}{'ID':>22}  ช่วงวันที่ยืม")
+    for seg in all_segments():
+        dates = ' - '.join(time.strftime('%Y-%m-%d', time.localtime(seg[key])) for key in ('min_date', 'max_date'))
+        ids = f"{seg['min_id']}-{seg['max_id']}"
+        print(f"{seg['month']:<10}{seg['file']:<24}{seg['records']:>10,}{seg['open']:>10,}{ids:>22}  {dates}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="แสดง segment รายเดือนของประวัติการยืม และ archive segment เก่า")
+    parser.add_argument('--archive', metavar='YYYY-MM',
+                        help="ย้าย segment ที่ยืมก่อนเดือนนี้และคืนครบแล้วไปเป็นไฟล์ lendings-YYYY-MM.dat")
+    args = parser.parse_args(argv)
+    wal.recover()
+    recover()
+    if args.archive:
+        moved = archive(args.archive)
+        for seg in moved:
+            print(f"✅ {seg['month']}: {seg['records']:,} record -> {seg['file']}")
+        if not moved:
+            print("ไม่มี segment ที่ archive ได้")
+    print_segments()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
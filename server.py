@@ -0,0 +1,251 @@
+import sys, json, time, signal, asyncio, argparse, traceback
+from concurrent.futures import ThreadPoolExecutor
+import books, members, lendings, open_loans, overdue, record_index, records, report, search_index, segments, wal
+
+# ============================================
+# โหมด server: ให้บริการข้อมูลห้องสมุดผ่าน TCP (JSON บรรทัดละ 1 คำขอ) ให้หลาย client พร้อมกัน
+# ============================================
+# ใช้: python server.py [--host 127.0.0.1] [--port 8765]
+# คำขอ:  {"id": 1, "op": "borrow", "book_id": 3, "member_id": 7}
+# คำตอบ: {"id": 1, "ok": true, "result": {...}} หรือ {"id": 1, "ok": false, "error": "..."}
+# op ที่รองรับ: ping, info, book, member, isbn, search, loans, report, overdue (อ่าน) / borrow, return (เขียน)
+#
+# - ตอนเริ่ม recover WAL แล้วโหลดดัชนี ID -> ตำแหน่ง, ดัชนีค้นหา และ open loans ไว้ในหน่วยความจำครั้งเดียว
+#   คำขออ่านใช้ดัชนีเหล่านี้ (อ่าน record ทีละตัวจากดัชนี) จึงยังเห็นการแก้จากโปรแกรมอื่นที่ใช้ไฟล์ชุดเดียวกัน
+# - การยืม/คืนทุกคำขอเข้าคิวของ writer task ตัวเดียว ซึ่งรวมคำขอที่รออยู่เป็นชุดเดียวใน wal.group_commit()
+#   (fsync ครั้งเดียวต่อชุด) แล้วค่อยตอบ client หลัง flush เสร็จ (ข้อมูลถาวรแล้ว)
+# - การอ่าน/เขียนไฟล์ทั้งหมดทำบน storage thread เดียว: สถานะล็อก ดัชนี และ WAL เป็นของทั้งโปรเซส
+#   (ไม่ปลอดภัยถ้าหลาย thread ใช้พร้อมกัน) event loop ทำเฉพาะรับ/ส่งข้อมูลกับ client
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+MAX_BATCH = wal.GROUP_COMMIT_MAX_ENTRIES  # คำขอเขียนต่อชุดสูงสุด
+MAX_LINE = 1 << 16  # ความยาวคำขอสูงสุด (bytes)
+
+class RequestError(Exception):
+    """คำขอไม่ถูกต้องหรือไม่พบข้อมูล (ส่งข้อความกลับให้ client)"""
+    pass
+
+def _int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RequestError(f"{name} ต้องเป็นตัวเลข")
+
+def _book_dict(book):
+    status, bid, isbn, title, author, qty = book
+    return {'book_id': bid, 'isbn': isbn, 'title': title, 'author': author, 'qty': qty}
+
+def _found_books(results):
+    """ผลจาก search_index (record ที่ decode แล้ว)"""
+    return [_book_dict(book) for book in results]
+
+def _loan_dict(loan):
+    lid, bid, mid, borrow_date = loan
+    return {'lending_id': lid, 'book_id': bid, 'member_id': mid, 'borrow_date': borrow_date}
+
+# ============================================
+# คำขอแต่ละแบบ (เรียกบน storage thread เท่านั้น)
+# ============================================
+def op_ping():
+    return 'pong'
+
+def op_info():
+    return {
+        'last_book_id': records.get_last_id(books.BOOKS_FILE, records.record_size(books.BOOKS_FILE)),
+        'last_member_id': records.get_last_id(members.MEMBERS_FILE, records.record_size(members.MEMBERS_FILE)),
+        'last_lending_id': records.get_last_id(lendings.LENDINGS_FILE, lendings.LENDING_RECORD_SIZE),
+        'open_loans': len(open_loans.load_open_loans()['open']),
+        'record_cache': records.cache_stats(),
+    }
+
+def op_book(book_id):
+    _, book = records.read(books.BOOKS_FILE, _int(book_id, 'book_id'))
+    if not book or book[0] != books.STATUS_ACTIVE:
+        raise RequestError("ไม่พบหนังสือ")
+    return _book_dict(book)
+
+def op_member(member_id):
+    _, member = records.read(members.MEMBERS_FILE, _int(member_id, 'member_id'))
+    if not member or member[0] != members.STATUS_ACTIVE:
+        raise RequestError("ไม่พบสมาชิก")
+    status, mid, name, phone = member
+    return {'member_id': mid, 'name': name, 'phone': phone, 'loans': open_loans.count_by_member(mid)}
+
+def op_isbn(isbn):
+    return _found_books(search_index.find_by_isbn(str(isbn)))
+
+def op_search(query, limit=search_index.DEFAULT_LIMIT):
+    return _found_books(search_index.search(str(query), _int(limit, 'limit')))
+
+def op_loans(member_id=None, book_id=None):
+    if member_id is not None:
+        loans = lendings.member_loans(_int(member_id, 'member_id'))
+    elif book_id is not None:
+        loans = lendings.book_loans(_int(book_id, 'book_id'))
+    else:
+        raise RequestError("ต้องระบุ member_id หรือ book_id")
+    return [_loan_dict(loan) for loan in loans]
+
+def op_report(engine=None):
+    try:
+        return report.build_report(engine)
+    except ValueError as e:
+        raise RequestError(str(e))
+
+def op_overdue(limit=None, next=overdue.NEXT_DUE_COUNT):
+    rows, upcoming, (count, total_fine, _) = overdue.collect_overdue(next_count=_int(next, 'next'))
+    if limit is not None:
+        rows = rows[:_int(limit, 'limit')]
+    return {'count': count, 'total_fine': total_fine,
+            'loans': [{'lending_id': lid, 'member': name, 'title': title, 'borrow_date': borrow_date,
+                       'days_overdue': days, 'fine': fine} for lid, name, _, title, borrow_date, days, fine in rows],
+            'next_due': [{'lending_id': lid, 'member': name, 'title': title, 'due_date': due}
+                         for lid, name, title, due in upcoming]}
+
+def op_borrow(book_id, member_id):
+    lending_id, title, member_name = lendings.borrow(_int(book_id, 'book_id'), _int(member_id, 'member_id'))
+    return {'lending_id': lending_id, 'title': title, 'member': member_name}
+
+def op_return(lending_id):
+    return {'fine': lendings.return_lending(_int(lending_id, 'lending_id'))}
+
+READ_OPS = {
+    'ping': op_ping, 'info': op_info, 'book': op_book, 'member': op_member,
+    'isbn': op_isbn, 'search': op_search, 'loans': op_loans, 'report': op_report, 'overdue': op_overdue,
+}
+WRITE_OPS = {'borrow': op_borrow, 'return': op_return}
+
+def _call(fn, params):
+    """เรียก op แล้วแปลงผลเป็นคำตอบ (ข้อผิดพลาดของคำขอ -> ok: false)"""
+    try:
+        return {'ok': True, 'result': fn(**params)}
+    except (RequestError, lendings.LendingError) as e:
+        return {'ok': False, 'error': str(e)}
+    except TypeError as e:  # ส่งพารามิเตอร์ไม่ครบ/เกิน
+        return {'ok': False, 'error': f"พารามิเตอร์ไม่ถูกต้อง: {e}"}
+
+def _run_batch(calls):
+    """ทำคำขอเขียนทั้งชุดใน group commit เดียว (fsync ครั้งเดียว) คืนคำตอบตามลำดับ"""
+    with wal.group_commit():
+        return [_call(fn, params) for fn, params in calls]
+
+def warm_up():
+    """เรียกครั้งเดียวตอนเริ่ม: กู้ WAL แล้วโหลดดัชนีทั้งหมดเข้าหน่วยความจำ"""
+    recovered = wal.recover()
+    if recovered:
+        print(f"กู้คืนธุรกรรมจาก WAL {recovered} รายการ")
+    segments.recover()  # archive ครั้งก่อนที่ตัด lendings.dat ไม่เสร็จ
+    record_index.load_index(books.BOOKS_FILE, records.record_size(books.BOOKS_FILE))
+    record_index.load_index(members.MEMBERS_FILE, records.record_size(members.MEMBERS_FILE))
+    record_index.load_index(lendings.LENDINGS_FILE, lendings.LENDING_RECORD_SIZE)
+    search_index.load_search_index()
+    return len(open_loans.load_open_loans()['open'])
+
+# ============================================
+# event loop: รับคำขอจาก client แล้วส่งต่อให้ storage thread / writer task
+# ============================================
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    loop = asyncio.get_running_loop()
+    storage = ThreadPoolExecutor(max_workers=1, thread_name_prefix='storage')
+    writes = asyncio.Queue()
+    stats = {'requests': 0, 'batches': 0, 'writes': 0}
+
+    start = time.perf_counter()
+    open_count = await loop.run_in_executor(storage, warm_up)
+    print(f"โหลดดัชนีเสร็จใน {time.perf_counter() - start:.2f} วินาที (ยืมอยู่ {open_count:,} รายการ)")
+
+    async def writer():
+        while True:
+            batch = [await writes.get()]
+            while len(batch) < MAX_BATCH and not writes.empty():
+                batch.append(writes.get_nowait())
+            try:
+                responses = await loop.run_in_executor(storage, _run_batch, [(fn, params) for fn, params, _ in batch])
+            except Exception as e:  # flush ไม่สำเร็จ: ไม่มีคำขอใดในชุดที่ถือว่าสำเร็จ
+                traceback.print_exc()
+                responses = [{'ok': False, 'error': f"บันทึกไม่สำเร็จ: {e}"}] * len(batch)
+            stats['batches'] += 1
+            stats['writes'] += len(batch)
+            for (_, _, future), response in zip(batch, responses):
+                if not future.cancelled():
+                    future.set_result(response)
+
+    async def handle_request(line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError
+        except ValueError:
+            return {'ok': False, 'error': "คำขอต้องเป็น JSON object"}
+        params = {key: value for key, value in request.items() if key not in ('id', 'op')}
+        op = request.get('op')
+        if op in WRITE_OPS:
+            future = loop.create_future()
+            writes.put_nowait((WRITE_OPS[op], params, future))
+            response = await future
+        elif op in READ_OPS:
+            response = await loop.run_in_executor(storage, _call, READ_OPS[op], params)
+        else:
+            response = {'ok': False, 'error': f"ไม่รู้จัก op: {op}"}
+        if 'id' in request:
+            response = dict(response, id=request['id'])
+        return response
+
+    async def handle_client(reader, writer_stream):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # คำขอยาวเกิน MAX_LINE
+                    writer_stream.write(b'{"ok": false, "error": "request too long"}\n')
+                    break
+                if not line:
+                    break
+                stats['requests'] += 1
+                try:
+                    response = await handle_request(line)
+                except Exception as e:
+                    traceback.print_exc()
+                    response = {'ok': False, 'error': f"server error: {e}"}
+                writer_stream.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                await writer_stream.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer_stream.close()
+
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, AttributeError):  # Windows: Ctrl+C จะเป็น KeyboardInterrupt แทน
+            pass
+    writer_task = asyncio.create_task(writer())
+    server = await asyncio.start_server(handle_client, host, port, limit=MAX_LINE)
+    print(f"✅ เปิดบริการที่ {host}:{port} (Ctrl+C เพื่อปิด)", flush=True)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        writer_task.cancel()
+        # บันทึก open loans ไว้ เริ่มครั้งหน้าจะได้ไม่ต้องอ่านต่อจากจุดเดิม
+        await loop.run_in_executor(storage, open_loans.save_open_loans)
+        storage.shutdown()
+        if stats['batches']:
+            print(f"คำขอทั้งหมด {stats['requests']:,} รายการ, เขียน {stats['writes']:,} รายการใน "
+                  f"{stats['batches']:,} ชุด (เฉลี่ย {stats['writes'] / stats['batches']:.1f} รายการ/fsync)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="เปิดบริการข้อมูลห้องสมุดผ่าน TCP (JSON บรรทัดละ 1 คำขอ)")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    print("ปิด server")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,316 @@
+import os, sys, json, mmap, time, struct, argparse, tempfile
+from array import array
+import locks, records, segments, wal
+from scan import iter_chunks, get_struct
+from books import BOOKS_FILE
+from members import MEMBERS_FILE
+from lendings import LENDINGS_FILE
+
+# ============================================
+# Snapshot แบบคอลัมน์ (columnar) สำหรับงานวิเคราะห์
+# ============================================
+# ใช้: python snapshot.py [--dir snapshot] [--tables books members lendings]  (--info แสดง snapshot ที่มีอยู่)
+# เขียนข้อมูล ณ เวลาหนึ่งของแต่ละตารางเป็นไฟล์ DIR/<ตาราง>.col (lendings รวม segment ที่ archive แล้ว)
+# - คอลัมน์ตัวเลขเก็บเป็น array (little-endian) ต่อกันทั้งคอลัมน์ จำนวนเต็มย่อเป็นชนิดที่เล็กที่สุดที่พอดีกับ
+#   ช่วงของค่า ส่วนคอลัมน์ที่เป็นลำดับ +1 ต่อกัน (เช่น lending_id) เก็บแค่ค่าแรก ('seq')
+#   ดึงออกจาก record ด้วย slice แบบมี step ของ bytes (ทำใน C) ไม่ต้อง unpack ทีละ record
+# - คอลัมน์ string เก็บแบบ dictionary: รหัสของแต่ละแถว (1/2/4 bytes ตามจำนวนค่าที่ไม่ซ้ำ ไม่เก็บถ้าไม่มีค่าซ้ำ)
+#   + offset ของแต่ละค่า + blob ของค่าที่ไม่ซ้ำต่อกันโดยไม่มี NUL ที่เติมให้เต็มช่องใน .dat
+#   (ไฟล์รูปแบบ 2 ของ strheap.py: อ่านข้อความจาก heap ตาม ref/รหัสในแถว snapshot ที่ได้เหมือนกันทุก byte)
+# - สถานะเก็บเป็นคอลัมน์ 'c' (b'A', b'D', b'R') แถวที่ถูกลบยังอยู่ใน snapshot เหมือนใน .dat
+# รูปแบบไฟล์: MAGIC, ข้อมูลของแต่ละคอลัมน์ (เริ่มที่ขอบ 8 bytes), JSON อธิบายคอลัมน์,
+# ความยาวของ JSON (8 bytes), MAGIC   ผู้อ่าน (SnapshotTable) map ไฟล์แล้วอ่านเฉพาะคอลัมน์ที่ขอ
+# คอลัมน์ตัวเลขคืนเป็น memoryview บนไฟล์โดยตรง (ไม่คัดลอก ส่ง np.asarray() ได้ทันทีถ้ามี NumPy) หรือ range
+SNAPSHOT_DIR = 'snapshot'
+SNAPSHOT_VERSION = 1
+MAGIC = b'PLMCOL1\n'
+FOOTER = struct.Struct('< Q 8s')  # ความยาวของ JSON, MAGIC
+INT_TYPES = 'bBhHi'  # ชนิดจำนวนเต็มที่คอลัมน์ตัวเลขถูกย่อลงได้ (เรียงจากเล็กไปใหญ่)
+COPY_RECORDS = 1 << 16  # จำนวนค่าต่อการคัดลอกจากไฟล์ชั่วคราว 1 ครั้ง
+
+# รูปแบบ record มาจาก records.layout() ของไฟล์ ณ ตอนอ่าน
+TABLES = {
+    'books': (BOOKS_FILE, ('status', 'book_id', 'isbn', 'title', 'author', 'qty')),
+    'members': (MEMBERS_FILE, ('status', 'member_id', 'name', 'phone')),
+    'lendings': (LENDINGS_FILE, ('status', 'lending_id', 'book_id', 'member_id', 'borrow_date', 'return_date')),
+}
+
+def snapshot_path(table, directory=SNAPSHOT_DIR):
+    return os.path.join(directory, f'{table}.col')
+
+def _fields(record_format, names, strings):
+    """
+    [(ชื่อคอลัมน์, ชนิด, ตำแหน่งใน record, ความกว้าง, token ใน format)]
+    ชนิด = 'str' (ฟิลด์ลำดับที่อยู่ใน strings) หรือ typecode ของ array/memoryview
+    """
+    fields, offset = [], 0
+    for i, (name, token) in enumerate(zip(names, record_format.split()[1:])):
+        width = struct.calcsize('<' + token)
+        fields.append((name, 'str' if i in strings else token, offset, width, token))
+        offset += width
+    return fields
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+def _field_bytes(data, record_size, offset, width):
+    """bytes ของฟิลด์เดียวจากทุก record ใน data ต่อกัน (คัดลอกทีละตำแหน่ง byte ของฟิลด์ด้วย slice มี step)"""
+    out = bytearray(len(data) // record_size * width)
+    for k in range(width):
+        out[k::width] = data[offset + k::record_size]
+    return out
+
+def _little_endian(a):
+    if sys.byteorder != 'little':
+        a.byteswap()
+    return a
+
+def _int_type(lo, hi):
+    """typecode ที่เล็กที่สุดที่เก็บทุกค่าในช่วง [lo, hi] ได้"""
+    for typecode in INT_TYPES:
+        bits = array(typecode).itemsize * 8
+        low, high = (-(1 << bits - 1), (1 << bits - 1) - 1) if typecode.islower() else (0, (1 << bits) - 1)
+        if low <= lo and hi <= high:
+            return typecode
+    raise ValueError(f"ค่า {lo}..{hi} เกินช่วงของคอลัมน์")
+
+class _Column:
+    """ค่าของคอลัมน์ตัวเลขที่สะสมระหว่างอ่าน: เก็บลงไฟล์ชั่วคราว + ค่าต่ำสุด/สูงสุด + ยังเป็นลำดับ +1 หรือไม่"""
+    def __init__(self, kind, directory):
+        self.kind = kind
+        self.array_type = 'B' if kind == 'c' else kind  # array ไม่มี typecode 'c'
+        self.spill = tempfile.TemporaryFile(dir=directory)
+        self.first = self.lo = self.hi = None
+        self.sequence = kind in INT_TYPES
+
+    def add(self, field_bytes):
+        values = array(self.array_type)
+        values.frombytes(field_bytes)
+        _little_endian(values)  # ในไฟล์ชั่วคราวเก็บตามลำดับ byte ของเครื่อง
+        if values and self.kind in INT_TYPES:
+            lo, hi = min(values), max(values)
+            if self.first is None:
+                self.first, self.lo, self.hi = values[0], lo, hi
+            else:
+                self.lo, self.hi = min(self.lo, lo), max(self.hi, hi)
+            start = self.first + self.spill.tell() // values.itemsize
+            self.sequence = (self.sequence and lo == start and hi == start + len(values) - 1
+                             and values == array(self.kind, range(start, start + len(values))))
+        self.spill.write(values)
+
+    def write(self, f, rows):
+        """เขียนคอลัมน์ลง f ที่ตำแหน่งปัจจุบัน (ขอบ 8 bytes) คืนคำอธิบายคอลัมน์ (ไม่รวมชื่อ)"""
+        if self.sequence and rows:
+            return {'type': 'seq', 'start': self.first}  # เช่น ID ที่เรียงต่อกันไม่มีช่องว่าง: ไม่ต้องเก็บเลย
+        typecode = _int_type(self.lo, self.hi) if self.kind in INT_TYPES and rows else self.kind
+        col = {'type': typecode, 'offset': _align(f.tell())}
+        f.seek(col['offset'])
+        self.spill.seek(0)
+        size = array(self.array_type).itemsize
+        while True:
+            block = self.spill.read(COPY_RECORDS * size)
+            if not block:
+                break
+            values = array(self.array_type)
+            values.frombytes(block)
+            f.write(_little_endian(values if typecode == self.kind else array(typecode, values)))
+        self.spill.close()
+        return col
+
+def _write_strings(f, values, codes, rows):
+    """เขียน dictionary ของคอลัมน์ string ที่ตำแหน่งปัจจุบันของ f คืนคำอธิบายคอลัมน์ (ไม่รวมชื่อ)"""
+    offsets_type = 'I' if sum(map(len, values)) < 1 << 32 else 'q'
+    offsets, total = array(offsets_type, [0]), 0
+    for value in values:
+        total += len(value)
+        offsets.append(total)
+    col = {'type': 'str', 'size': len(values), 'offsets_type': offsets_type, 'blob_bytes': total}
+    parts = [('offsets', _little_endian(offsets)), ('blob', b''.join(values))]
+    # ค่าไม่ซ้ำกันเลย (ISBN, ชื่อหนังสือ) รหัสของแถวที่ i คือ i เสมอ จึงไม่ต้องเก็บรหัส
+    if len(values) == rows:
+        col['codes_type'] = None
+    else:
+        col['codes_type'] = 'B' if len(values) <= 1 << 8 else 'H' if len(values) <= 1 << 16 else 'I'
+        parts.insert(0, ('codes', _little_endian(array(col['codes_type'], codes))))
+    for key, data in parts:
+        col[key] = _align(f.tell())
+        f.seek(col[key])
+        f.write(data)
+    return col
+
+def export_table(table, directory=SNAPSHOT_DIR):
+    """เขียน snapshot ของตาราง table ลง directory คืน (path, จำนวนแถว, ขนาดไฟล์ต้นทาง)"""
+    filename, names = TABLES[table]
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(table, directory)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    # scan lock ของไฟล์หลักกัน compaction และ segments.archive() ตลอดการอ่าน (record ใหม่ที่ต่อท้ายระหว่างนี้ไม่รวม)
+    # รวมถึงการแปลงรูปแบบไฟล์ (migrate.py) รูปแบบที่อ่านตอนนี้จึงใช้ได้ตลอด
+    with locks.scan_lock(filename):
+        rec, string_fields, heap = records.layout(filename)
+        fields = _fields(rec.format, names, string_fields)
+        size = rec.size
+        numbers = {name: _Column(kind, directory) for name, kind, _, _, _ in fields if kind != 'str'}
+        strings = {name: ({}, array('I')) for name, kind, _, _, _ in fields if kind == 'str'}
+        sources = [seg['file'] for seg in segments.load_manifest()] if filename == LENDINGS_FILE else []
+        sources.append(filename)
+        starts = [0] * (len(sources) - 1) + [records.data_start(filename)]
+        ends = [os.path.getsize(src) - os.path.getsize(src) % size if os.path.exists(src) else 0 for src in sources]
+        for src, start, end in zip(sources, starts, ends):
+            for _, data in iter_chunks(src, size, start, end):
+                for i, (name, kind, offset, width, token) in enumerate(fields):
+                    if kind != 'str':
+                        numbers[name].add(_field_bytes(data, size, offset, width))
+                        continue
+                    index, codes = strings[name]
+                    for value, in get_struct(f'< {offset}x {token} {size - offset - width}x').iter_unpack(data):
+                        value = value.rstrip(b'\x00') if heap is None else heap.data(i, value)
+                        code = index.get(value)
+                        if code is None:
+                            code = index[value] = len(index)
+                        codes.append(code)
+    rows = sum(end - start for start, end in zip(starts, ends)) // size
+    columns = []
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        for name in names:
+            if name in numbers:
+                col = numbers[name].write(f, rows)
+            else:
+                col = _write_strings(f, list(strings[name][0]), strings[name][1], rows)
+            columns.append(dict(col, name=name))
+        meta = {'version': SNAPSHOT_VERSION, 'table': table, 'rows': rows, 'created': time.time(),
+                'sources': sources, 'columns': columns}
+        footer = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        f.write(footer)
+        f.write(FOOTER.pack(len(footer), MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path, rows, sum(ends)
+
+def export(tables=tuple(TABLES), directory=SNAPSHOT_DIR):
+    """เขียน snapshot ของหลายตาราง คืน {ตาราง: (path, จำนวนแถว, ขนาดไฟล์ต้นทาง)}"""
+    return {table: export_table(table, directory) for table in tables}
+
+# ============================================
+# ผู้อ่าน snapshot (memory-map อ่านเฉพาะคอลัมน์ที่ขอ)
+# ============================================
+class SnapshotTable:
+    """
+    snapshot ของตารางเดียว: with SnapshotTable('snapshot/lendings.col') as t: t.column('borrow_date')
+    คอลัมน์ตัวเลขเป็น memoryview บนไฟล์ที่ map ไว้ (ใช้ได้แม้ปิดตารางแล้ว ไฟล์จะถูก unmap เมื่อไม่มีใครอ้างถึง)
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if len(mm) < len(MAGIC) + FOOTER.size or mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} ไม่ใช่ไฟล์ snapshot")
+        footer_size, magic = FOOTER.unpack_from(mm, len(mm) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} เขียนไม่ครบ")
+        self.meta = json.loads(mm[len(mm) - FOOTER.size - footer_size:len(mm) - FOOTER.size])
+        if self.meta['version'] != SNAPSHOT_VERSION:
+            raise ValueError(f"{path}: ไม่รองรับ snapshot รุ่น {self.meta['version']}")
+        self.table = self.meta['table']
+        self.rows = self.meta['rows']
+        self.columns = {col['name']: col for col in self.meta['columns']}
+        self._dictionaries = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        try:
+            self._mm.close()
+        except BufferError:
+            pass  # ยังมี memoryview ของคอลัมน์อยู่ ไฟล์จะถูก unmap เมื่อ view เหล่านั้นถูกทิ้ง
+
+    def _view(self, offset, typecode, count):
+        view = memoryview(self._mm)[offset:offset + count * struct.calcsize(typecode)].cast(typecode)
+        if sys.byteorder != 'little' and typecode != 'c':
+            return _little_endian(array(typecode, view))  # เครื่อง big-endian: ต้องคัดลอกแล้วสลับ byte
+        return view
+
+    def codes(self, name):
+        """รหัส dictionary ของแต่ละแถวของคอลัมน์ string (ใช้คู่กับ dictionary(name))"""
+        col = self.columns[name]
+        if col['codes_type'] is None:
+            return range(self.rows)
+        return self._view(col['codes'], col['codes_type'], self.rows)
+
+    def dictionary(self, name):
+        """ค่าที่ไม่ซ้ำของคอลัมน์ string ตามลำดับรหัส (decode ครั้งเดียวต่อคอลัมน์)"""
+        values = self._dictionaries.get(name)
+        if values is None:
+            col = self.columns[name]
+            offsets = self._view(col['offsets'], col['offsets_type'], col['size'] + 1)
+            blob = self._mm[col['blob']:col['blob'] + col['blob_bytes']]
+            values = self._dictionaries[name] = [blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+                                                 for i in range(col['size'])]
+        return values
+
+    def column(self, name):
+        """คอลัมน์ตัวเลข/สถานะ: memoryview ไม่คัดลอก (หรือ range), คอลัมน์ string: list ของ str"""
+        col = self.columns[name]
+        if col['type'] == 'seq':
+            return range(col['start'], col['start'] + self.rows)
+        if col['type'] != 'str':
+            return self._view(col['offset'], col['type'], self.rows)
+        values = self.dictionary(name)
+        return [values[code] for code in self.codes(name)]
+
+def load_columns(table, names=None, directory=SNAPSHOT_DIR):
+    """{ชื่อคอลัมน์: ค่า} ของคอลัมน์ที่ขอ (ทุกคอลัมน์ถ้าไม่ระบุ) จาก snapshot ของตาราง table"""
+    with SnapshotTable(snapshot_path(table, directory)) as t:
+        return {name: t.column(name) for name in (names or t.columns)}
+
+# ============================================
+# command line
+# ============================================
+def _size_text(n):
+    return f"{n / (1 << 20):,.1f} MB"
+
+def print_info(directory=SNAPSHOT_DIR):
+    for table in TABLES:
+        path = snapshot_path(table, directory)
+        if not os.path.exists(path):
+            continue
+        start = time.perf_counter()
+        with SnapshotTable(path) as t:
+            for name, col in t.columns.items():
+                if col['type'] == 'str':
+                    t.codes(name)
+                else:
+                    t.column(name)
+            elapsed = time.perf_counter() - start
+            created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t.meta['created']))
+            print(f"{table:<10}{t.rows:>12,} แถว {_size_text(os.path.getsize(path)):>12}  สร้างเมื่อ {created}"
+                  f"  map ทุกคอลัมน์ {elapsed * 1000:.2f} ms")
+            for name, col in t.columns.items():
+                kind = f"str (ค่าไม่ซ้ำ {col['size']:,})" if col['type'] == 'str' else col['type']
+                print(f"    {name:<14}{kind}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="เขียน snapshot แบบคอลัมน์ของ books / members / lendings")
+    parser.add_argument('--dir', default=SNAPSHOT_DIR)
+    parser.add_argument('--tables', nargs='+', choices=tuple(TABLES), default=tuple(TABLES))
+    parser.add_argument('--info', action='store_true', help="แสดง snapshot ที่มีอยู่โดยไม่เขียนใหม่")
+    args = parser.parse_args(argv)
+    if not args.info:
+        wal.recover()
+        segments.recover()
+        for table in args.tables:
+            start = time.perf_counter()
+            path, rows, source_bytes = export_table(table, args.dir)
+            print(f"✅ {path}: {rows:,} แถว {_size_text(os.path.getsize(path))} "
+                  f"(.dat {_size_text(source_bytes)}) {time.perf_counter() - start:.1f} วินาที")
+    print_info(args.dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
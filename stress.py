@@ -0,0 +1,155 @@
+import os, io, sys, time, random, tempfile, argparse, contextlib, multiprocessing
+from collections import Counter
+import bulk, lendings, open_loans, records, report, wal
+from scan import iter_records
+from books import BOOKS_FILE, STATUS_ACTIVE, STATUS_DELETED
+from members import MEMBERS_FILE
+from lendings import LENDINGS_FILE, LENDING_FORMAT, STATUS_BORROWED, MAX_LOANS_PER_MEMBER, LendingError
+
+# ============================================
+# Stress test: หลายโปรเซสยืม/คืน/เพิ่มสมาชิก/สร้างรายงานพร้อมกันบนข้อมูลชุดเดียวกัน
+# ============================================
+# ใช้: python stress.py [--procs 8] [--ops 300] [--dir DIR]
+# สร้างข้อมูลตั้งต้นในโฟลเดอร์ชั่วคราว (หนังสือมีไม่กี่เล่มต่อรายการ เพื่อให้แย่งเล่มสุดท้ายกันบ่อย)
+# แล้วตรวจหลังจบ:
+# - lending_id / book_id / member_id ไม่ซ้ำ
+# - ทุกรายการหนังสือ: qty >= 0 และ qty + จำนวนที่ยืมอยู่ = qty ตั้งต้น (ไม่มีการยืมเล่มที่ไม่มี)
+# - ไม่มีสมาชิกยืมเกิน MAX_LOANS_PER_MEMBER
+# - ดัชนี open loans และรายงานทุก engine ตรงกับข้อมูลจริง
+# - คำสั่ง search ใน main.py batch เห็นหนังสือที่เพิ่มก่อนหน้าใน batch เดียวกัน
+# จบด้วย exit code 1 ถ้าข้อใดไม่ผ่าน
+
+BOOKS = 30
+MEMBERS = 20
+
+def seed_data():
+    rows = "isbn,title,author,qty\n" + "".join(
+        f"S{i:04d},หนังสือทดสอบ {i},ผู้แต่ง {i % 7},{1 + i % 3}\n" for i in range(BOOKS))
+    bulk.import_stream('books', io.StringIO(rows), 'csv')
+    rows = "name,phone\n" + "".join(f"สมาชิก {i},08{i:08d}\n" for i in range(MEMBERS))
+    bulk.import_stream('members', io.StringIO(rows), 'csv')
+
+def worker(args):
+    """ทำงานสุ่มในโปรเซสแยก คืน Counter ของผลลัพธ์แต่ละแบบ"""
+    directory, seed, ops = args
+    os.chdir(directory)
+    rng = random.Random(seed)
+    stats = Counter()
+
+    def one_op():
+        r = rng.random()
+        if r < 0.5:
+            try:
+                lendings.borrow(rng.randint(1, BOOKS), rng.randint(1, MEMBERS))
+                stats['borrow'] += 1
+            except LendingError as e:
+                stats[f"borrow: {e}"] += 1
+        elif r < 0.9:
+            loans = lendings.member_loans(rng.randint(1, MEMBERS))
+            if not loans:
+                stats['return: ไม่มีรายการ'] += 1
+                return
+            try:
+                lendings.return_lending(rng.choice(loans)[0])
+                stats['return'] += 1
+            except LendingError as e:  # โปรเซสอื่นคืนไปก่อน
+                stats[f"return: {e}"] += 1
+        elif r < 0.95:
+            bulk.import_stream('members', io.StringIO(f"name,phone\nสมาชิกใหม่ {seed},0\n"), 'csv')
+            stats['add member'] += 1
+        else:
+            report.build_report(engine='incremental')
+            stats['report'] += 1
+
+    done = 0
+    while done < ops:
+        if rng.random() < 0.2:
+            # บางช่วงใช้ group commit (ถือล็อกไว้จนถึง flush)
+            with wal.group_commit():
+                for _ in range(min(10, ops - done)):
+                    one_op()
+                    done += 1
+        else:
+            one_op()
+            done += 1
+    return stats
+
+def check(initial_qty):
+    """ตรวจข้อมูลหลังจบ คืนรายการปัญหาที่พบ"""
+    problems = []
+    lending_ids = [r[1] for r in iter_records(LENDINGS_FILE, LENDING_FORMAT)]
+    # ทุก record ยกเว้น header ของรูปแบบ 2 (strheap.py)
+    book_ids = [r[1] for r in iter_records(BOOKS_FILE, records.row_format(BOOKS_FILE), (STATUS_ACTIVE, STATUS_DELETED))]
+    member_ids = [r[1] for r in iter_records(MEMBERS_FILE, records.row_format(MEMBERS_FILE), (STATUS_ACTIVE, STATUS_DELETED))]
+    for name, ids in (('lending_id', lending_ids), ('book_id', book_ids), ('member_id', member_ids)):
+        if len(ids) != len(set(ids)):
+            problems.append(f"{name} ซ้ำ {len(ids) - len(set(ids))} รายการ")
+    open_by_book, open_by_member = Counter(), Counter()
+    for status, lid, bid, mid, _, _ in iter_records(LENDINGS_FILE, LENDING_FORMAT, (STATUS_BORROWED,)):
+        open_by_book[bid] += 1
+        open_by_member[mid] += 1
+    for status, bid, isbn, title, author, qty in iter_records(BOOKS_FILE, records.row_format(BOOKS_FILE), (STATUS_ACTIVE,)):
+        if qty < 0 or qty + open_by_book[bid] != initial_qty[bid]:
+            problems.append(f"book {bid}: qty {qty} + ยืมอยู่ {open_by_book[bid]} != {initial_qty[bid]}")
+    over = {mid: n for mid, n in open_by_member.items() if n > MAX_LOANS_PER_MEMBER}
+    if over:
+        problems.append(f"สมาชิกยืมเกิน {MAX_LOANS_PER_MEMBER} เล่ม: {over}")
+    # ดัชนี open loans ที่บันทึกไว้ + อ่านต่อ และที่สร้างใหม่ ต้องตรงกับข้อมูลจริง
+    for label, state in (('saved', open_loans.load_open_loans()), ('rebuilt', open_loans.rebuild_open_loans())):
+        if Counter({mid: len(ids) for mid, ids in state['by_member'].items()}) != open_by_member:
+            problems.append(f"ดัชนี open loans ({label}) ไม่ตรงกับ lendings.dat")
+    if not report.check_report_engines():
+        problems.append("รายงานแต่ละ engine ไม่ตรงกัน")
+    if not check_batch_search():
+        problems.append("search ใน batch ไม่เห็นหนังสือที่เพิ่มใน batch เดียวกัน")
+    return problems
+
+def check_batch_search():
+    """เพิ่มหนังสือแล้วค้นหาใน batch เดียวกัน (ยังไม่ flush ตอนเพิ่ม) ต้องพบหนังสือเล่มนั้น"""
+    from main import run_batch
+    title = f"Batchbook{os.getpid()}"
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        code = run_batch(io.StringIO(f"add-book --title {title} --qty 1\nsearch {title}\n"), verbose=True)
+    return code == 0 and f"Title:{title}," in out.getvalue()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="stress test หลายโปรเซสพร้อมกัน")
+    parser.add_argument('--procs', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=300, help="จำนวนคำสั่งต่อโปรเซส")
+    parser.add_argument('--dir', help="โฟลเดอร์ข้อมูล (ค่าเริ่มต้น: สร้างโฟลเดอร์ชั่วคราวใหม่)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    directory = os.path.abspath(args.dir or tempfile.mkdtemp(prefix='pylibman-stress-'))
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    if not os.path.exists(BOOKS_FILE):
+        seed_data()
+    initial_qty = Counter()
+    for status, bid, isbn, title, author, qty in iter_records(BOOKS_FILE, records.row_format(BOOKS_FILE), (STATUS_ACTIVE,)):
+        initial_qty[bid] = qty
+    for status, lid, bid, mid, _, _ in iter_records(LENDINGS_FILE, LENDING_FORMAT, (STATUS_BORROWED,)):
+        initial_qty[bid] += 1
+    print(f"ข้อมูลอยู่ที่ {directory}: {args.procs} โปรเซส x {args.ops} คำสั่ง")
+
+    start = time.perf_counter()
+    ctx = multiprocessing.get_context('spawn')  # โปรเซสใหม่ทั้งหมด ไม่สืบทอดสถานะล็อก/ไฟล์ที่เปิดค้าง
+    with ctx.Pool(args.procs) as pool:
+        results = pool.map(worker, [(directory, args.seed * 1000 + i, args.ops) for i in range(args.procs)])
+    seconds = time.perf_counter() - start
+    total = sum(results, Counter())
+    ops = args.procs * args.ops
+    print(f"ทำงาน {ops:,} คำสั่งใน {seconds:.2f} วินาที ({ops / seconds:,.0f} คำสั่ง/วินาที)")
+    for name, count in sorted(total.items()):
+        print(f"   {name}: {count:,}")
+
+    problems = check(initial_qty)
+    if problems:
+        for problem in problems:
+            print(f"❌ {problem}")
+        return 1
+    print("✅ ผ่านทุกข้อ")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+import os, sys, mmap, bisect, struct
+from array import array
+import metrics, wal
+
+# ============================================
+# รูปแบบ record 2: แถวขนาดคงที่เล็ก ๆ + string heap + dictionary
+# ============================================
+# รูปแบบ 1 (เดิม) จองช่อง string ตายตัวในทุกแถว (books 128+64+16 bytes) ข้อความที่สั้นเสียที่ว่าง
+# ข้อความที่ยาวเกินถูกตัด และชื่อผู้แต่งซ้ำกันก็เก็บซ้ำเต็ม ๆ ทุกแถว
+# รูปแบบ 2 เก็บฟิลด์ string ของแถวเป็น:
+# - ref 8 bytes (Q) = offset ใน heap << 16 | ความยาว  ชี้ไปยัง bytes UTF-8 ใน <ชื่อไฟล์>.<generation>.heap
+#   (ไม่มี NUL เติม ไม่มีตัวคั่น ยาวได้ถึง MAX_STRING bytes, ref 0 = ข้อความว่าง)
+# - หรือรหัส dictionary 4 bytes (I) สำหรับฟิลด์ที่ค่าซ้ำกันมาก (ผู้แต่ง): รหัส -> ref ใน <ชื่อไฟล์>.<generation>.dict
+#   ค่าเดียวกันได้รหัสเดียวกัน ข้อความจึงอยู่ใน heap ครั้งเดียว
+# ฟิลด์อื่นและตำแหน่งของฟิลด์ใน tuple เหมือนรูปแบบ 1 ทุกอย่าง (byte แรก = สถานะ, byte 1-5 = ID)
+# ดัชนี ID, WAL, ล็อก และ compaction จึงทำงานกับทั้งสองรูปแบบได้โดยไม่ต้องรู้ว่าเป็นรูปแบบไหน
+#
+# record แรกของไฟล์รูปแบบ 2 เป็น header (สถานะ 'H', ID 0, MAGIC, generation) ไฟล์รูปแบบ 1 ขึ้นต้นด้วย
+# 'A' หรือ 'D' เสมอ ผู้อ่าน (records.layout) จึงรู้รูปแบบจาก record แรกของไฟล์เอง การแปลงรูปแบบ (migrate.py)
+# เขียน heap/dictionary ของ generation ใหม่ก่อน แล้วค่อยแทนที่ไฟล์ข้อมูลด้วย os.replace ครั้งเดียว
+# (ล่มกลางทางก็ยังเป็นไฟล์เดิมที่อ่านได้ครบ)
+# heap และ dictionary มีแต่การต่อท้ายผ่าน WAL (ใน ops ของธุรกรรมเดียวกับแถวที่อ้างถึง) ไม่มีการเขียนทับ
+# ข้อความเดิมจึงอ่านผ่าน mmap ได้ตลอด การแก้ไขแถวทิ้งข้อความเก่าไว้ใน heap จนกว่าจะแปลงไฟล์ใหม่ (migrate.py)
+#
+# ข้อแลกเปลี่ยน: รูปแบบ 2 ไฟล์เล็กกว่าและอ่านเฉพาะฟิลด์ตัวเลขได้เร็วกว่า (แถวเล็กลง) แต่การอ่านทั้งไฟล์พร้อม decode
+# string ไม่เร็วขึ้น ทุก ref ต้องตัด bytes จาก heap แล้ว decode ทีละฟิลด์ ขณะที่รูปแบบ 1 ได้ bytes จาก struct ตรง ๆ
+# (decode_rows ช่วยลดงานต่อแถวได้บางส่วน แต่ books 100k แถวยังช้ากว่ารูปแบบ 1 ราว 10%)
+# รูปแบบ 2 จึงเป็นตัวเลือกที่ต้องสั่งเองด้วย migrate.py ไฟล์ใหม่และไฟล์เดิมยังเป็นรูปแบบ 1
+HEADER = struct.Struct('< c i 4s I')  # สถานะ, ID (0), MAGIC, generation
+HEADER_STATUS = b'H'
+MAGIC = b'STR2'
+MAX_STRING = 0xFFFF
+REF_SIZE = 8  # ขนาดของ 1 รายการใน dictionary (ref แบบ Q)
+
+_heaps = {}  # (filename, generation) -> StringHeap
+
+def heap_path(filename, generation):
+    """books.dat, 3 -> books.3.heap"""
+    return f'{os.path.splitext(filename)[0]}.{generation}.heap'
+
+def dictionary_path(filename, generation):
+    """books.dat, 3 -> books.3.dict"""
+    return f'{os.path.splitext(filename)[0]}.{generation}.dict'
+
+def is_heap_file(name):
+    """ไฟล์ heap/dictionary ของรูปแบบ 2 (เช่น books.3.heap, members.1.dict)"""
+    parts = name.split('.')
+    return len(parts) == 3 and parts[1].isdigit() and parts[2] in ('heap', 'dict')
+
+def pack_header(generation, record_size):
+    return HEADER.pack(HEADER_STATUS, 0, MAGIC, generation).ljust(record_size, b'\x00')
+
+def read_generation(filename):
+    """generation ของ heap ถ้าไฟล์เป็นรูปแบบ 2 หรือ None ถ้าเป็นรูปแบบ 1 (หรือยังไม่มีไฟล์)"""
+    try:
+        with open(filename, 'rb') as f:
+            data = f.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    status, _, magic, generation = HEADER.unpack(data)
+    return generation if status == HEADER_STATUS and magic == MAGIC else None
+
+def get_heap(filename, generation, dictionary=()):
+    heap = _heaps.get((filename, generation))
+    if heap is None:
+        heap = _heaps[(filename, generation)] = StringHeap(filename, generation, dictionary)
+    return heap
+
+def forget(filename):
+    """ทิ้ง StringHeap ที่เปิดไว้ของไฟล์นี้ (หลังแปลงรูปแบบ/ลบ generation เก่า)"""
+    for key in [key for key in _heaps if key[0] == filename]:
+        _heaps.pop(key).close()
+
+def _end(ops, filename):
+    """ขนาดไฟล์รวมข้อมูลที่รอใน WAL และที่ต่อท้ายไว้แล้วใน ops ของธุรกรรมที่กำลังสร้าง"""
+    end = wal.file_size(filename)
+    for name, offset, data in ops:
+        if name == filename:
+            end = max(end, offset + len(data))
+    return end
+
+def _pending_bytes(filename, offset, length):
+    """ข้อมูลช่วง [offset, offset+length) ที่ยังรอ flush อยู่ใน WAL (op เดียวอาจมีหลายข้อความต่อกัน)"""
+    pending = wal.pending_records(filename)
+    i = bisect.bisect_right([start for start, _ in pending], offset) - 1
+    if i >= 0:
+        start, data = pending[i]
+        if offset + length <= start + len(data):
+            return data[offset - start:offset - start + length]
+    raise ValueError(f"{filename}: ไม่พบข้อมูลที่ตำแหน่ง {offset}")
+
+class StringHeap:
+    """heap + dictionary ของไฟล์ข้อมูลหนึ่งไฟล์ (generation หนึ่ง) อ่านผ่าน mmap เขียนโดยเพิ่ม op ลงธุรกรรม WAL"""
+    def __init__(self, filename, generation, dictionary=()):
+        self.heap_file = heap_path(filename, generation)
+        self.dictionary_file = dictionary_path(filename, generation)
+        self.dictionary = frozenset(dictionary)  # ตำแหน่งฟิลด์ที่เก็บเป็นรหัส dictionary
+        self._mm = None
+        self._refs = array('Q')  # รหัส -> ref ส่วนที่อ่านจากไฟล์ dictionary แล้ว
+        self._values = {}  # รหัส -> ข้อความ (decode ครั้งเดียวต่อรหัส)
+        self._codes = None  # ข้อความ -> รหัส (สร้างเมื่อเขียนครั้งแรก)
+        self._count = 0  # จำนวนรหัสที่อยู่ใน _codes แล้ว
+        self._unconfirmed = {}  # รหัสที่แจกไปในธุรกรรมล่าสุด (ตรวจกับไฟล์ก่อนใช้ _codes ครั้งถัดไป)
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def _remap(self):
+        """map heap ใหม่ทั้งไฟล์ (เรียกเมื่อต้องอ่านเกินส่วนที่ map ไว้ เพราะ heap ยาวขึ้นเรื่อย ๆ)"""
+        if not os.path.exists(self.heap_file) or os.path.getsize(self.heap_file) == 0:
+            return
+        self.close()
+        with open(self.heap_file, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if metrics.enabled:
+            metrics.count_io(self.heap_file, opens=1)
+
+    def _bytes(self, ref):
+        offset, length = ref >> 16, ref & MAX_STRING
+        if not length:
+            return b''
+        end = offset + length
+        if self._mm is None or end > len(self._mm):
+            self._remap()
+            if self._mm is None or end > len(self._mm):
+                return _pending_bytes(self.heap_file, offset, length)  # ธุรกรรมที่ยังรอ flush
+        if metrics.enabled:
+            metrics.count_io(self.heap_file, read=length)
+        return self._mm[offset:end]
+
+    def value(self, code):
+        """ข้อความของรหัส dictionary (decode ครั้งเดียวต่อรหัส)"""
+        text = self._values.get(code)
+        if text is None:
+            text = self._values[code] = self._bytes(self._ref(code)).decode('utf-8')
+        return text
+
+    def data(self, field, value):
+        """bytes UTF-8 ของค่าในฟิลด์ string ของแถว (ref หรือรหัส dictionary)"""
+        return self._bytes(self._ref(value) if field in self.dictionary else value)
+
+    def text(self, field, value):
+        """ข้อความของค่าในฟิลด์ string ของแถว"""
+        return self.value(value) if field in self.dictionary else self._bytes(value).decode('utf-8')
+
+    def decode_fields(self, fields, positions):
+        """แทนค่า ref/รหัสใน fields (list) ตำแหน่ง positions ด้วยข้อความ (ทางลัดสำหรับการอ่านทั้งไฟล์)"""
+        mm, values = self._mm, self._values
+        limit = len(mm) if mm is not None and not metrics.enabled else -1
+        for i in positions:
+            value = fields[i]
+            if i in self.dictionary:
+                text = values.get(value)
+                if text is not None:
+                    fields[i] = text
+                    continue
+            else:
+                offset = value >> 16
+                end = offset + (value & MAX_STRING)
+                if end <= limit:
+                    fields[i] = str(mm[offset:end], 'utf-8')
+                    continue
+            fields[i] = self.text(i, value)
+            mm = self._mm  # การอ่านแบบปกติอาจ map heap ใหม่ (map เดิมถูกปิดแล้ว)
+            limit = len(mm) if mm is not None and not metrics.enabled else -1
+
+    def decode_rows(self, rows, positions):
+        """
+        วนคืน tuple ที่ decode แล้วของทุกแถวใน rows (tuple ที่ unpack แล้ว ทั้งก้อน) ทางลัดของ records.iter_decoded:
+        แยกตำแหน่งรหัส dictionary กับ ref ครั้งเดียวต่อก้อน แล้วตัดข้อความจาก map ของ heap ตรง ๆ
+        แถวที่ต้องอ่านแบบปกติ (รหัสที่ยังไม่เคย decode, ref เกินส่วนที่ map ไว้, เก็บ metrics) ใช้ decode_fields
+        """
+        codes = [i for i in positions if i in self.dictionary]
+        refs = [i for i in positions if i not in self.dictionary]
+        mm, values = self._mm, self._values
+        limit = len(mm) if mm is not None and not metrics.enabled else -1
+        for row in rows:
+            fields = list(row)
+            for i in codes:
+                text = values.get(fields[i])
+                if text is None:
+                    break
+                fields[i] = text
+            else:
+                for i in refs:
+                    value = fields[i]
+                    offset = value >> 16
+                    end = offset + (value & MAX_STRING)
+                    if end > limit:
+                        break
+                    fields[i] = str(mm[offset:end], 'utf-8')
+                else:
+                    yield tuple(fields)
+                    continue
+            fields = list(row)
+            self.decode_fields(fields, positions)
+            mm = self._mm  # การอ่านแบบปกติอาจ map heap ใหม่
+            limit = len(mm) if mm is not None and not metrics.enabled else -1
+            yield tuple(fields)
+
+    def _ref(self, code):
+        if code >= len(self._refs):
+            self._load_refs()
+            if code >= len(self._refs):
+                return struct.unpack('<Q', _pending_bytes(self.dictionary_file, code * REF_SIZE, REF_SIZE))[0]
+        return self._refs[code]
+
+    def _load_refs(self):
+        """อ่านรหัสที่เพิ่มต่อท้ายไฟล์ dictionary ตั้งแต่ครั้งก่อน"""
+        if not os.path.exists(self.dictionary_file):
+            return
+        with open(self.dictionary_file, 'rb') as f:
+            f.seek(len(self._refs) * REF_SIZE)
+            data = f.read()
+        if metrics.enabled:
+            metrics.count_io(self.dictionary_file, read=len(data), opens=1)
+        refs = array('Q')
+        refs.frombytes(data[:len(data) - len(data) % REF_SIZE])
+        if sys.byteorder != 'little':
+            refs.byteswap()
+        self._refs.extend(refs)
+
+    def _sync_codes(self, count):
+        """dict ข้อความ -> รหัส ที่ครอบคลุมรหัส 0..count-1 (รหัสที่ธุรกรรมอื่นเพิ่มเข้ามาจะถูกอ่านเพิ่ม)"""
+        # ครั้งแรก หรือรหัสที่แจกไปล่าสุดไม่ได้ถูกบันทึก (ธุรกรรมล้มเหลว แล้วรหัสเดียวกันอาจเป็นของค่าอื่นแล้ว)
+        if (self._codes is None or self._count > count
+                or any(self.value(code) != text for text, code in self._unconfirmed.items())):
+            self._codes, self._count = {}, 0
+        self._unconfirmed = {}
+        for code in range(self._count, count):
+            self._codes.setdefault(self.value(code), code)
+        self._count = count
+        return self._codes
+
+    def writer(self, ops):
+        return _Writer(self, ops)
+
+class _Writer:
+    """
+    สะสมข้อความใหม่ของหลายแถวในธุรกรรมเดียว แล้วเพิ่มเป็น op ต่อท้าย heap/dictionary อย่างละ 1 op ตอน finish()
+    ต้องใช้ภายใต้ commit lock (ตำแหน่งต่อท้ายคำนวณจากขนาดไฟล์ เหมือนการต่อท้ายไฟล์ข้อมูล)
+    """
+    def __init__(self, heap, ops):
+        self.heap, self.ops = heap, ops
+        self.offset = _end(ops, heap.heap_file)
+        self.first_code = _end(ops, heap.dictionary_file) // REF_SIZE
+        self.strings, self.size = [], 0
+        self.refs = array('Q')
+        self.codes = heap._sync_codes(self.first_code) if heap.dictionary else {}
+        self.new_codes = {}
+
+    def _add(self, value):
+        data = value.encode('utf-8')
+        if not data:
+            return 0
+        if len(data) > MAX_STRING:
+            raise ValueError(f"ข้อความยาว {len(data)} bytes เกิน {MAX_STRING} bytes")
+        ref = (self.offset + self.size) << 16 | len(data)
+        self.strings.append(data)
+        self.size += len(data)
+        return ref
+
+    def store(self, field, value):
+        """ค่าที่เก็บลงแถวสำหรับข้อความ value ในฟิลด์ field (ref หรือรหัส dictionary)"""
+        if field not in self.heap.dictionary:
+            return self._add(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = self.new_codes.get(value)
+            if code is None:
+                code = self.new_codes[value] = self.first_code + len(self.refs)
+                self.refs.append(self._add(value))
+        return code
+
+    def finish(self):
+        if self.strings:
+            self.ops.append((self.heap.heap_file, self.offset, b''.join(self.strings)))
+        if self.refs:
+            refs = array('Q', self.refs)
+            if sys.byteorder != 'little':
+                refs.byteswap()
+            self.ops.append((self.heap.dictionary_file, self.first_code * REF_SIZE, refs.tobytes()))
+            self.codes.update(self.new_codes)
+            self.heap._count = self.first_code + len(self.refs)
+            self.heap._unconfirmed = self.new_codes
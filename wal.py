@@ -0,0 +1,234 @@
+import struct, os, zlib
+from contextlib import contextmanager
+import locks, metrics
+
+# ============================================
+# Write-Ahead Log (WAL) หน้าไฟล์ข้อมูล .dat ทั้งหมด
+# ============================================
+# ทุกการเขียนไฟล์ข้อมูล (เพิ่ม/แก้/ลบ/ยืม/คืน) ทำผ่าน commit() เป็น 1 entry ต่อ 1 ธุรกรรม
+# เช่น การยืม = ต่อท้าย lendings.dat + ลด qty ใน books.dat อยู่ใน entry เดียวกัน
+# ลำดับ: เขียน entry ลง WAL -> fsync -> เขียนลงไฟล์ข้อมูลจริง
+# ถ้าโปรแกรมล่มระหว่างเขียนไฟล์ข้อมูล recover() จะเขียนซ้ำจาก WAL (เขียนทับตำแหน่งเดิม ทำซ้ำได้ไม่เสียหาย)
+# entry ที่เขียนลง WAL ไม่ครบ (crc ไม่ตรง) ถือว่าธุรกรรมนั้นไม่เกิดขึ้น
+#
+# โหมด group commit: ภายใน with group_commit(): ธุรกรรมจะรอใน _pending แล้วเขียน WAL + fsync ครั้งเดียว
+# ทุก GROUP_COMMIT_MAX_ENTRIES ธุรกรรม (หรือเมื่อออกจาก block) การอ่าน record ผ่าน read_at()
+# จะเห็นข้อมูลที่ยังรออยู่ด้วย ธุรกรรมในกลุ่มถือว่าสำเร็จถาวรเมื่อ flush() เสร็จแล้วเท่านั้น
+#
+# หลายโปรแกรมใช้ WAL เดียวกันได้: การเขียน WAL + ไฟล์ข้อมูล + checkpoint ทำภายใต้ locks.commit_lock()
+# ในโหมด group commit ล็อกทั้งหมดที่ใช้ระหว่างนั้น (รวม commit lock) จะถือไว้จนถึง flush()
+
+WAL_FILE = 'library.wal'
+WAL_ENTRY_HEADER = '< I I'  # ความยาว payload, crc32 ของ payload
+WAL_ENTRY_HEADER_SIZE = struct.calcsize(WAL_ENTRY_HEADER)
+WAL_OP_HEADER = '< H q I'  # ความยาวชื่อไฟล์, offset, ความยาวข้อมูล
+WAL_OP_HEADER_SIZE = struct.calcsize(WAL_OP_HEADER)
+WAL_CHECKPOINT_BYTES = 1 << 20  # WAL ใหญ่เกินนี้ -> fsync ไฟล์ข้อมูลแล้วล้าง WAL
+GROUP_COMMIT_MAX_ENTRIES = 256
+
+_group_depth = 0
+_pending = []  # [(ops, after)] ธุรกรรมที่รอ flush ในโหมด group commit
+_handles = {}  # filename -> ไฟล์ที่เปิดค้างไว้ (ไฟล์ข้อมูลแบบ r+b, ไฟล์ WAL แบบต่อท้าย)
+_dirty = set()  # ไฟล์ข้อมูลที่เขียนแล้วแต่ยังไม่ fsync (จะ fsync ตอน checkpoint)
+_overlay = {}  # filename -> {offset: data} ของธุรกรรมที่รอ flush
+_overlay_ids = {}  # filename -> {record_id: offset} ของธุรกรรมที่รอ flush
+write_hook = None  # records ตั้งเป็นฟังก์ชันล้าง cache: write_hook(filename, offset, data) ทุกการเขียน
+
+def _encode(ops):
+    parts = []
+    for filename, offset, data in ops:
+        name = filename.encode('utf-8')
+        parts.append(struct.pack(WAL_OP_HEADER, len(name), offset, len(data)))
+        parts.append(name)
+        parts.append(data)
+    payload = b''.join(parts)
+    return struct.pack(WAL_ENTRY_HEADER, len(payload), zlib.crc32(payload)) + payload
+
+def _decode(data):
+    """แยก entry ที่สมบูรณ์ออกจากเนื้อ WAL (หยุดที่ entry แรกที่ไม่ครบหรือ crc ไม่ตรง)"""
+    entries = []
+    pos = 0
+    while pos + WAL_ENTRY_HEADER_SIZE <= len(data):
+        length, crc = struct.unpack_from(WAL_ENTRY_HEADER, data, pos)
+        payload = data[pos + WAL_ENTRY_HEADER_SIZE:pos + WAL_ENTRY_HEADER_SIZE + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        ops = []
+        p = 0
+        while p < length:
+            name_len, offset, data_len = struct.unpack_from(WAL_OP_HEADER, payload, p)
+            p += WAL_OP_HEADER_SIZE
+            filename = payload[p:p + name_len].decode('utf-8')
+            p += name_len
+            ops.append((filename, offset, payload[p:p + data_len]))
+            p += data_len
+        entries.append(ops)
+        pos += WAL_ENTRY_HEADER_SIZE + length
+    return entries
+
+def _handle(filename, flags=os.O_RDWR):
+    """เปิดไฟล์ค้างไว้ใช้ซ้ำ (เปิดใหม่ถ้าไฟล์ถูกแทนที่ เช่นหลัง compaction)"""
+    f = _handles.get(filename)
+    if f is not None:
+        try:
+            if os.stat(filename).st_ino == os.fstat(f.fileno()).st_ino:
+                return f
+        except FileNotFoundError:
+            pass
+        f.close()
+    fd = os.open(filename, flags | os.O_CREAT, 0o644)
+    if metrics.enabled:
+        metrics.count_io(filename, opens=1)
+    f = _handles[filename] = os.fdopen(fd, 'r+b' if flags == os.O_RDWR else 'ab')
+    return f
+
+def _apply(ops):
+    for filename, offset, data in ops:
+        f = _handle(filename)
+        f.seek(offset)
+        f.write(data)
+        f.flush()
+        _dirty.add(filename)
+        if metrics.enabled:
+            metrics.count_io(filename, written=len(data))
+
+def _write_wal(blob):
+    f = _handle(WAL_FILE, os.O_WRONLY | os.O_APPEND)
+    f.write(blob)
+    f.flush()
+    os.fsync(f.fileno())
+    if metrics.enabled:
+        metrics.count_io(WAL_FILE, written=len(blob))
+    return f.tell()
+
+def commit(ops, after=()):
+    """
+    บันทึกธุรกรรม ops = [(filename, offset, data), ...] แบบ atomic
+    after: ฟังก์ชันที่เรียกหลังเขียนไฟล์ข้อมูลแล้ว (เช่นอัปเดตดัชนี)
+    """
+    with locks.commit_lock():
+        if write_hook:
+            for filename, offset, data in ops:
+                write_hook(filename, offset, data)
+        if _group_depth:
+            _pending.append((ops, after))
+            for filename, offset, data in ops:
+                _overlay.setdefault(filename, {})[offset] = data
+                if len(data) >= 5:
+                    _overlay_ids.setdefault(filename, {})[struct.unpack_from('<i', data, 1)[0]] = offset
+            if len(_pending) >= GROUP_COMMIT_MAX_ENTRIES:
+                flush()
+            return
+        wal_size = _write_wal(_encode(ops))
+        _apply(ops)
+        for fn in after:
+            fn()
+        if wal_size >= WAL_CHECKPOINT_BYTES:
+            checkpoint()
+
+def flush():
+    """เขียนธุรกรรมที่รออยู่ทั้งหมดลง WAL ด้วย fsync ครั้งเดียว แล้วเขียนลงไฟล์ข้อมูล"""
+    if _pending:
+        with locks.commit_lock():
+            batch = list(_pending)
+            wal_size = _write_wal(b''.join(_encode(ops) for ops, _ in batch))
+            del _pending[:]
+            _overlay.clear()
+            _overlay_ids.clear()
+            for ops, after in batch:
+                _apply(ops)
+                for fn in after:  # เรียกทันทีหลังธุรกรรมของตัวเอง ดัชนีจะได้ตามขนาดไฟล์ทีละขั้น
+                    fn()
+            if wal_size >= WAL_CHECKPOINT_BYTES:
+                checkpoint()
+    locks.release_deferred()  # ข้อมูลอยู่ในไฟล์แล้ว โปรเซสอื่นอ่าน/แก้ต่อได้
+
+@contextmanager
+def group_commit():
+    """รวม fsync ของหลายธุรกรรมเข้าด้วยกัน (ธุรกรรมจะถาวรเมื่อ flush หรือออกจาก block)"""
+    global _group_depth
+    with locks.deferred_release():
+        _group_depth += 1
+        try:
+            yield
+        finally:
+            _group_depth -= 1
+            if _group_depth == 0:
+                flush()
+
+def checkpoint():
+    """fsync ไฟล์ข้อมูลทั้งหมดที่เขียนไปแล้ว จากนั้นล้าง WAL"""
+    with locks.commit_lock():
+        # WAL อาจมีธุรกรรมของโปรเซสอื่นด้วย จึง fsync ทุกไฟล์ที่ปรากฏใน WAL ไม่ใช่เฉพาะที่โปรเซสนี้เขียน
+        filenames = set(_dirty)
+        if os.path.exists(WAL_FILE):
+            with open(WAL_FILE, 'rb') as f:
+                filenames.update(filename for ops in _decode(f.read()) for filename, _, _ in ops)
+        for filename in filenames:
+            if os.path.exists(filename):
+                os.fsync(_handle(filename).fileno())
+        _dirty.clear()
+        if os.path.exists(WAL_FILE):
+            with open(WAL_FILE, 'r+b') as f:
+                f.truncate(0)
+                os.fsync(f.fileno())
+
+def recover():
+    """เรียกตอนเริ่มโปรแกรม: เขียนซ้ำทุกธุรกรรมที่สมบูรณ์ใน WAL แล้วล้าง WAL (คืนจำนวนธุรกรรม)"""
+    with locks.commit_lock():
+        if not os.path.exists(WAL_FILE) or os.path.getsize(WAL_FILE) == 0:
+            return 0
+        with open(WAL_FILE, 'rb') as f:
+            entries = _decode(f.read())
+        for ops in entries:
+            _apply(ops)
+        checkpoint()
+        return len(entries)
+
+# ============================================
+# การอ่านที่มองเห็นธุรกรรมที่ยังรอ flush
+# ============================================
+# ทุกการเขียนในระบบเป็นการเขียนทั้ง record ที่ตำแหน่งขอบ record จึงเก็บข้อมูลที่รออยู่เป็น
+# {filename: {offset: data}} และจับคู่ด้วย offset ตรงตัว (อ่านทั้ง record ที่ตำแหน่งเดียวกัน)
+def file_size(filename):
+    """ขนาดไฟล์รวม record ที่รอต่อท้ายอยู่"""
+    size = os.path.getsize(filename) if os.path.exists(filename) else 0
+    for offset, data in _overlay.get(filename, {}).items():
+        size = max(size, offset + len(data))
+    return size
+
+def patch(filename, offset, data, size):
+    """ถ้ามี record ที่ยังรอ flush อยู่ที่ offset นี้ ให้ใช้ข้อมูลนั้นแทนข้อมูลจากไฟล์"""
+    pending = _overlay.get(filename)
+    if pending:
+        op_data = pending.get(offset)
+        if op_data is not None and len(op_data) == size:
+            return op_data
+    return data
+
+def read_at(f, filename, offset, size):
+    """seek + read จากไฟล์ที่เปิดไว้ (f เป็น None = เปิดเอง) แล้วรวมข้อมูลที่ยังรอ flush"""
+    if f is None:
+        data = b''
+        if os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                f.seek(offset)
+                data = f.read(size)
+            if metrics.enabled:
+                metrics.count_io(filename, opens=1)
+    else:
+        f.seek(offset)
+        data = f.read(size)
+    if metrics.enabled:
+        metrics.count_io(filename, scanned=len(data) // size, read=len(data))
+    return patch(filename, offset, data, size)
+
+def find_pending(filename, record_id):
+    """ตำแหน่งของ record ที่ยังรอ flush (ดูจาก ID ใน byte 1-5 ของ record) หรือ None"""
+    return _overlay_ids.get(filename, {}).get(record_id)
+
+def pending_records(filename):
+    """[(offset, data)] ของข้อมูลที่ยังรอ flush สำหรับไฟล์นี้ เรียงตาม offset"""
+    return sorted(_overlay.get(filename, {}).items())
+
+locks.contention_hook = flush